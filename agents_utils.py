@@ -1,141 +1,316 @@
-import re
-from crewai import Agent, Task, LLM, Crew, Process
 import os
+import functools
+import hashlib
+import inspect
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
-# Configuración del LLM (reemplaza "TU_KEY" por tu clave válida si la tienes)
-llm = LLM(
-    model="groq/gemma2-9b-it",
-    temperature=0.5,
-    base_url="https://api.groq.com/openai/v1",
-    api_key=os.getenv("GROQ_API_KEY") 
-)
+from cachetools import LRUCache
+
+from data_utils import empresas_ibex35
+from lazy_utils import ModuloPerezoso, ObjetoPerezoso
+from store_utils import DATA_DIR, obtener_store
+
+# CrewAI y LiteLLM tardan segundos en importarse: se cargan al ejecutar la primera tarea
+litellm = ModuloPerezoso("litellm")
+Agent = ObjetoPerezoso("crewai", "Agent")
+Task = ObjetoPerezoso("crewai", "Task")
+LLM = ObjetoPerezoso("crewai", "LLM")
+Crew = ObjetoPerezoso("crewai", "Crew")
+Process = ObjetoPerezoso("crewai", "Process")
+
+# Configuración del LLM (la clave se toma de GROQ_API_KEY)
+LLM_CONFIG = {
+    "model": "groq/gemma2-9b-it",
+    "temperature": 0.5,
+    "base_url": "https://api.groq.com/openai/v1",
+}
 
 # --------------------------------------------------
 # Definición de agentes
 # --------------------------------------------------
 
-market_analyst = Agent(
-    role="Analista de Mercado",
-    goal="Analizar la información actual del mercado del IBEX35 para detectar tendencias, oportunidades y riesgos de inversión.",
-    backstory="Eres un experto en mercados financieros con un profundo conocimiento del mercado español.",
-    allow_delegation=False,
-    verbose=True,
-    llm=llm
-)
-
-investment_advisor = Agent(
-    role="Asesor de Inversiones",
-    goal="Combinar el análisis de mercado con el perfil y objetivos del usuario para generar recomendaciones de inversión personalizadas, señalando tickers del IBEX35 que sean interesantes.",
-    backstory="Eres un asesor financiero experimentado que utiliza datos reales y análisis profundo para ofrecer recomendaciones de inversión.",
-    allow_delegation=False,
-    verbose=True,
-    llm=llm
-)
-
-risk_analyst = Agent(
-    role="Analista de Riesgos",
-    goal="Evaluar y calcular métricas de riesgo para las acciones, incluyendo volatilidad anualizada, para ofrecer un análisis adicional del perfil de riesgo.",
-    backstory="Eres un experto en gestión de riesgos financieros, especializado en evaluar la estabilidad y volatilidad de los mercados.",
-    allow_delegation=False,
-    verbose=True,
-    llm=llm
-)
-
-data_visualizer = Agent(
-    role="Visualizador de Datos",
-    goal="Generar gráficos y visualizaciones que ayuden a comprender la evolución histórica de las acciones, facilitando la toma de decisiones.",
-    backstory="Eres un analista experto en visualización de datos, capaz de transformar datos financieros en gráficos claros e informativos.",
-    allow_delegation=False,
-    verbose=True,
-    llm=llm
-)
-
-report_editor = Agent(
-    role="Editor de Reportes Financieros",
-    goal="Revisar y organizar la información generada para producir un informe final claro, profesional y bien estructurado en formato markdown.",
-    backstory="Eres un editor especializado en contenido financiero, capaz de transformar datos complejos en un informe accesible.",
-    allow_delegation=False,
-    verbose=True,
-    llm=llm
-)
-
-stock_chatbot = Agent(
-    role="Chatbot de Acciones",
-    goal="Responder preguntas en tiempo real sobre las acciones que posee el usuario, utilizando el estado actual de los tickers del IBEX35 y sus acciones compradas como contexto.",
-    backstory="Eres un experto en análisis financiero y conoces profundamente el mercado de valores. Responde preguntas y ofrece recomendaciones en base a la información actual.",
-    allow_delegation=False,
-    verbose=True,
-    llm=llm
-)
+AGENTES = {
+    "market_analyst": {
+        "role": "Analista de Mercado",
+        "goal": "Analizar la información actual del mercado del IBEX35 para detectar tendencias, oportunidades y riesgos de inversión.",
+        "backstory": "Eres un experto en mercados financieros con un profundo conocimiento del mercado español.",
+    },
+    "investment_advisor": {
+        "role": "Asesor de Inversiones",
+        "goal": "Combinar el análisis de mercado con el perfil y objetivos del usuario para generar recomendaciones de inversión personalizadas, señalando tickers del IBEX35 que sean interesantes.",
+        "backstory": "Eres un asesor financiero experimentado que utiliza datos reales y análisis profundo para ofrecer recomendaciones de inversión.",
+    },
+    "risk_analyst": {
+        "role": "Analista de Riesgos",
+        "goal": "Evaluar y calcular métricas de riesgo para las acciones, incluyendo volatilidad anualizada, para ofrecer un análisis adicional del perfil de riesgo.",
+        "backstory": "Eres un experto en gestión de riesgos financieros, especializado en evaluar la estabilidad y volatilidad de los mercados.",
+    },
+    "data_visualizer": {
+        "role": "Visualizador de Datos",
+        "goal": "Generar gráficos y visualizaciones que ayuden a comprender la evolución histórica de las acciones, facilitando la toma de decisiones.",
+        "backstory": "Eres un analista experto en visualización de datos, capaz de transformar datos financieros en gráficos claros e informativos.",
+    },
+    "report_editor": {
+        "role": "Editor de Reportes Financieros",
+        "goal": "Revisar y organizar la información generada para producir un informe final claro, profesional y bien estructurado en formato markdown.",
+        "backstory": "Eres un editor especializado en contenido financiero, capaz de transformar datos complejos en un informe accesible.",
+    },
+    "stock_chatbot": {
+        "role": "Chatbot de Acciones",
+        "goal": "Responder preguntas en tiempo real sobre las acciones que posee el usuario, utilizando el estado actual de los tickers del IBEX35 y sus acciones compradas como contexto.",
+        "backstory": "Eres un experto en análisis financiero y conoces profundamente el mercado de valores. Responde preguntas y ofrece recomendaciones en base a la información actual.",
+    },
+}
 
 # --------------------------------------------------
 # Definición de tasks para cada agente
 # --------------------------------------------------
 
-market_analysis = Task(
-    description=(
-        "Utiliza la siguiente información actual del mercado del IBEX35:\n\n"
-        "{acciones_data}\n\n"
-        "Analiza las tendencias del mercado, identificando oportunidades y riesgos basados en el comportamiento reciente de estas acciones."
-    ),
-    expected_output="Informe detallado con análisis de tendencias y datos relevantes de las acciones del IBEX35.",
-    agent=market_analyst,
-)
-
-investment_recommendation = Task(
-    description=(
-        "Utilizando el análisis de mercado anterior y considerando el perfil de riesgo: \"{perfil}\" "
-        "y el objetivo de inversión: \"{objetivo}\", genera recomendaciones personalizadas de inversión. "
-        "Indica qué tickers del IBEX35 resultan interesantes, justificando cada recomendación con los datos reales proporcionados."
-    ),
-    expected_output="Lista de recomendaciones de inversión personalizadas con tickers y justificaciones basadas en datos reales.",
-    agent=investment_advisor,
-)
-
-risk_assessment = Task(
-    description=(
-        "Usa los datos históricos de los tickers del IBEX35 para calcular la volatilidad anualizada de cada acción. "
-        "Integra esta métrica en un análisis que evalúe el riesgo asociado a cada activo, y proporciona recomendaciones "
-        "en función de la tolerancia al riesgo."
-    ),
-    expected_output="Informe de análisis de riesgo con métricas como volatilidad anualizada y recomendaciones según el riesgo.",
-    agent=risk_analyst,
-)
-
-visualization_task = Task(
-    description=(
-        "Genera gráficos que muestren la evolución histórica de precios (último año) para las acciones del IBEX35, "
-        "destacando tendencias importantes y eventos significativos."
-    ),
-    expected_output="Colección de gráficos de evolución histórica para cada acción.",
-    agent=data_visualizer,
-)
-
-report_generation = Task(
-    description=(
-        "Revisa el contenido generado por el Analista de Mercado, el Asesor de Inversiones y el Analista de Riesgos. "
-        "Edita y organiza la información para producir un informe final en formato markdown, claro y profesional, "
-        "sin mensajes extra o de confirmación."
-    ),
-    expected_output="Informe final de inversiones en formato markdown, bien estructurado y sin mensajes adicionales.",
-    agent=report_editor,
-)
-
-chat_query = Task(
-    description=(
-        "Contexto:\n{contexto}\n\n"
-        "Pregunta: {pregunta}\n\n"
-        "Responde **siempre en español**, basándote en el contexto proporcionado debes guiar al usuario con lo que te pregunte y siempre ser asertivo nunca decirle que no puedes hacer algo/que consulte otras cosas"
-    ),
-    expected_output="Respuesta en español basada en el contexto.",
-    agent=stock_chatbot,
-)
+TAREAS = {
+    "market_analysis": {
+        "description": (
+            "Utiliza la siguiente información actual del mercado del IBEX35:\n\n"
+            "{acciones_data}\n\n"
+            "Analiza las tendencias del mercado, identificando oportunidades y riesgos basados en el comportamiento reciente de estas acciones."
+        ),
+        "expected_output": "Informe detallado con análisis de tendencias y datos relevantes de las acciones del IBEX35.",
+        "agent": "market_analyst",
+    },
+    "investment_recommendation": {
+        "description": (
+            "Utilizando el análisis de mercado anterior y considerando el perfil de riesgo: \"{perfil}\" "
+            "y el objetivo de inversión: \"{objetivo}\", genera recomendaciones personalizadas de inversión. "
+            "Indica qué tickers del IBEX35 resultan interesantes, justificando cada recomendación con los datos reales proporcionados."
+        ),
+        "expected_output": "Lista de recomendaciones de inversión personalizadas con tickers y justificaciones basadas en datos reales.",
+        "agent": "investment_advisor",
+    },
+    "risk_assessment": {
+        "description": (
+            "Estas son las métricas de riesgo del último año, ya calculadas sobre los precios históricos de los tickers "
+            "del IBEX35 (volatilidad anualizada, beta frente al IBEX35, VaR y CVaR diarios al 95% históricos y "
+            "paramétricos, máximo drawdown, y resumen de correlaciones):\n\n"
+            "{riesgo_data}\n\n"
+            "Usa estas cifras tal cual, sin recalcularlas ni inventar otras. Integra estas métricas en un análisis que evalúe "
+            "el riesgo asociado a cada activo, y proporciona recomendaciones en función de la tolerancia al riesgo."
+        ),
+        "expected_output": "Informe de análisis de riesgo con métricas como volatilidad anualizada y recomendaciones según el riesgo.",
+        "agent": "risk_analyst",
+    },
+    "visualization_task": {
+        "description": (
+            "Genera gráficos que muestren la evolución histórica de precios (último año) para las acciones del IBEX35, "
+            "destacando tendencias importantes y eventos significativos."
+        ),
+        "expected_output": "Colección de gráficos de evolución histórica para cada acción.",
+        "agent": "data_visualizer",
+    },
+    "report_generation": {
+        "description": (
+            "Revisa el contenido generado por el Analista de Mercado, el Asesor de Inversiones y el Analista de Riesgos. "
+            "Edita y organiza la información para producir un informe final en formato markdown, claro y profesional, "
+            "sin mensajes extra o de confirmación."
+        ),
+        "expected_output": "Informe final de inversiones en formato markdown, bien estructurado y sin mensajes adicionales.",
+        "agent": "report_editor",
+    },
+    "chat_query": {
+        "description": (
+            "Contexto:\n{contexto}\n\n"
+            "Pregunta: {pregunta}\n\n"
+            "Responde **siempre en español**, basándote en el contexto proporcionado debes guiar al usuario con lo que te pregunte y siempre ser asertivo nunca decirle que no puedes hacer algo/que consulte otras cosas"
+        ),
+        "expected_output": "Respuesta en español basada en el contexto.",
+        "agent": "stock_chatbot",
+    },
+}
+
+_componentes: dict | None = None
+_componentes_lock = threading.Lock()
+
+
+def componentes() -> dict:
+    """
+    Construye una sola vez, en el primer uso, el LLM y los agentes de CrewAI:
+    {'llm': LLM, 'agentes': {nombre: Agent}}. Las tareas no se comparten: CrewAI escribe en
+    ellas las entradas de cada ejecución, así que crew() crea las suyas en cada llamada.
+    """
+    global _componentes
+    with _componentes_lock:
+        if _componentes is None:
+            llm = LLM(**LLM_CONFIG, api_key=os.getenv("GROQ_API_KEY"))
+            agentes = {
+                nombre: Agent(**spec, allow_delegation=False, verbose=True, llm=llm)
+                for nombre, spec in AGENTES.items()
+            }
+            _componentes = {"llm": llm, "agentes": agentes}
+        return _componentes
+
+
+def crew(agentes: list[str], tareas: list[str]):
+    """
+    Crew secuencial con los agentes y tareas indicados por nombre. Las tareas y la crew son
+    nuevas en cada llamada para que dos ejecuciones simultáneas no compartan entradas.
+    """
+    c = componentes()
+    return Crew(
+        agents=[c["agentes"][a] for a in agentes],
+        tasks=[Task(**{**TAREAS[t], "agent": c["agentes"][TAREAS[t]["agent"]]}) for t in tareas],
+        process=Process.sequential,
+        verbose=True
+    )
+
+
+# --------------------------------------------------
+# Cache de respuestas del LLM
+# --------------------------------------------------
+
+# Respuestas guardadas en memoria (el resto queda en disco)
+LLM_CACHE_MAXSIZE = 256
+
+# Vida máxima de una respuesta aunque no cambien los datos de mercado (segundos)
+LLM_CACHE_TTL = 24 * 3600
+
+
+def _normalizar(valor):
+    """Normaliza las entradas de una tarea para que diferencias de espacios no cambien la clave."""
+    if isinstance(valor, str):
+        return " ".join(valor.split())
+    if isinstance(valor, dict):
+        return {k: _normalizar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v) for v in valor]
+    return valor
+
+
+def version_mercado() -> str:
+    """Versión de los datos de mercado del IBEX35 en el almacén: cambia con cada barra nueva."""
+    return obtener_store().version(list(empresas_ibex35.values()))
+
+
+class CacheLLM:
+    """
+    Cache de respuestas del LLM en dos niveles: LRU en memoria y SQLite en disco.
+    La clave es una huella de la tarea, sus entradas normalizadas y la configuración del
+    modelo; cada respuesta se guarda con la versión de los datos de mercado y sólo se
+    reutiliza mientras esa versión siga vigente (y como mucho 'ttl' segundos).
+    """
+
+    def __init__(self, ruta: str | None = None, maxsize: int = LLM_CACHE_MAXSIZE,
+                 ttl: int = LLM_CACHE_TTL, version=version_mercado):
+        self.ruta = ruta or os.path.join(DATA_DIR, "llm_cache.sqlite")
+        self.ttl = ttl
+        self.version = version
+        self._memoria = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.contadores = {"memoria": 0, "disco": 0, "fallos": 0}
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                " clave TEXT PRIMARY KEY, version TEXT NOT NULL, creado REAL NOT NULL,"
+                " respuesta TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    @staticmethod
+    def clave(tarea: str, inputs: dict) -> str:
+        datos = json.dumps([tarea, _normalizar(inputs), LLM_CONFIG], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(datos.encode()).hexdigest()
+
+    def obtener(self, clave: str, version: str) -> str | None:
+        limite = time.time() - self.ttl
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada and entrada[0] == version and entrada[1] >= limite:
+                self.contadores["memoria"] += 1
+                return entrada[2]
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT creado, respuesta FROM respuestas WHERE clave = ? AND version = ? AND creado >= ?",
+                (clave, version, limite)
+            ).fetchone()
+        with self._lock:
+            if fila is None:
+                self.contadores["fallos"] += 1
+                return None
+            self.contadores["disco"] += 1
+            self._memoria[clave] = (version, fila[0], fila[1])
+        return fila[1]
+
+    def guardar(self, clave: str, version: str, respuesta: str) -> None:
+        creado = time.time()
+        with self._lock:
+            self._memoria[clave] = (version, creado, respuesta)
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, version, creado, respuesta) VALUES (?, ?, ?, ?)",
+                (clave, version, creado, respuesta)
+            )
+
+    def estadisticas(self) -> dict:
+        """Aciertos en memoria y en disco, fallos y tasa de acierto."""
+        with self._lock:
+            stats = dict(self.contadores)
+        total = sum(stats.values())
+        stats["tasa_acierto"] = (stats["memoria"] + stats["disco"]) / total if total else 0.0
+        return stats
+
+
+_cache_llm: CacheLLM | None = None
+_cache_llm_lock = threading.Lock()
+
+
+def obtener_cache_llm() -> CacheLLM:
+    """Devuelve la cache de respuestas del LLM compartida del proceso."""
+    global _cache_llm
+    with _cache_llm_lock:
+        if _cache_llm is None:
+            _cache_llm = CacheLLM()
+        return _cache_llm
+
+
+def respuesta_cacheada(func):
+    """
+    Decora una función que ejecuta una crew para reutilizar su respuesta cuando se repiten
+    las entradas con los mismos datos de mercado. Los errores no se cachean.
+    """
+    firma = inspect.signature(func)
+
+    @functools.wraps(func)
+    def envoltura(*args, **kwargs):
+        inputs = firma.bind(*args, **kwargs).arguments
+        cache = obtener_cache_llm()
+        clave = cache.clave(func.__name__, inputs)
+        version = cache.version()
+        respuesta = cache.obtener(clave, version)
+        if respuesta is None:
+            respuesta = func(*args, **kwargs)
+            if respuesta:
+                cache.guardar(clave, version, respuesta)
+        return respuesta
+
+    return envoltura
 
 
 # --------------------------------------------------
 # Funciones para ejecutar los crews
 # --------------------------------------------------
 
+@respuesta_cacheada
 def run_investment_crew(perfil: str, objetivo: str, acciones_data: str) -> str:
     """
     Ejecuta los agentes para análisis básico de mercado + recomendaciones + generación de informe.
@@ -146,35 +321,33 @@ def run_investment_crew(perfil: str, objetivo: str, acciones_data: str) -> str:
         "objetivo": objetivo,
         "acciones_data": acciones_data
     }
-    crew = Crew(
-        agents=[market_analyst, investment_advisor, report_editor],
-        tasks=[market_analysis, investment_recommendation, report_generation],
-        process=Process.sequential,
-        verbose=True
-    )
-    result = crew.kickoff(inputs=inputs)
+    result = crew(
+        ["market_analyst", "investment_advisor", "report_editor"],
+        ["market_analysis", "investment_recommendation", "report_generation"]
+    ).kickoff(inputs=inputs)
     # El resultado suele estar en result.agents o result.tasks, convertimos a string plano
     return str(result)
 
-def run_extended_investment_crew(perfil: str, objetivo: str, acciones_data: str) -> str:
+@respuesta_cacheada
+def run_extended_investment_crew(perfil: str, objetivo: str, acciones_data: str, riesgo_data: str) -> str:
     """
     Ejecuta los agentes para análisis extendido (incluye riesgo y visualizaciones).
+    'riesgo_data' es la tabla de métricas de riesgo precalculadas (ver risk_utils.tabla_riesgo).
     Retorna el texto del informe (Markdown).
     """
     inputs = {
         "perfil": perfil,
         "objetivo": objetivo,
-        "acciones_data": acciones_data
+        "acciones_data": acciones_data,
+        "riesgo_data": riesgo_data
     }
-    crew = Crew(
-        agents=[market_analyst, investment_advisor, risk_analyst, data_visualizer, report_editor],
-        tasks=[market_analysis, investment_recommendation, risk_assessment, visualization_task, report_generation],
-        process=Process.sequential,
-        verbose=True
-    )
-    result = crew.kickoff(inputs=inputs)
+    result = crew(
+        ["market_analyst", "investment_advisor", "risk_analyst", "data_visualizer", "report_editor"],
+        ["market_analysis", "investment_recommendation", "risk_assessment", "visualization_task", "report_generation"]
+    ).kickoff(inputs=inputs)
     return str(result)
 
+@respuesta_cacheada
 def run_chatbot_task(contexto: str, pregunta: str) -> str:
     """
     Ejecuta el agente de chatbot con el contexto y la pregunta del usuario.
@@ -184,12 +357,56 @@ def run_chatbot_task(contexto: str, pregunta: str) -> str:
         "contexto": contexto,
         "pregunta": pregunta
     }
-    crew = Crew(
-        agents=[stock_chatbot],
-        tasks=[chat_query],
-        process=Process.sequential,
-        verbose=True
-    )
-    result = crew.kickoff(inputs=inputs)
+    result = crew(["stock_chatbot"], ["chat_query"]).kickoff(inputs=inputs)
     # Se asume que result contiene la respuesta directa
     return str(result)
+
+
+def stream_chatbot_task(contexto: str, pregunta: str):
+    """
+    Versión en streaming de run_chatbot_task: llama al LLM directamente (sin la crew) con el
+    mismo agente y tarea y va devolviendo los fragmentos de texto según se generan.
+    Comparte la cache de respuestas con run_chatbot_task: si la respuesta ya existe se
+    devuelve de una vez, y al terminar el stream se guarda completa.
+    """
+    cache = obtener_cache_llm()
+    clave = cache.clave(run_chatbot_task.__name__, {"contexto": contexto, "pregunta": pregunta})
+    version = cache.version()
+    respuesta = cache.obtener(clave, version)
+    if respuesta is not None:
+        yield respuesta
+        return
+
+    agente = AGENTES["stock_chatbot"]
+    tarea = TAREAS["chat_query"]
+    mensajes = [
+        {
+            "role": "system",
+            "content": (
+                f"Eres {agente['role']}. {agente['backstory']}\n"
+                f"Tu objetivo: {agente['goal']}"
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                tarea["description"].format(contexto=contexto, pregunta=pregunta)
+                + f"\n\nResultado esperado: {tarea['expected_output']}"
+            ),
+        },
+    ]
+    stream = litellm.completion(
+        **LLM_CONFIG,
+        messages=mensajes,
+        api_key=os.getenv("GROQ_API_KEY"),
+        stream=True,
+    )
+    partes = []
+    for chunk in stream:
+        texto = chunk.choices[0].delta.content or ""
+        if texto:
+            partes.append(texto)
+            yield texto
+    respuesta = "".join(partes)
+    if respuesta:
+        cache.guardar(clave, version, respuesta)
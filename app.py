@@ -2,36 +2,133 @@
 
 from flask import (
     Flask, render_template, request, redirect, url_for, session, flash,
-    Response
+    Response, abort, stream_with_context
 )
 import os
+import click
 import markdown2
 from datetime import datetime
 import io
-import re
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
 from data_utils import (
     empresas_ibex35,
-    preparar_datos_prophet,
-    generar_prediccion,
-    calcular_indicadores_tecnicos,
     obtener_info_fundamental,
     resumen_acciones,
-    precio_actual,
+    precios_actuales,
+    valorar_cartera,
     obtener_rentabilidad_ibex35,
-    resumen_detallado
+    predecir_universo,
+    AJUSTADORES,
+    FIGURAS,
+    MAX_PUNTOS_GRAFICO,
+    reducir_serie,
+    figura_json,
+    plantilla_figuras_json
 )
 
 from agents_utils import (
     run_investment_crew,
     run_extended_investment_crew,
-    run_chatbot_task
+    run_chatbot_task,
+    stream_chatbot_task
 )
 
-from email_utils import enviar_reporte_diario
+from email_utils import enviar_reportes
+
+from digest_utils import ejecutar_digest, obtener_suscriptores
+
+from context_utils import construir_contexto
+
+from risk_utils import obtener_riesgo, tabla_riesgo
+
+from portfolio_utils import rendimiento_cartera
+
+from session_utils import InterfazSesionServidor
+
+from jobs_utils import ColaLlena, TERMINADO, ERROR, clave_trabajo, obtener_cola
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# La clave debe ser la misma en todos los procesos para validar el id de sesión
+app.secret_key = os.getenv("SECRET_KEY") or os.urandom(24)
+# Historial, perfil e informes viven en el servidor; la cookie sólo lleva el id de sesión
+app.session_interface = InterfazSesionServidor()
+
+# Segundos que el navegador puede reutilizar una figura sin revalidarla
+FIGURAS_MAX_AGE = 600
+
+# Límites de la anchura (px) con la que el cliente pide las figuras; se redondea a la
+# centena para que anchuras parecidas compartan la misma entrada de cache
+ANCHO_MIN, ANCHO_MAX = 200, 4000
+
+# Ejecutor compartido por las peticiones de /analisis_combinado: las etapas de una página
+# (predicción, técnico y fundamental) corren a la vez, con un tope global de hilos
+ANALISIS_WORKERS = int(os.getenv("ANALISIS_WORKERS", "6"))
+_ejecutor_analisis = ThreadPoolExecutor(max_workers=ANALISIS_WORKERS, thread_name_prefix="analisis")
+
+# Etapas lanzadas y aún sin terminar, por clave (etapa, ticker, ...): una etapa que agotó su
+# timeout sigue ocupando un hilo, y las peticiones siguientes la esperan en lugar de lanzarla
+# otra vez, de modo que un ticker atascado no acapara el ejecutor
+_etapas_en_curso = {}
+_etapas_lock = threading.Lock()
+
+# Segundos que la página espera a cada etapa antes de renderizar sin ella
+TIMEOUTS_ETAPAS = {
+    "prediccion": float(os.getenv("TIMEOUT_PREDICCION", "20")),
+    "tecnico": float(os.getenv("TIMEOUT_TECNICO", "10")),
+    "fundamental": float(os.getenv("TIMEOUT_FUNDAMENTAL", "8")),
+}
+
+
+def _lanzar_etapa(clave, funcion):
+    """
+    Envía 'funcion' al ejecutor compartido, salvo que ya haya en curso una etapa con la misma
+    clave: entonces devuelve su futuro. Sin clave, la etapa se lanza siempre.
+    """
+    with _etapas_lock:
+        futuro = _etapas_en_curso.get(clave) if clave is not None else None
+        if futuro is not None:
+            return futuro
+        futuro = _ejecutor_analisis.submit(funcion)
+        if clave is None:
+            return futuro
+        _etapas_en_curso[clave] = futuro
+
+    def _terminada(f):
+        with _etapas_lock:
+            if _etapas_en_curso.get(clave) is f:
+                del _etapas_en_curso[clave]
+    futuro.add_done_callback(_terminada)
+    return futuro
+
+
+def ejecutar_etapas(etapas: dict, timeouts: dict = TIMEOUTS_ETAPAS, claves: dict | None = None) -> dict:
+    """
+    Lanza a la vez las funciones de 'etapas' ({nombre: función sin argumentos}) en el ejecutor
+    compartido y espera a cada una como mucho su timeout, contado desde el lanzamiento.
+    'claves' ({nombre: clave}) identifica cada etapa entre peticiones: si la misma etapa sigue
+    en curso de una petición anterior, se espera a ésa en lugar de lanzar otra.
+    Devuelve {nombre: resultado}, con None para las etapas que fallan o no llegan a tiempo;
+    éstas siguen en segundo plano y dejan su resultado en las caches para la siguiente lectura.
+    """
+    claves = claves or {}
+    inicio = time.monotonic()
+    futuros = {nombre: _lanzar_etapa(claves.get(nombre), funcion) for nombre, funcion in etapas.items()}
+    resultados = {}
+    for nombre, futuro in futuros.items():
+        restante = max(0.0, inicio + timeouts.get(nombre, 30.0) - time.monotonic())
+        try:
+            resultados[nombre] = futuro.result(timeout=restante)
+        except FuturesTimeout:
+            app.logger.warning("Etapa %s sin terminar tras %.1fs", nombre, timeouts.get(nombre, 30.0))
+            resultados[nombre] = None
+        except Exception:
+            app.logger.exception("Etapa %s fallida", nombre)
+            resultados[nombre] = None
+    return resultados
 
 
 @app.route("/")
@@ -55,10 +152,110 @@ def download_informe():
     )
 
 
+def _marcador_trabajo(id_trabajo: str) -> str:
+    """HTML provisional de un informe en preparación; la página lo sustituye al terminar."""
+    url = url_for("asistente_trabajo", id_trabajo=id_trabajo)
+    return (f"<div class='trabajo-asesor' data-url='{url}'>"
+            "<em>Preparando el informe del Asesor IA...</em></div>")
+
+
+def _completar_trabajos(historial: list) -> bool:
+    """
+    Sustituye en el historial los marcadores de trabajos ya terminados por su informe
+    (o por el error) y guarda el último informe para su descarga. Devuelve si hubo cambios.
+    """
+    cambios = False
+    for msg in historial:
+        if "trabajo" not in msg:
+            continue
+        estado = obtener_cola().estado(msg["trabajo"])
+        if estado is None or estado["estado"] == ERROR:
+            msg["assistant"] = "<p class='text-danger'>No se pudo generar el informe. Inténtalo de nuevo.</p>"
+        elif estado["estado"] == TERMINADO:
+            msg["assistant"] = markdown2.markdown(estado["resultado"])
+            session["last_report_md"] = estado["resultado"]
+        else:
+            continue
+        del msg["trabajo"]
+        cambios = True
+    if cambios:
+        session["asistente_history"] = historial
+    return cambios
+
+
+@app.route("/asistente/job/<id_trabajo>")
+def asistente_trabajo(id_trabajo):
+    """
+    Estado de un informe del Asesor IA: 'pendiente', 'ejecutando', 'terminado' (con el
+    Markdown y su HTML) o 'error'.
+    """
+    estado = obtener_cola().estado(id_trabajo)
+    if estado is None:
+        abort(404)
+    _completar_trabajos(session.get("asistente_history", []))
+    respuesta = {
+        "id": estado["id"],
+        "estado": estado["estado"],
+        "segundos": estado["segundos"],
+    }
+    if estado["estado"] == TERMINADO:
+        respuesta["markdown"] = estado["resultado"]
+        respuesta["html"] = markdown2.markdown(estado["resultado"])
+    elif estado["estado"] == ERROR:
+        respuesta["error"] = estado["error"]
+    return respuesta
+
+
+def _evento_sse(datos: dict, evento: str | None = None) -> str:
+    """Formatea un evento Server-Sent Events con datos JSON."""
+    cabecera = f"event: {evento}\n" if evento else ""
+    return f"{cabecera}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@app.route("/asistente/stream", methods=["POST"])
+def asistente_stream():
+    """
+    Modo conversación en streaming (SSE): envía cada fragmento de la respuesta según lo
+    genera el LLM ('data: {"texto": ...}') y, al terminar, un evento 'fin' con el HTML final,
+    tras guardar el intercambio en el historial de la sesión.
+    """
+    texto = request.form.get("texto", "").strip()
+    if not texto:
+        abort(400)
+    historial = session.get("asistente_history", [])
+    ctx = construir_contexto(texto, session.get("owned_stocks", {}), historial)
+    # La sesión se guarda (y su cookie se envía) antes de empezar el stream
+    session["modo"] = "conversacion"
+
+    def generar():
+        partes = []
+        try:
+            for fragmento in stream_chatbot_task(ctx, texto):
+                partes.append(fragmento)
+                yield _evento_sse({"texto": fragmento})
+        except Exception:
+            app.logger.exception("Fallo en el stream del chat")
+            yield _evento_sse({"error": "No se pudo generar la respuesta."}, "error")
+            return
+        respuesta = markdown2.markdown("".join(partes))
+        historial = session.get("asistente_history", [])
+        historial.append({"user": texto, "assistant": respuesta, "modo": "conversacion"})
+        session["asistente_history"] = historial
+        app.session_interface.guardar(session)
+        yield _evento_sse({"html": respuesta}, "fin")
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.route("/asistente", methods=["GET", "POST"])
 def asistente():
     # --- Inicializaciones comunes ---
     historial  = session.get("asistente_history", [])
+    _completar_trabajos(historial)
     perfil     = session.get("perfil", "")
     objetivo   = session.get("objetivo", "")
     modo       = session.get("modo", "conversacion")
@@ -83,61 +280,11 @@ def asistente():
 
         # MODO CONVERSACIÓN
         if modo == "conversacion":
-            # 1) Si es el primer POST y no existe ctx_base, lo calculamos aquí
-            if "ctx_base" not in session:
-                # 1a) Resumen fundamental
-                base = "**Resumen Fundamental IBEX35**\n" + resumen_detallado() + "\n\n"
-                # 1b) Crecimientos 1M / 1A
-                base += "**Crecimientos**\n"
-                for linea in resumen_acciones().split("\n"):
-                    m1 = re.search(r"Crecimiento 1M:\s*([0-9\.]+%)", linea)
-                    m2 = re.search(r"Cambio Últ\.\s*Año:\s*([0-9\.]+%)", linea)
-                    if m1 or m2:
-                        nombre = re.match(r"- \*\*(.*?)\*\*", linea).group(1)
-                        if m1:
-                            base += f"- {nombre}: 1M = {m1.group(1)}\n"
-                        if m2:
-                            base += f"- {nombre}: 1A = {m2.group(1)}\n"
-                session["ctx_base"] = base
-
-            # 2) Recuperamos el ctx_base ya en sesión
-            ctx = session["ctx_base"]
-
-            # 3) Añadimos “Mis acciones” con cálculo de ganancia
-            owned = session.get("owned_stocks", {})
-            ctx += "\n**Mis acciones**\n"
-            if owned:
-                for ticker, datos in owned.items():
-                    shares = datos.get("shares", 0)
-                    cost   = datos.get("cost", None)
-                    current_price = precio_actual(ticker) or 0.0
-
-                    if cost is not None:
-                        gain_per_share = current_price - cost
-                        total_gain     = gain_per_share * shares
-                        ctx += (
-                            f"- {ticker}: {shares} acciones, "
-                            f"coste medio {cost:.2f} €, precio actual {current_price:.2f} €, "
-                            f"ganancia total {total_gain:.2f} €\n"
-                        )
-                    else:
-                        ctx += (
-                            f"- {ticker}: {shares} acciones, "
-                            f"precio actual {current_price:.2f} €\n"
-                        )
-            else:
-                ctx += "- (ninguna)\n"
+            # Contexto compacto (tablas de mercado y cartera + historial resumido) construido
+            # desde la foto de mercado y acotado a CHAT_TOKENS_MAX tokens
+            ctx = construir_contexto(texto, session.get("owned_stocks", {}), historial)
 
-
-            # 4) Historial de las últimas 5 interacciones
-            ctx += "\n**Historial Reciente**\n"
-            for msg in historial[-5:]:
-                ctx += f"Tú: {msg['user']}\nAsistente: {msg['assistant']}\n"
-
-            # 5) Nueva pregunta
-            ctx += f"\nTú: {texto}\nAsistente:"
-
-            # 6) Llamamos al LLM
+            # Llamamos al LLM
             respuesta = run_chatbot_task(ctx, texto)
 
         # MODO ASESOR IA
@@ -146,13 +293,33 @@ def asistente():
                 respuesta = "<p class='text-danger'>Define perfil y objetivo primero.</p>"
                 session.pop("last_report_md", None)
             else:
+                # La crew se ejecuta en la cola de trabajos: el worker web queda libre y la
+                # página consulta /asistente/job/<id> hasta que el informe está listo.
+                # Los datos de mercado forman parte de la clave, así que un envío idéntico
+                # con los mismos datos reutiliza el trabajo en curso o ya terminado.
                 data = resumen_acciones()
                 if extendido:
-                    md = run_extended_investment_crew(perfil, objetivo, data)
+                    # Métricas de riesgo precalculadas (una vez por sesión bursátil) para la tarea de riesgo
+                    crew = run_extended_investment_crew
+                    args = (perfil, objetivo, data, tabla_riesgo(obtener_riesgo(list(empresas_ibex35.values()))))
                 else:
-                    md = run_investment_crew(perfil, objetivo, data)
-                session["last_report_md"] = md
-                respuesta = markdown2.markdown(md)
+                    crew = run_investment_crew
+                    args = (perfil, objetivo, data)
+                clave = clave_trabajo(crew.__name__, *args)
+                try:
+                    id_trabajo = obtener_cola().enviar(clave, crew, *args)
+                except ColaLlena:
+                    respuesta = ("<p class='text-warning'>Hay demasiados informes en preparación; "
+                                 "inténtalo de nuevo en unos minutos.</p>")
+                else:
+                    historial.append({
+                        "user": texto,
+                        "assistant": _marcador_trabajo(id_trabajo),
+                        "modo": modo,
+                        "trabajo": id_trabajo
+                    })
+                    session["asistente_history"] = historial
+                    return redirect(url_for("asistente"))
 
         # Guardamos en historial
         historial.append({
@@ -181,53 +348,85 @@ def analisis_combinado():
     empresas = list(empresas_ibex35.keys())
     selected_empresa = empresas[0]
     selected_tipo = "largo"  # Siempre predicción a 1 año
-    grafico_prediccion = grafico_precio = grafico_rsi = None
+    selected_motor = "prophet"
+    selected_ticker = None
     tabla_fundamental = None
 
     if request.method == "POST":
         selected_empresa = request.form.get("empresa")
-        ticker = empresas_ibex35[selected_empresa]
-
-        # 1) Predicción de precio (siempre largo)
-        df_prophet = preparar_datos_prophet(ticker, anios=5)
-        if df_prophet is not None and not df_prophet.empty:
-            fig_pred = generar_prediccion(df_prophet, selected_tipo, selected_empresa)
-            grafico_prediccion = fig_pred.to_html(
-                include_plotlyjs="cdn",
-                full_html=False,
-                div_id="prediccion-plot"
-            )
-
-        # 2) Análisis técnico: Precio y medias
-        tech = calcular_indicadores_tecnicos(ticker)
-        if tech:
-            fig_precio, fig_rsi = tech
-            grafico_precio = fig_precio.to_html(
-                include_plotlyjs=False,
-                full_html=False,
-                div_id="precio-plot"
-            )
-            grafico_rsi = fig_rsi.to_html(
-                include_plotlyjs=False,
-                full_html=False,
-                div_id="rsi-plot"
-            )
-
-        # 3) Análisis fundamental
-        tabla_fundamental = obtener_info_fundamental(ticker)
+        selected_ticker = empresas_ibex35[selected_empresa]
+        selected_motor = request.form.get("motor", selected_motor)
+        if selected_motor not in AJUSTADORES:
+            selected_motor = "prophet"
+        ticker, motor = selected_ticker, selected_motor
+
+        # Las tres etapas corren a la vez: la página tarda lo que la más lenta (acotada por
+        # su timeout). Las de figuras sólo calientan las caches (predicción e indicadores);
+        # el navegador pide luego cada figura a /api/figuras a su anchura y con ETag.
+        resultados = ejecutar_etapas({
+            "prediccion": lambda: figura_json(ticker, "prediccion", motor)[0],
+            "tecnico": lambda: figura_json(ticker, "tecnico")[0],
+            "fundamental": lambda: obtener_info_fundamental(ticker),
+        }, claves={
+            "prediccion": ("prediccion", ticker, motor),
+            "tecnico": ("tecnico", ticker),
+            "fundamental": ("fundamental", ticker),
+        })
+        tabla_fundamental = resultados["fundamental"]
 
     return render_template(
         "combined_analysis_prediction.html",
         empresas=empresas,
         selected_empresa=selected_empresa,
         selected_tipo=selected_tipo,
-        grafico_prediccion=grafico_prediccion,
-        grafico_precio=grafico_precio,
-        grafico_rsi=grafico_rsi,
+        selected_motor=selected_motor,
+        selected_ticker=selected_ticker,
         tabla_fundamental=tabla_fundamental
     )
 
 
+@app.route("/api/figuras/plantilla")
+def api_plantilla_figuras():
+    """Plantilla de estilo común a todas las figuras; no cambia entre despliegues."""
+    resp = Response(plantilla_figuras_json(), mimetype="application/json")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 86400
+    return resp
+
+
+@app.route("/api/figuras/<ticker>/<figura>")
+def api_figura(ticker, figura):
+    """
+    Figura en JSON ('prediccion', 'tecnico' o 'rsi') del ticker, cacheada por versión de datos.
+    La versión viaja como ETag para que el navegador reutilice la figura entre visitas.
+    Con ?ancho=<px> cada serie se reduce (LTTB) a unos 2 puntos por píxel; con ?completo=1
+    se envía a resolución completa.
+    """
+    if ticker not in empresas_ibex35.values() or figura not in FIGURAS:
+        abort(404)
+    motor = request.args.get("motor", "prophet")
+    if motor not in AJUSTADORES:
+        abort(400)
+
+    if request.args.get("completo") == "1":
+        max_puntos = None
+    else:
+        ancho = request.args.get("ancho", type=int)
+        if ancho is None:
+            max_puntos = MAX_PUNTOS_GRAFICO
+        else:
+            ancho = min(max(round(ancho, -2), ANCHO_MIN), ANCHO_MAX)
+            max_puntos = 2 * ancho
+
+    version, payload = figura_json(ticker, figura, motor, max_puntos)
+    if payload is None:
+        abort(404)
+    resp = Response(payload, mimetype="application/json")
+    resp.set_etag(version)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = FIGURAS_MAX_AGE
+    return resp.make_conditional(request)
+
 
 @app.route("/rentabilidad", methods=["GET"])
 def rentabilidad():
@@ -262,25 +461,28 @@ def mis_acciones():
     # GET
     owned = session.get("owned_stocks", {})
 
-    # Calculamos ganancia total de la cartera, solo para posiciones con coste
-    ganancia_total = 0.0
-    for t, datos in owned.items():
-        actual = precio_actual(t) or 0.0
-        if datos["cost"] is not None:
-            gan_unit = actual - datos["cost"]
-            ganancia_total += gan_unit * datos["shares"]
+    # Una sola petición de cotizaciones para toda la cartera; la ganancia total suma
+    # las posiciones con coste y precio conocidos
+    valoracion = valorar_cartera(owned, precios_actuales(list(owned)))
+
+    # Evolución del último año con las posiciones actuales (cacheada por cartera y sesión)
+    rendimiento = rendimiento_cartera(owned) if owned else None
+    curva = None
+    if rendimiento is not None:
+        x, y = reducir_serie(rendimiento["curva"].index, rendimiento["curva"]["Valor"], MAX_PUNTOS_GRAFICO // 2)
+        curva = {"x": x.dt.strftime("%Y-%m-%d").tolist(), "y": y.round(2).tolist()}
 
     return render_template(
         "mis_acciones.html",
         tickers=tickers,
         owned=owned,
-        precio_actual=precio_actual,
-        ganancia_total=ganancia_total
-        
+        posiciones=valoracion["posiciones"],
+        ganancia_total=valoracion["ganancia_total"],
+        rendimiento=rendimiento,
+        curva=curva
     )
 
 
-
 @app.route("/enviar_reporte", methods=["POST"])
 def enviar_reporte():
     emails_raw = request.form.get("emails", "")
@@ -291,15 +493,70 @@ def enviar_reporte():
         return redirect(url_for("mis_acciones"))
 
     if emails_raw.strip():
-        emails = [e.strip() for e in emails_raw.split(",") if e.strip()]
-        for email in emails:
-            enviar_reporte_diario(email, owned)
-        flash(f"Reporte enviado a: {', '.join(emails)} (simulado).", "success")
+        emails = list(dict.fromkeys(e.strip() for e in emails_raw.split(",") if e.strip()))
+        # Un único lote: mercado, comentario IA y conexión SMTP compartidos por todos los correos
+        resultados = enviar_reportes([(email, owned) for email in emails])
+        enviados = [e for e, error in resultados.items() if error is None]
+        fallidos = [f"{e} ({error})" for e, error in resultados.items() if error is not None]
+        if enviados:
+            flash(f"Reporte enviado a: {', '.join(enviados)} (simulado).", "success")
+        if fallidos:
+            flash(f"No se pudo enviar a: {'; '.join(fallidos)}", "danger")
     else:
         flash("No se ingresaron correos; no se enviará reporte.", "info")
 
     return redirect(url_for("mis_acciones"))
 
 
+@app.route("/suscribir", methods=["POST"])
+def suscribir():
+    """Alta (con la cartera guardada en la sesión) o baja del reporte diario programado."""
+    email = request.form.get("email", "").strip()
+    if "@" not in email:
+        flash("Introduce un correo válido para la suscripción.", "danger")
+        return redirect(url_for("mis_acciones"))
+
+    suscriptores = obtener_suscriptores()
+    if request.form.get("accion") == "baja":
+        if suscriptores.baja(email):
+            flash(f"{email} ya no recibirá el reporte diario.", "info")
+        else:
+            flash(f"{email} no estaba suscrito.", "info")
+        return redirect(url_for("mis_acciones"))
+
+    owned = session.get("owned_stocks", {})
+    if not owned:
+        flash("Debes guardar al menos una acción antes de suscribirte.", "danger")
+        return redirect(url_for("mis_acciones"))
+    suscriptores.suscribir(email, owned)
+    flash(f"{email} recibirá cada día laborable el reporte de tu cartera.", "success")
+    return redirect(url_for("mis_acciones"))
+
+
+@app.cli.command("enviar-digest")
+@click.option("--workers", default=None, type=int, help="Hilos de envío en paralelo.")
+def enviar_digest(workers):
+    """Envía ahora el reporte diario a todos los suscriptores y muestra los tiempos."""
+    ejecucion = ejecutar_digest(**({"workers": workers} if workers else {}))
+    click.echo(f"Enviados: {ejecucion['enviados']}, fallidos: {ejecucion['fallidos']}")
+    for fase, segundos in ejecucion["tiempos"].items():
+        click.echo(f"{fase}: {segundos:.2f}s")
+    for email, motivo in ejecucion["errores"].items():
+        click.echo(f"{email}: ERROR {motivo}", err=True)
+
+
+@app.cli.command("precalcular-predicciones")
+@click.option("--tipo", default="largo", type=click.Choice(["corto", "largo"]))
+@click.option("--workers", default=None, type=int, help="Procesos en paralelo (por defecto, uno por núcleo).")
+@click.option("--timeout", default=120.0, type=float, help="Segundos máximos de ajuste por ticker.")
+def precalcular_predicciones(tipo, workers, timeout):
+    """Ajusta Prophet para todo el IBEX35 y deja las predicciones listas para las peticiones."""
+    resultado = predecir_universo(tipo=tipo, max_workers=workers, timeout=timeout)
+    for ticker, segundos in sorted(resultado["tiempos"].items(), key=lambda x: -x[1]):
+        click.echo(f"{ticker}: {segundos:.2f}s")
+    for ticker, motivo in resultado["errores"].items():
+        click.echo(f"{ticker}: ERROR {motivo}", err=True)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,81 @@
+"""
+Mide el coste de arranque: tiempo de importación de cada módulo de la aplicación y de las
+dependencias que arrastran, en un intérprete limpio (python -X importtime), y qué
+dependencias pesadas quedan cargadas tras importar la aplicación.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.arranque --repeticiones 3 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Módulos propios cuyo tiempo de importación se mide por separado
+MODULOS = [
+    "app", "data_utils", "agents_utils", "email_utils", "digest_utils", "context_utils",
+    "session_utils", "jobs_utils", "risk_utils", "portfolio_utils", "store_utils",
+    "indicators_utils",
+]
+
+# Dependencias que deben cargarse en el primer uso y no al arrancar
+PESADAS = ["prophet", "cmdstanpy", "crewai", "litellm", "yfinance", "plotly"]
+
+
+def importtime(modulo: str) -> dict[str, tuple[float, float]]:
+    """
+    Importa 'modulo' en un proceso nuevo con -X importtime y devuelve
+    {módulo importado: (segundos propios, segundos acumulados)}.
+    """
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, env={**os.environ, "LITELLM_LOCAL_MODEL_COST_MAP": "True"},
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{proceso.stderr[-2000:]}")
+    tiempos = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = (parte.strip() for parte in linea[len("import time:"):].split("|"))
+        tiempos[nombre] = (int(propio) / 1e6, int(acumulado) / 1e6)
+    return tiempos
+
+
+def cargadas_tras_importar(modulo: str) -> list[str]:
+    """Dependencias pesadas presentes en sys.modules después de importar 'modulo'."""
+    codigo = f"import sys, {modulo}; print(' '.join(m for m in {PESADAS!r} if m in sys.modules))"
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], capture_output=True, text=True, check=True,
+        env={**os.environ, "LITELLM_LOCAL_MODEL_COST_MAP": "True"},
+    ).stdout
+    return salida.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=3, help="Procesos por módulo (se toma la mediana).")
+    parser.add_argument("--top", type=int, default=15, help="Dependencias más lentas que se listan para 'app'.")
+    parser.add_argument("--modulos", nargs="*", default=MODULOS)
+    args = parser.parse_args()
+
+    print(f"{'módulo':<20}{'importación (s)':>18}")
+    for modulo in args.modulos:
+        medidas = [importtime(modulo)[modulo][1] for _ in range(args.repeticiones)]
+        print(f"{modulo:<20}{statistics.median(medidas):>18.3f}")
+
+    tiempos = importtime("app")
+    # Sólo paquetes de primer nivel para que la lista sea legible
+    raices = {n: acumulado for n, (_, acumulado) in tiempos.items() if "." not in n and n != "app"}
+    print("\nMódulos de primer nivel más lentos al importar app:")
+    for nombre, segundos in sorted(raices.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"  {nombre:<28}{segundos:>8.3f}")
+
+    pesadas = cargadas_tras_importar("app")
+    print("\nDependencias pesadas cargadas al arrancar:", ", ".join(pesadas) or "ninguna")
+    sys.exit(1 if pesadas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compara los motores de predicción (Prophet y el rápido en NumPy) sobre los históricos
+del almacén de precios: tiempo de ajuste y error de backtest (MAPE) en los últimos
+'horizonte' días, ajustando cada motor sólo con los datos anteriores.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.motores --horizonte 30 --tickers SAN.MC BBVA.MC
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_utils import AJUSTADORES, empresas_ibex35
+from store_utils import obtener_store
+
+
+def backtest(df_prophet: pd.DataFrame, motor: str, horizonte: int) -> tuple[float, float] | None:
+    """
+    Ajusta 'motor' con los datos hasta 'horizonte' días antes del final y devuelve
+    (segundos de ajuste, MAPE %) sobre los días reservados.
+    """
+    corte = df_prophet["ds"].max() - pd.Timedelta(days=horizonte)
+    train = df_prophet[df_prophet["ds"] <= corte]
+    test = df_prophet[df_prophet["ds"] > corte]
+    if len(train) < 30 or test.empty:
+        return None
+
+    inicio = time.perf_counter()
+    forecast = AJUSTADORES[motor](train, horizonte)
+    segundos = time.perf_counter() - inicio
+
+    comparado = test.merge(forecast[["ds", "yhat"]], on="ds", how="inner")
+    mape = float(np.mean(np.abs(comparado["yhat"] - comparado["y"]) / comparado["y"]) * 100)
+    return segundos, mape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", nargs="*", default=list(empresas_ibex35.values()))
+    parser.add_argument("--anios", type=int, default=5)
+    parser.add_argument("--horizonte", type=int, default=30, help="Días reservados para el backtest.")
+    parser.add_argument("--actualizar", action="store_true",
+                        help="Trae antes las barras nuevas de yfinance al almacén.")
+    args = parser.parse_args()
+
+    store = obtener_store()
+    if args.actualizar:
+        store.actualizar(args.tickers)
+    inicio = pd.Timestamp.today() - pd.DateOffset(years=args.anios)
+
+    filas = []
+    for ticker in args.tickers:
+        datos = store.leer(ticker, start=inicio)
+        if datos.empty:
+            print(f"{ticker}: sin datos en el almacén")
+            continue
+        df_prophet = datos.reset_index()[["Date", "Precio"]].dropna()
+        df_prophet.columns = ["ds", "y"]
+        for motor in AJUSTADORES:
+            resultado = backtest(df_prophet, motor, args.horizonte)
+            if resultado is not None:
+                segundos, mape = resultado
+                filas.append({"Ticker": ticker, "Motor": motor, "Ajuste (s)": segundos, "MAPE (%)": mape})
+
+    if not filas:
+        return
+    tabla = pd.DataFrame(filas)
+    print(tabla.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print()
+    print(tabla.groupby("Motor")[["Ajuste (s)", "MAPE (%)"]].agg(["mean", "median"]).to_string())
+
+
+if __name__ == "__main__":
+    main()
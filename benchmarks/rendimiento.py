@@ -0,0 +1,338 @@
+"""
+Benchmark sin red de los caminos calientes de data_utils y de todas las rutas de app.py.
+Los datos de mercado salen del proveedor de fixtures (grabados en --fixtures o sintéticos),
+el LLM y el SMTP son simulados y todo se ejecuta sobre un directorio de datos vacío. Para
+cada escenario se mide, en el orden de escenarios():
+  - frio_s: latencia de la primera llamada (con caches vacías o calentadas sólo por los
+    escenarios anteriores), medida con tracemalloc activo. El almacén de precios se llena
+    antes de empezar, como tras reiniciar un despliegue que ya tiene su histórico.
+  - latencia_s: mediana de las 'repeticiones' llamadas siguientes.
+  - memoria_mb: pico de memoria asignada durante la primera llamada (tracemalloc).
+  - llamadas: llamadas al origen de datos (descargas e .info), al LLM y al SMTP en la
+    primera llamada.
+Las llamadas son deterministas: se comparan con benchmarks/llamadas.json (versionado) y el
+proceso termina con código 1 si algún escenario hace más llamadas o no tiene las suyas
+registradas. Los tiempos y la memoria dependen de la máquina: se comparan, sólo como aviso,
+con la línea base local benchmarks/linea_base.json (fuera del repositorio), que cada máquina
+registra con --guardar.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.rendimiento                      # compara llamadas y tiempos
+    python -m benchmarks.rendimiento --guardar            # registra la línea base de tiempos local
+    python -m benchmarks.rendimiento --guardar-llamadas   # registra las llamadas esperadas
+    pytest --benchmark tests/test_benchmarks.py           # lo mismo desde pytest
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+from types import SimpleNamespace
+from unittest import mock
+
+# Línea base de tiempos y memoria de esta máquina (ignorada por git) y llamadas esperadas
+LINEA_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linea_base.json")
+LLAMADAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llamadas.json")
+
+# Empeoramiento relativo admitido (0.5 = 50 %) y holguras absolutas, para que el ruido en
+# escenarios de pocos milisegundos o megabytes no cuente como empeoramiento
+TOLERANCIA = float(os.getenv("BENCHMARK_TOLERANCIA", "0.5"))
+HOLGURA_S = 0.02
+HOLGURA_MB = 1.0
+
+# Cartera con la que se ejercitan las rutas de la cartera y los reportes
+CARTERA = {
+    "shares_SAN.MC": "100", "cost_SAN.MC": "3.5",
+    "shares_BBVA.MC": "50", "cost_BBVA.MC": "",
+    "shares_ITX.MC": "20", "cost_ITX.MC": "40",
+}
+
+
+class Contador:
+    """Llamadas a los servicios externos: origen de datos, LLM y SMTP."""
+
+    def __init__(self, proveedor):
+        self.proveedor = proveedor
+        self.llm = 0
+        self.smtp = 0
+        self._lock = threading.Lock()
+
+    def sumar(self, servicio: str) -> None:
+        with self._lock:
+            setattr(self, servicio, getattr(self, servicio) + 1)
+
+    def foto(self) -> dict[str, int]:
+        return {**self.proveedor.llamadas, "llm": self.llm, "smtp": self.smtp}
+
+
+def simular_servicios(contador: Contador) -> ExitStack:
+    """Sustituye la crew y LiteLLM por un LLM simulado y la conexión SMTP por una falsa."""
+
+    class CrewSimulada:
+        def kickoff(self, inputs):
+            contador.sumar("llm")
+            return "# Informe simulado\n\n" + "\n".join(f"- {k}: {len(str(v))} caracteres" for k, v in inputs.items())
+
+    def completion(**kwargs):
+        contador.sumar("llm")
+        for palabra in "Respuesta simulada del asistente sobre el IBEX35.".split():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=palabra + " "))])
+
+    class SMTPSimulado:
+        def send_message(self, msg):
+            contador.sumar("smtp")
+
+        def quit(self):
+            pass
+
+        close = quit
+
+    pila = ExitStack()
+    pila.enter_context(mock.patch("agents_utils.crew", lambda agentes, tareas: CrewSimulada()))
+    pila.enter_context(mock.patch("agents_utils.litellm", SimpleNamespace(completion=completion)))
+    pila.enter_context(mock.patch("email_utils.abrir_smtp", SMTPSimulado))
+    return pila
+
+
+def escenarios(cliente) -> list[dict]:
+    """
+    Escenarios en orden de ejecución: 'funcion' se mide y 'preparar' (opcional) calcula
+    antes, sin medir, sus argumentos. 'ruta' es el endpoint de Flask que cubre.
+    """
+    import data_utils
+    from jobs_utils import TERMINADO, ERROR, obtener_cola
+
+    def peticion(metodo, url, esperado=(200,), **kwargs):
+        resp = getattr(cliente, metodo)(url, **kwargs)
+        if resp.status_code not in esperado:
+            raise RuntimeError(f"{metodo.upper()} {url}: {resp.status_code}")
+        resp.get_data()
+        return resp
+
+    trabajos = []
+
+    def asesor():
+        cola = obtener_cola()
+        enviar = cola.enviar
+
+        def enviar_y_anotar(*args):
+            trabajos.append(enviar(*args))
+            return trabajos[-1]
+
+        with mock.patch.object(cola, "enviar", enviar_y_anotar):
+            peticion("post", "/asistente", (302,), data={
+                "texto": "Quiero un informe", "modo": "asesor", "perfil": "Moderado", "objetivo": "Crecimiento"
+            })
+        # Se espera al informe como hace la página
+        limite = time.monotonic() + 30
+        while cola.estado(trabajos[-1])["estado"] not in (TERMINADO, ERROR):
+            if time.monotonic() > limite:
+                raise RuntimeError("El informe del asesor no terminó en 30 s")
+            time.sleep(0.02)
+
+    def serie_rsi():
+        df = data_utils.preparar_datos_prophet("SAN.MC")
+        return (df.set_index("ds")["y"],)
+
+    return [
+        {"nombre": "preparar_datos_prophet", "funcion": lambda: data_utils.preparar_datos_prophet("SAN.MC")},
+        {"nombre": "generar_prediccion",
+         "preparar": lambda: (data_utils.preparar_datos_prophet("SAN.MC"),),
+         "funcion": lambda df: data_utils.generar_prediccion(df, "largo", "Banco Santander", ticker="SAN.MC")},
+        {"nombre": "calcular_indicadores_tecnicos", "funcion": lambda: data_utils.calcular_indicadores_tecnicos("SAN.MC")},
+        {"nombre": "calcular_RSI", "preparar": serie_rsi, "funcion": lambda serie: data_utils.calcular_RSI(serie)},
+        {"nombre": "obtener_rentabilidad_ibex35", "funcion": data_utils.obtener_rentabilidad_ibex35},
+
+        {"nombre": "GET /", "ruta": "index", "funcion": lambda: peticion("get", "/", (302,))},
+        {"nombre": "GET /asistente", "ruta": "asistente", "funcion": lambda: peticion("get", "/asistente")},
+        {"nombre": "POST /mis_acciones", "ruta": "mis_acciones",
+         "funcion": lambda: peticion("post", "/mis_acciones", (302,), data=CARTERA)},
+        {"nombre": "GET /mis_acciones", "ruta": "mis_acciones", "funcion": lambda: peticion("get", "/mis_acciones")},
+        {"nombre": "POST /asistente (conversación)", "ruta": "asistente",
+         "funcion": lambda: peticion("post", "/asistente", data={"texto": "¿Cómo va BBVA?", "modo": "conversacion"})},
+        {"nombre": "POST /asistente/stream", "ruta": "asistente_stream",
+         "funcion": lambda: peticion("post", "/asistente/stream", data={"texto": "¿Y Santander?"})},
+        {"nombre": "POST /asistente (asesor)", "ruta": "asistente", "funcion": asesor},
+        {"nombre": "GET /asistente/job/<id>", "ruta": "asistente_trabajo",
+         "funcion": lambda: peticion("get", f"/asistente/job/{trabajos[-1]}")},
+        {"nombre": "GET /download_informe", "ruta": "download_informe",
+         "funcion": lambda: peticion("get", "/download_informe")},
+        {"nombre": "GET /analisis_combinado", "ruta": "analisis_combinado",
+         "funcion": lambda: peticion("get", "/analisis_combinado")},
+        {"nombre": "POST /analisis_combinado", "ruta": "analisis_combinado",
+         "funcion": lambda: peticion("post", "/analisis_combinado", data={"empresa": "BBVA", "motor": "prophet"})},
+        {"nombre": "GET /api/figuras/plantilla", "ruta": "api_plantilla_figuras",
+         "funcion": lambda: peticion("get", "/api/figuras/plantilla")},
+        {"nombre": "GET /api/figuras/<t>/prediccion", "ruta": "api_figura",
+         "funcion": lambda: peticion("get", "/api/figuras/ITX.MC/prediccion?ancho=800")},
+        {"nombre": "GET /api/figuras/<t>/tecnico", "ruta": "api_figura",
+         "funcion": lambda: peticion("get", "/api/figuras/ITX.MC/tecnico?ancho=800")},
+        {"nombre": "GET /api/figuras/<t>/rsi", "ruta": "api_figura",
+         "funcion": lambda: peticion("get", "/api/figuras/ITX.MC/rsi?completo=1")},
+        {"nombre": "GET /rentabilidad", "ruta": "rentabilidad", "funcion": lambda: peticion("get", "/rentabilidad")},
+        {"nombre": "POST /enviar_reporte", "ruta": "enviar_reporte",
+         "funcion": lambda: peticion("post", "/enviar_reporte", (302,), data={"emails": "a@example.com, b@example.com"})},
+        {"nombre": "POST /suscribir", "ruta": "suscribir",
+         "funcion": lambda: peticion("post", "/suscribir", (302,), data={"email": "a@example.com", "accion": "alta"})},
+    ]
+
+
+def medir(escenario: dict, repeticiones: int, contador: Contador) -> dict:
+    args = escenario["preparar"]() if "preparar" in escenario else ()
+    funcion = escenario["funcion"]
+
+    antes = contador.foto()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    funcion(*args)
+    frio = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    despues = contador.foto()
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(*args)
+        tiempos.append(time.perf_counter() - inicio)
+    return {
+        "frio_s": round(frio, 6),
+        "latencia_s": round(statistics.median(tiempos if tiempos else [frio]), 6),
+        "memoria_mb": round(pico / 2**20, 2),
+        "llamadas": {k: despues[k] - antes[k] for k in despues},
+    }
+
+
+def comparar_llamadas(resultados: dict, llamadas: dict) -> list[str]:
+    """
+    Regresiones de llamadas de 'resultados' frente a las registradas ({escenario: llamadas}):
+    un escenario que hace más llamadas a algún servicio o que no tiene las suyas registradas.
+    """
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anteriores = llamadas.get(nombre)
+        if anteriores is None:
+            regresiones.append(f"{nombre}: llamadas sin registrar (ejecute con --guardar-llamadas)")
+            continue
+        for servicio, n in actual["llamadas"].items():
+            if n > anteriores.get(servicio, 0):
+                regresiones.append(f"{nombre}: llamadas a {servicio} {anteriores.get(servicio, 0)} -> {n}")
+    return regresiones
+
+
+def comparar_tiempos(resultados: dict, base: dict, tolerancia: float = TOLERANCIA) -> list[str]:
+    """Empeoramientos de tiempo y memoria de 'resultados' frente a la línea base local 'base'."""
+    avisos = []
+    for nombre, actual in resultados.items():
+        anterior = base.get(nombre)
+        if anterior is None:
+            continue
+        for campo, holgura in (("frio_s", HOLGURA_S), ("latencia_s", HOLGURA_S), ("memoria_mb", HOLGURA_MB)):
+            if actual[campo] > anterior[campo] * (1 + tolerancia) + holgura:
+                avisos.append(f"{nombre}: {campo} {anterior[campo]} -> {actual[campo]}")
+    return avisos
+
+
+def ejecutar(repeticiones: int = 5, fixtures: str | None = None, latencia: float = 0.0) -> dict:
+    """Ejecuta todos los escenarios en un directorio de datos nuevo y devuelve sus medidas."""
+    # El directorio de datos y el proveedor se fijan antes de importar la aplicación
+    os.environ["IBEX_DATA_DIR"] = tempfile.mkdtemp(prefix="ibex35_benchmark_")
+    os.environ["MERCADO_PROVEEDOR"] = "fixture"
+    os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    logging.getLogger("cmdstanpy").disabled = True
+
+    import provider_utils
+    from app import app
+    from data_utils import empresas_ibex35
+    from store_utils import obtener_store
+
+    proveedor = provider_utils.ProveedorFixture(fixtures, latencia=latencia)
+    provider_utils._proveedor = proveedor
+    obtener_store().actualizar(list(empresas_ibex35.values()))
+    contador = Contador(proveedor)
+
+    resultados = {}
+    with simular_servicios(contador), app.test_client() as cliente:
+        lista = escenarios(cliente)
+        rutas = {r.endpoint for r in app.url_map.iter_rules()} - {"static"}
+        sin_cubrir = rutas - {e["ruta"] for e in lista if "ruta" in e}
+        if sin_cubrir:
+            raise SystemExit(f"Rutas sin escenario de benchmark: {', '.join(sorted(sin_cubrir))}")
+        for escenario in lista:
+            resultados[escenario["nombre"]] = medir(escenario, repeticiones, contador)
+    return resultados
+
+
+def _leer(ruta: str) -> dict:
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)["escenarios"]
+
+
+def _escribir(ruta: str, datos: dict) -> None:
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5, help="Llamadas en caliente por escenario (mediana).")
+    parser.add_argument("--fixtures", default=os.getenv("MERCADO_FIXTURES"),
+                        help="Directorio con datos grabados (python -m provider_utils <dir>).")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos simulados por llamada al origen de datos.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--linea-base", default=LINEA_BASE)
+    parser.add_argument("--llamadas", default=LLAMADAS)
+    parser.add_argument("--guardar", action="store_true", help="Guarda los tiempos como línea base de esta máquina.")
+    parser.add_argument("--guardar-llamadas", action="store_true", help="Guarda las llamadas como las esperadas.")
+    args = parser.parse_args()
+
+    resultados = ejecutar(args.repeticiones, args.fixtures, args.latencia)
+    base = _leer(args.linea_base)
+
+    print(f"{'escenario':<36}{'frío (ms)':>11}{'caliente (ms)':>15}{'memoria (MB)':>14}{'base (ms)':>11}  llamadas")
+    for nombre, m in resultados.items():
+        llamadas = " ".join(f"{k}={v}" for k, v in m["llamadas"].items() if v)
+        anterior = f"{base[nombre]['latencia_s'] * 1000:.1f}" if nombre in base else "-"
+        print(f"{nombre:<36}{m['frio_s'] * 1000:>11.1f}{m['latencia_s'] * 1000:>15.1f}"
+              f"{m['memoria_mb']:>14.2f}{anterior:>11}  {llamadas}")
+
+    if args.guardar:
+        _escribir(args.linea_base, {"repeticiones": args.repeticiones, "latencia": args.latencia,
+                                    "escenarios": resultados})
+        print(f"\nLínea base de tiempos guardada en {args.linea_base}")
+    if args.guardar_llamadas:
+        _escribir(args.llamadas, {"escenarios": {n: m["llamadas"] for n, m in resultados.items()}})
+        print(f"\nLlamadas esperadas guardadas en {args.llamadas}")
+    if args.guardar or args.guardar_llamadas:
+        return
+
+    if base:
+        avisos = comparar_tiempos(resultados, base, args.tolerancia)
+        if avisos:
+            print("\nAVISO: más lento o con más memoria que la línea base local:")
+            for a in avisos:
+                print(f"  {a}")
+    else:
+        print("\nSin línea base de tiempos en esta máquina: ejecute con --guardar para registrarla.")
+
+    regresiones = comparar_llamadas(resultados, _leer(args.llamadas))
+    if regresiones:
+        print("\nREGRESIONES:")
+        for r in regresiones:
+            print(f"  {r}")
+        sys.exit(1)
+    print("\nSin regresiones de llamadas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+import functools
+import logging
+import hashlib
+import io
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+
+from store_utils import DATA_DIR
+
+log = logging.getLogger(__name__)
+
+# Backend de la cache compartida entre workers: "sqlite" (por defecto), "fichero" o "memoria"
+# (sólo el proceso actual). Con "fichero" y CACHE_DIR en /dev/shm los datos viven en memoria
+# compartida del host.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_DIR = os.getenv("CACHE_DIR")
+
+# Segundos que, pasado el TTL, se sigue sirviendo el último valor mientras se refresca en
+# segundo plano; después, las peticiones esperan al valor nuevo
+CACHE_MAX_OBSOLETO = float(os.getenv("CACHE_MAX_OBSOLETO", str(24 * 3600)))
+
+# Segundos que un worker se reserva el cálculo de una clave; los demás esperan su resultado
+BLOQUEO_CALCULO = 120
+
+# Segundos entre comprobaciones mientras otro worker calcula la clave
+INTERVALO_ESPERA = 0.1
+
+# Segundos entre purgas de entradas caducadas
+INTERVALO_PURGA = 3600
+
+
+# --------------------------------------------------
+# Codecs: serialización sin pickle
+# --------------------------------------------------
+
+def _codificar_json(valor) -> bytes:
+    return json.dumps(valor, ensure_ascii=False, default=str).encode()
+
+
+def _decodificar_json(datos: bytes):
+    return json.loads(datos)
+
+
+def codificar_dataframe(df: pd.DataFrame) -> str:
+    """DataFrame a JSON con esquema (orient='table'): conserva índice, tipos y fechas."""
+    return df.to_json(orient="table", date_format="iso", date_unit="ns")
+
+
+def decodificar_dataframe(texto: str) -> pd.DataFrame:
+    return pd.read_json(io.StringIO(texto), orient="table")
+
+
+# nombre -> (tipo, codificar(valor) -> bytes, decodificar(bytes) -> valor). Lo que no
+# encaja en ninguno se guarda como JSON.
+CODECS = {
+    "dataframe": (pd.DataFrame,
+                  lambda df: codificar_dataframe(df).encode(),
+                  lambda datos: decodificar_dataframe(datos.decode())),
+}
+
+
+def registrar_codec(nombre: str, tipo: type, codificar, decodificar) -> None:
+    """Registra la serialización (a bytes) de un tipo propio, p.ej. MarketSnapshot."""
+    CODECS[nombre] = (tipo, codificar, decodificar)
+
+
+def codificar(valor) -> tuple[str, bytes]:
+    for nombre, (tipo, codificador, _) in CODECS.items():
+        if isinstance(valor, tipo):
+            return nombre, codificador(valor)
+    return "json", _codificar_json(valor)
+
+
+def decodificar(codec: str, datos: bytes):
+    if codec == "json":
+        return _decodificar_json(datos)
+    return CODECS[codec][2](datos)
+
+
+# --------------------------------------------------
+# Backends
+# --------------------------------------------------
+# Cada entrada guarda hasta cuándo está fresca y hasta cuándo se conserva (fresca más el
+# máximo tiempo que puede servirse obsoleta). Los bloqueos reservan el cálculo de una clave
+# a un solo worker.
+
+class CacheSQLite:
+    """Entradas y bloqueos en tablas SQLite compartidas por los workers."""
+
+    def __init__(self, ruta: str | None = None):
+        self.ruta = ruta or os.path.join(CACHE_DIR or DATA_DIR, "cache.sqlite")
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(cache)")}
+            if columnas and "fresco" not in columnas:
+                # Formato anterior, sin tiempo de frescura: es una cache, se empieza de cero
+                con.execute("DROP TABLE cache")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " clave TEXT PRIMARY KEY, fresco REAL NOT NULL, expira REAL NOT NULL,"
+                " codec TEXT NOT NULL, datos BLOB NOT NULL)"
+            )
+            con.execute("CREATE TABLE IF NOT EXISTS bloqueos (clave TEXT PRIMARY KEY, hasta REAL NOT NULL)")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def leer(self, clave: str) -> tuple[float, float, str, bytes] | None:
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT fresco, expira, codec, datos FROM cache WHERE clave = ? AND expira > ?",
+                (clave, time.time())
+            ).fetchone()
+        return (fila[0], fila[1], fila[2], bytes(fila[3])) if fila else None
+
+    def guardar(self, clave: str, fresco: float, expira: float, codec: str, datos: bytes) -> None:
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO cache (clave, fresco, expira, codec, datos) VALUES (?, ?, ?, ?, ?)",
+                (clave, fresco, expira, codec, datos)
+            )
+
+    def bloquear(self, clave: str, segundos: float) -> bool:
+        ahora = time.time()
+        with self._conectar() as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.execute("DELETE FROM bloqueos WHERE clave = ? AND hasta <= ?", (clave, ahora))
+            cursor = con.execute(
+                "INSERT OR IGNORE INTO bloqueos (clave, hasta) VALUES (?, ?)", (clave, ahora + segundos)
+            )
+        return cursor.rowcount == 1
+
+    def liberar(self, clave: str) -> None:
+        with self._conectar() as con:
+            con.execute("DELETE FROM bloqueos WHERE clave = ?", (clave,))
+
+    def borrar(self, prefijo: str) -> None:
+        with self._conectar() as con:
+            con.execute("DELETE FROM cache WHERE substr(clave, 1, ?) = ?", (len(prefijo), prefijo))
+
+    def purgar(self) -> None:
+        ahora = time.time()
+        with self._conectar() as con:
+            con.execute("DELETE FROM cache WHERE expira <= ?", (ahora,))
+            con.execute("DELETE FROM bloqueos WHERE hasta <= ?", (ahora,))
+
+
+class CacheFichero:
+    """
+    Una entrada por fichero (cabecera JSON con frescura, caducidad y codec, y los datos) y un
+    fichero .lock por cálculo en curso. En un tmpfs como /dev/shm equivale a memoria
+    compartida entre los procesos del host.
+    """
+
+    def __init__(self, directorio: str | None = None):
+        self.directorio = directorio or CACHE_DIR or os.path.join(DATA_DIR, "cache")
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, clave: str) -> str:
+        espacio, _, resto = clave.partition(":")
+        return os.path.join(self.directorio, f"{espacio}-{hashlib.sha1(resto.encode()).hexdigest()}.cache")
+
+    def leer(self, clave: str) -> tuple[float, float, str, bytes] | None:
+        try:
+            with open(self._ruta(clave), "rb") as f:
+                cabecera = json.loads(f.readline())
+                datos = f.read()
+        except (OSError, ValueError):
+            return None
+        if cabecera.get("clave") != clave or cabecera.get("expira", 0) <= time.time():
+            return None
+        return cabecera["fresco"], cabecera["expira"], cabecera["codec"], datos
+
+    def guardar(self, clave: str, fresco: float, expira: float, codec: str, datos: bytes) -> None:
+        # Escritura atómica: nunca se lee un fichero a medio escribir
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{secrets.token_hex(4)}.tmp"
+        with open(temporal, "wb") as f:
+            cabecera = {"clave": clave, "fresco": fresco, "expira": expira, "codec": codec}
+            f.write(json.dumps(cabecera).encode() + b"\n")
+            f.write(datos)
+        os.replace(temporal, ruta)
+
+    def bloquear(self, clave: str, segundos: float) -> bool:
+        ruta = f"{self._ruta(clave)}.lock"
+        for _ in range(2):
+            try:
+                os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    # Bloqueo abandonado (p.ej. el worker murió calculando): se retira
+                    if time.time() - os.path.getmtime(ruta) < segundos:
+                        return False
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def liberar(self, clave: str) -> None:
+        try:
+            os.remove(f"{self._ruta(clave)}.lock")
+        except FileNotFoundError:
+            pass
+
+    def borrar(self, prefijo: str) -> None:
+        espacio = prefijo.rstrip(":")
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith(f"{espacio}-") and nombre.endswith(".cache"):
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except FileNotFoundError:
+                    pass
+
+    def purgar(self) -> None:
+        ahora = time.time()
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".cache"):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                with open(ruta, "rb") as f:
+                    caducada = json.loads(f.readline())["expira"] <= ahora
+            except (OSError, ValueError, KeyError):
+                continue
+            if caducada:
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+
+
+class CacheMemoria:
+    """Entradas en un diccionario del proceso (sin compartir): para un único worker o tests."""
+
+    def __init__(self):
+        self._entradas = {}
+        self._bloqueos = {}
+        self._lock = threading.Lock()
+
+    def leer(self, clave: str) -> tuple[float, float, str, bytes] | None:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+        return entrada if entrada and entrada[1] > time.time() else None
+
+    def guardar(self, clave: str, fresco: float, expira: float, codec: str, datos: bytes) -> None:
+        with self._lock:
+            self._entradas[clave] = (fresco, expira, codec, datos)
+
+    def bloquear(self, clave: str, segundos: float) -> bool:
+        ahora = time.time()
+        with self._lock:
+            if self._bloqueos.get(clave, 0) > ahora:
+                return False
+            self._bloqueos[clave] = ahora + segundos
+            return True
+
+    def liberar(self, clave: str) -> None:
+        with self._lock:
+            self._bloqueos.pop(clave, None)
+
+    def borrar(self, prefijo: str) -> None:
+        with self._lock:
+            for clave in [c for c in self._entradas if c.startswith(prefijo)]:
+                del self._entradas[clave]
+
+    def purgar(self) -> None:
+        ahora = time.time()
+        with self._lock:
+            for clave in [c for c, e in self._entradas.items() if e[1] <= ahora]:
+                del self._entradas[clave]
+
+
+BACKENDS = {"sqlite": CacheSQLite, "fichero": CacheFichero, "memoria": CacheMemoria}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_backend():
+    """Backend de cache compartido del proceso, según CACHE_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = BACKENDS[CACHE_BACKEND]()
+        return _backend
+
+
+# --------------------------------------------------
+# Cache con nombre y decorador
+# --------------------------------------------------
+
+# Hilos que refrescan en segundo plano las entradas obsoletas
+_refrescos = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refresco-cache")
+
+# Marca los hilos que están refrescando: dentro de un refresco no se aceptan valores
+# obsoletos de otras caches (p.ej. la rentabilidad espera a la foto de mercado nueva)
+_contexto = threading.local()
+
+
+class CacheCompartida:
+    """
+    Cache con TTL de un espacio de nombres ('rentabilidad', 'snapshot'...) sobre el backend
+    compartido por todos los workers del host. Cada proceso guarda además los valores ya
+    decodificados, para no deserializar en cada llamada.
+
+    Pasado el TTL, el último valor se sigue sirviendo durante 'max_obsoleto' segundos mientras
+    un único hilo lo recalcula en segundo plano (stale-while-revalidate). Cuando no hay valor
+    utilizable, las llamadas simultáneas a la misma clave esperan a un único cálculo, tanto
+    dentro del proceso como entre workers (bloqueo en el backend).
+    """
+
+    def __init__(self, espacio: str, ttl: float, backend=None, max_obsoleto: float = CACHE_MAX_OBSOLETO,
+                 bloqueo: float = BLOQUEO_CALCULO):
+        self.espacio = espacio
+        self.ttl = ttl
+        self.max_obsoleto = max_obsoleto
+        self.bloqueo = bloqueo
+        self._backend = backend
+        self._local = {}
+        self._en_curso: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._ultima_purga = 0.0
+        self.contadores = {"frescos": 0, "obsoletos": 0, "calculos": 0, "esperas": 0}
+
+    @property
+    def backend(self):
+        return self._backend or obtener_backend()
+
+    def clave(self, *args, **kwargs) -> str:
+        partes = json.dumps([args, kwargs], sort_keys=True, default=str)
+        return f"{self.espacio}:{partes}"
+
+    def _leer(self, clave: str) -> tuple[float, float, object] | None:
+        """(fresco hasta, se conserva hasta, valor) de la clave, o None si no hay valor utilizable."""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._local.get(clave)
+        if entrada and entrada[0] > ahora:
+            return entrada
+        guardada = self.backend.leer(clave)
+        if guardada is None:
+            return entrada if entrada and entrada[1] > ahora else None
+        fresco, expira, codec, datos = guardada
+        if entrada and entrada[0] >= fresco:
+            return entrada if entrada[1] > ahora else None
+        entrada = (fresco, expira, decodificar(codec, datos))
+        with self._lock:
+            self._local[clave] = entrada
+        return entrada
+
+    def obtener(self, clave: str):
+        """Valor fresco (dentro del TTL) de la clave o None."""
+        entrada = self._leer(clave)
+        return entrada[2] if entrada and entrada[0] > time.time() else None
+
+    def guardar(self, clave: str, valor) -> None:
+        fresco = time.time() + self.ttl
+        expira = fresco + self.max_obsoleto
+        codec, datos = codificar(valor)
+        self.backend.guardar(clave, fresco, expira, codec, datos)
+        with self._lock:
+            self._local[clave] = (fresco, expira, valor)
+        self._purgar_si_toca()
+
+    def resolver(self, clave: str, calcular):
+        """
+        Devuelve el valor de la clave: fresco de la cache; obsoleto (lanzando un refresco en
+        segundo plano) si no ha superado 'max_obsoleto'; o, si no hay nada utilizable, el de un
+        único cálculo compartido por todas las llamadas que lleguen mientras tanto.
+        """
+        entrada = self._leer(clave)
+        ahora = time.time()
+        if entrada and entrada[0] > ahora:
+            self._contar("frescos")
+            return entrada[2]
+        if entrada and not getattr(_contexto, "refrescando", False):
+            self._contar("obsoletos")
+            self._en_vuelo(clave, calcular, fondo=True)
+            return entrada[2]
+        return self._en_vuelo(clave, calcular).result()
+
+    def _contar(self, nombre: str) -> None:
+        # "+=" sobre el dict no es atómico: sin el lock se pierden cuentas entre hilos
+        with self._lock:
+            self.contadores[nombre] += 1
+
+    def _en_vuelo(self, clave: str, calcular, fondo: bool = False) -> Future:
+        """Future del cálculo en curso de la clave; si no hay ninguno, lo inicia este hilo (o el pool)."""
+        with self._lock:
+            futuro = self._en_curso.get(clave)
+            if futuro is not None:
+                self.contadores["esperas"] += 1
+                return futuro
+            futuro = self._en_curso[clave] = Future()
+        if fondo:
+            _refrescos.submit(self._completar, clave, calcular, futuro, True)
+        else:
+            self._completar(clave, calcular, futuro, False)
+        return futuro
+
+    def _completar(self, clave: str, calcular, futuro: Future, fondo: bool) -> None:
+        anterior = getattr(_contexto, "refrescando", False)
+        _contexto.refrescando = fondo or anterior
+        try:
+            futuro.set_result(self._calcular_entre_workers(clave, calcular))
+        except BaseException as e:
+            if fondo:
+                log.warning("No se pudo refrescar %s: %s", clave, e)
+            futuro.set_exception(e)
+        finally:
+            _contexto.refrescando = anterior
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+    def _calcular_entre_workers(self, clave: str, calcular):
+        """
+        Calcula y guarda el valor si este worker consigue el bloqueo de la clave; si otro lo
+        tiene, espera (hasta 'bloqueo' segundos) a que publique un valor fresco.
+        """
+        bloqueado = self.backend.bloquear(clave, self.bloqueo)
+        limite = time.time() + self.bloqueo
+        while not bloqueado and time.time() < limite:
+            time.sleep(INTERVALO_ESPERA)
+            valor = self.obtener(clave)
+            if valor is not None:
+                return valor
+            bloqueado = self.backend.bloquear(clave, self.bloqueo)
+        # Si el otro worker no terminó a tiempo se calcula sin bloqueo
+        try:
+            if bloqueado:
+                # Otro worker pudo publicar el valor justo antes de liberar el bloqueo
+                valor = self.obtener(clave)
+                if valor is not None:
+                    return valor
+            self._contar("calculos")
+            valor = calcular()
+            self.guardar(clave, valor)
+            return valor
+        finally:
+            if bloqueado:
+                self.backend.liberar(clave)
+
+    def clear(self) -> None:
+        """Vacía el espacio de nombres en este proceso y en el backend compartido."""
+        with self._lock:
+            self._local.clear()
+        self.backend.borrar(f"{self.espacio}:")
+
+    def _purgar_si_toca(self) -> None:
+        with self._lock:
+            if time.time() - self._ultima_purga < INTERVALO_PURGA:
+                return
+            self._ultima_purga = time.time()
+            self._local = {c: e for c, e in self._local.items() if e[1] > time.time()}
+        self.backend.purgar()
+
+
+def cacheado(cache: CacheCompartida):
+    """
+    Decorador equivalente a cachetools.cached sobre una CacheCompartida: el resultado de
+    cada combinación de argumentos se comparte entre workers durante 'ttl' segundos y se
+    sigue sirviendo, mientras se refresca, hasta 'max_obsoleto' segundos más.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            return cache.resolver(cache.clave(*args, **kwargs), lambda: func(*args, **kwargs))
+
+        envoltura.cache = cache
+        return envoltura
+
+    return decorador
@@ -0,0 +1,147 @@
+import html
+import os
+import re
+import unicodedata
+
+from data_utils import empresas_ibex35, obtener_snapshot, precios_actuales, valorar_cartera, MarketSnapshot
+
+# Presupuesto de tokens del contexto del chat (sin contar la plantilla de la tarea)
+CHAT_TOKENS_MAX = int(os.getenv("CHAT_TOKENS_MAX", "1500"))
+
+# Caracteres por token en la estimación (texto en español con cifras)
+CARACTERES_POR_TOKEN = 4
+
+# Niveles de recorte: (tabla de mercado completa, turnos de historial, caracteres por mensaje)
+NIVELES_CONTEXTO = [(True, 5, 300), (False, 5, 300), (False, 3, 120), (False, 1, 80), (False, 0, 0)]
+
+# Palabras de los nombres de empresa que no sirven para identificarlas en una pregunta
+PALABRAS_GENERICAS = {"banco", "energias", "properties"}
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación rápida de tokens, sin tokenizador: ~4 caracteres por token."""
+    return -(-len(texto) // CARACTERES_POR_TOKEN)
+
+
+def _sin_acentos(texto: str) -> str:
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode().lower()
+
+
+def tickers_mencionados(pregunta: str) -> list[str]:
+    """
+    Tickers del IBEX35 que menciona la pregunta: por ticker en mayúsculas ('SAN', 'SAN.MC')
+    o por una palabra distintiva del nombre ('santander', 'Telefonica'), sin distinguir
+    mayúsculas ni acentos en los nombres.
+    """
+    siglas = set(re.findall(r"\b[A-Z0-9]{2,5}\b", pregunta))
+    palabras = set(re.findall(r"[a-z0-9]+", _sin_acentos(pregunta)))
+    encontrados = []
+    for nombre, ticker in empresas_ibex35.items():
+        distintivas = set(re.findall(r"[a-z0-9]+", _sin_acentos(nombre))) - PALABRAS_GENERICAS
+        if ticker.split(".")[0] in siglas or distintivas & palabras:
+            encontrados.append(ticker)
+    return encontrados
+
+
+def _pct(valor: float | None) -> str:
+    return f"{valor:+.1f}" if valor is not None else "-"
+
+
+def tabla_mercado(snapshot: MarketSnapshot, tickers: list[str]) -> str:
+    """Tabla compacta (una línea por ticker) con precio, variación 1M/1A, dividendo y capitalización."""
+    filas = ["ticker|precio|1M%|1A%|div%|capB€"]
+    for ticker in tickers:
+        precio = snapshot.precio(ticker)
+        dy = snapshot.dividend_yield(ticker)
+        mc = snapshot.market_cap(ticker)
+        filas.append("|".join([
+            ticker.split(".")[0],
+            f"{precio:.2f}" if precio is not None else "-",
+            _pct(snapshot.crecimiento(ticker, meses=1)),
+            _pct(snapshot.crecimiento(ticker, meses=12)),
+            f"{dy * 100:.1f}" if dy is not None else "-",
+            f"{mc / 1e9:.1f}" if mc else "-",
+        ]))
+    return "\n".join(filas)
+
+
+def resumen_mercado(snapshot: MarketSnapshot) -> str:
+    """Una línea con la amplitud del mercado en el último mes, para cuando no cabe la tabla entera."""
+    variaciones = [
+        v for v in (snapshot.crecimiento(t, meses=1) for t in empresas_ibex35.values()) if v is not None
+    ]
+    if not variaciones:
+        return "IBEX35: sin datos"
+    variaciones.sort()
+    mediana = variaciones[len(variaciones) // 2]
+    suben = sum(v > 0 for v in variaciones)
+    return f"IBEX35 1M: {suben}/{len(variaciones)} suben, mediana {mediana:+.1f}%"
+
+
+def tabla_cartera(owned: dict, precios: dict[str, float | None]) -> str:
+    """Tabla compacta de la cartera del usuario con su ganancia a los precios dados."""
+    if not owned:
+        return "(ninguna)"
+    filas = ["ticker|acciones|coste|precio|ganancia€"]
+    for ticker, pos in valorar_cartera(owned, precios)["posiciones"].items():
+        filas.append("|".join([
+            ticker.split(".")[0],
+            str(pos["shares"]),
+            f"{pos['cost']:.2f}" if pos["cost"] is not None else "-",
+            f"{pos['precio']:.2f}" if pos["precio"] is not None else "-",
+            f"{pos['ganancia']:.2f}" if pos["ganancia"] is not None else "-",
+        ]))
+    return "\n".join(filas)
+
+
+def texto_plano(contenido: str, max_caracteres: int) -> str:
+    """Quita el HTML de una respuesta guardada y la recorta a max_caracteres."""
+    texto = " ".join(html.unescape(re.sub(r"<[^>]+>", " ", contenido)).split())
+    if len(texto) > max_caracteres:
+        texto = texto[:max_caracteres - 1].rstrip() + "…"
+    return texto
+
+
+def resumir_historial(historial: list[dict], turnos: int, max_caracteres: int) -> str:
+    """Últimos 'turnos' intercambios del modo conversación, en texto plano y recortados."""
+    mensajes = [m for m in historial if m.get("modo", "conversacion") == "conversacion"]
+    if turnos <= 0 or not mensajes:
+        return ""
+    return "\n".join(
+        f"U: {texto_plano(m['user'], max_caracteres)}\nA: {texto_plano(m['assistant'], max_caracteres)}"
+        for m in mensajes[-turnos:]
+    )
+
+
+def construir_contexto(pregunta: str, owned: dict, historial: list[dict],
+                       snapshot: MarketSnapshot | None = None,
+                       presupuesto: int = CHAT_TOKENS_MAX,
+                       precios: dict[str, float | None] | None = None) -> str:
+    """
+    Contexto del chat a partir de la foto de mercado: tabla de mercado, cartera (valorada a
+    'precios' o, por defecto, a las cotizaciones actuales) e historial.
+    Si supera 'presupuesto' tokens, la tabla se limita a los tickers de la cartera y los que
+    menciona la pregunta (más una línea de amplitud del mercado) y el historial se resume
+    progresivamente; como último recurso el texto se trunca.
+    """
+    snapshot = snapshot or obtener_snapshot()
+    if precios is None:
+        precios = precios_actuales(list(owned)) if owned else {}
+    cartera = "**Mis acciones**\n" + tabla_cartera(owned, precios)
+    relevantes = list(dict.fromkeys(list(owned) + tickers_mencionados(pregunta)))
+
+    completa = tabla_mercado(snapshot, list(empresas_ibex35.values()))
+    reducida = resumen_mercado(snapshot)
+    if relevantes:
+        reducida += "\n" + tabla_mercado(snapshot, relevantes)
+
+    contexto = ""
+    for tabla_completa, turnos, max_caracteres in NIVELES_CONTEXTO:
+        partes = ["**Mercado IBEX35**\n" + (completa if tabla_completa else reducida), cartera]
+        historia = resumir_historial(historial, turnos, max_caracteres)
+        if historia:
+            partes.append("**Historial reciente**\n" + historia)
+        contexto = "\n\n".join(partes)
+        if estimar_tokens(contexto) <= presupuesto:
+            return contexto
+    return contexto[:presupuesto * CARACTERES_POR_TOKEN]
@@ -1,10 +1,29 @@
-import yfinance as yf
+from __future__ import annotations
+
 import pandas as pd
 import numpy as np
-import plotly.graph_objs as go
-from prophet import Prophet
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
 from datetime import datetime
-from cachetools import TTLCache, cached
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache, TTLCache
+
+from store_utils import obtener_store
+from indicators_utils import obtener_indicadores, screener
+from lazy_utils import ModuloPerezoso, ObjetoPerezoso
+from provider_utils import ErrorProveedor, obtener_proveedor
+from cache_utils import CacheCompartida, cacheado, codificar_dataframe, decodificar_dataframe, registrar_codec
+
+# Plotly y Prophet se importan en el primer uso, no al arrancar
+go = ModuloPerezoso("plotly.graph_objs")
+pio = ModuloPerezoso("plotly.io")
+Prophet = ObjetoPerezoso("prophet", "Prophet")
+
+log = logging.getLogger(__name__)
 
 # Diccionario de tickers del IBEX 35
 empresas_ibex35 = {
@@ -47,27 +66,95 @@ empresas_ibex35 = {
 
 def descargar_historico(ticker: str, start: str, end: str) -> pd.DataFrame:
     """
-    Descarga datos históricos de Yahoo Finance para el ticker entre fechas start y end.
+    Devuelve los datos históricos del ticker entre fechas start y end (end excluido),
+    leídos del almacén local de precios tras traer sólo las barras nuevas de Yahoo Finance.
     Devuelve un DataFrame con columna 'Precio'.
     """
-    try:
-        data = yf.download(ticker, start=start, end=end, progress=False)
-    except Exception:
-        return pd.DataFrame()
+    store = obtener_store()
+    store.actualizar([ticker])
+    data = store.leer(ticker, start=start, end=end)
     if data.empty:
-        return data
-    precio_col = "Adj Close" if "Adj Close" in data.columns else "Close"
-    data = data.rename(columns={precio_col: "Precio"})
+        return pd.DataFrame()
     return data[["Precio"]].copy()
 
-def generar_figura_historica(df: pd.DataFrame, nombre_empresa: str) -> go.Figure:
+# Puntos por serie que se envían a los gráficos si el cliente no indica su anchura
+MAX_PUNTOS_GRAFICO = 1000
+
+
+def indices_lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """
+    Índices de los n puntos que conserva el algoritmo Largest-Triangle-Three-Buckets:
+    mantiene el primero y el último y, en cada cubeta intermedia, el punto que forma el
+    triángulo de mayor área con el punto elegido antes y la media de la cubeta siguiente,
+    con lo que se preservan los máximos y mínimos visibles.
+    """
+    m = len(y)
+    if n >= m or n < 3:
+        return np.arange(m)
+    bordes = np.linspace(1, m - 1, n - 1).astype(int)
+    indices = np.empty(n, dtype=int)
+    indices[0], indices[-1] = 0, m - 1
+    a = 0
+    for i in range(n - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        sig_fin = bordes[i + 2] if i + 2 < n - 1 else m
+        cx = x[fin:sig_fin].mean()
+        cy = y[fin:sig_fin].mean()
+        areas = np.abs((x[a] - cx) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (cy - y[a]))
+        a = ini + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def _eje_numerico(x) -> np.ndarray:
+    """Convierte un eje (fechas o números) en float para calcular áreas."""
+    x = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return (x - x.iloc[0]).dt.total_seconds().to_numpy() / 86400
+    return x.to_numpy(dtype=float)
+
+
+def reducir_serie(x, y, max_puntos: int | None) -> tuple[pd.Series, pd.Series]:
     """
-    Genera un gráfico Plotly de la evolución histórica de precios para df.
+    Reduce (x, y) a como mucho max_puntos con LTTB, descartando antes los huecos (NaN).
+    Con max_puntos=None devuelve la serie completa.
     """
+    x = pd.Series(np.asarray(x))
+    y = pd.Series(np.asarray(y, dtype=float))
+    validos = y.notna().to_numpy()
+    x, y = x[validos].reset_index(drop=True), y[validos].reset_index(drop=True)
+    if max_puntos is None or len(y) <= max_puntos:
+        return x, y
+    indices = indices_lttb(_eje_numerico(x), y.to_numpy(), max_puntos)
+    return x.iloc[indices], y.iloc[indices]
+
+
+def reducir_banda(df: pd.DataFrame, x: str, columnas: list[str], max_puntos: int | None) -> pd.DataFrame:
+    """
+    Reduce varias series que comparten eje (p.ej. una banda de confianza y su media) con la
+    unión de los índices LTTB de cada una, para que todas conserven sus extremos y el mismo eje.
+    """
+    df = df.reset_index(drop=True)
+    if max_puntos is None or len(df) <= max_puntos:
+        return df
+    eje = _eje_numerico(df[x])
+    indices = np.unique(np.concatenate([
+        indices_lttb(eje, df[col].to_numpy(dtype=float), max_puntos) for col in columnas
+    ]))
+    return df.iloc[indices]
+
+
+def generar_figura_historica(df: pd.DataFrame, nombre_empresa: str,
+                             max_puntos: int | None = MAX_PUNTOS_GRAFICO) -> go.Figure:
+    """
+    Genera un gráfico Plotly de la evolución histórica de precios para df,
+    reducido a max_puntos con LTTB (None = resolución completa).
+    """
+    x, y = reducir_serie(df.index, df["Precio"], max_puntos)
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=df.index,
-        y=df["Precio"],
+        x=x,
+        y=y,
         mode="lines",
         name=f'Precio {nombre_empresa}'
     ))
@@ -81,44 +168,251 @@ def generar_figura_historica(df: pd.DataFrame, nombre_empresa: str) -> go.Figure
 
 def preparar_datos_prophet(ticker: str, anios: int = 5) -> pd.DataFrame | None:
     """
-    Prepara DataFrame para Prophet: columnas 'ds' y 'y' con los últimos 'anios' años.
+    Prepara DataFrame para Prophet: columnas 'ds' y 'y' con los últimos 'anios' años,
+    leídos del almacén local de precios.
     """
-    try:
-        data_full = yf.download(
-            ticker,
-            start="2000-01-01",
-            end=(datetime.today() + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
-            progress=False
-        )
-    except Exception:
-        return None
-    if data_full.empty:
-        return None
-    precio_col = "Adj Close" if "Adj Close" in data_full.columns else "Close"
-    data_full["Precio"] = data_full[precio_col]
     fecha_lim = datetime.today() - pd.DateOffset(years=anios)
-    data_reciente = data_full[data_full.index >= fecha_lim].copy()
+    data_reciente = descargar_historico(ticker, start=fecha_lim, end=datetime.today() + pd.Timedelta(days=1))
     if data_reciente.empty:
         return None
     df_prophet = data_reciente.reset_index()[["Date", "Precio"]].dropna()
     df_prophet.rename(columns={"Date": "ds", "Precio": "y"}, inplace=True)
     return df_prophet
 
-def generar_prediccion(df_prophet: pd.DataFrame, tipo: str, nombre_empresa: str) -> go.Figure:
+# Cache de predicciones ajustadas, acotada por tamaño (LRU). La clave incluye la huella de la serie,
+# por lo que una barra nueva genera otra clave y la entrada antigua acaba expulsada.
+FORECAST_CACHE_MAXSIZE = 128
+_forecast_cache = LRUCache(maxsize=FORECAST_CACHE_MAXSIZE)
+_forecast_lock = threading.Lock()
+
+
+def _clave_forecast(df_prophet: pd.DataFrame, periodo: int, ticker: str | None) -> tuple:
+    """
+    Clave de cache: (ticker, última fecha observada, horizonte, huella de los valores de la serie).
+    """
+    ultimo = pd.Timestamp(df_prophet["ds"].max()).isoformat()
+    huella = int(pd.util.hash_pandas_object(df_prophet[["ds", "y"]], index=False).sum())
+    return (ticker, ultimo, periodo, huella)
+
+
+def _clave_forecast_str(clave: tuple) -> str:
+    """Representación de la clave (sin ticker) con la que se persiste el forecast en el almacén."""
+    _, ultimo, periodo, huella = clave
+    return f"{ultimo}|{periodo}|{huella}"
+
+
+def _ajustar_prophet(df_prophet: pd.DataFrame, periodo: int) -> pd.DataFrame:
+    """
+    Ajusta Prophet y devuelve ds, yhat, yhat_lower, yhat_upper para el histórico más 'periodo' días.
+    """
+    model = Prophet()
+    model.fit(df_prophet)
+    future = model.make_future_dataframe(periods=periodo)
+    return model.predict(future)[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+
+
+# Anchura del intervalo de confianza, igual que el interval_width por defecto de Prophet
+INTERVALO_CONFIANZA = 0.8
+
+
+def _ajustar_rapido(df_prophet: pd.DataFrame, periodo: int, n_simulaciones: int = 500,
+                    semilla: int = 0) -> pd.DataFrame:
+    """
+    Predicción rápida en NumPy con el mismo contrato que _ajustar_prophet (ds, yhat, yhat_lower,
+    yhat_upper para el histórico más 'periodo' días naturales):
+      - Tendencia: deriva log-lineal ajustada por mínimos cuadrados sobre log(y), anclada al último dato.
+      - Intervalo: bootstrap de los residuos de los retornos diarios, con todas las trayectorias
+        simuladas a la vez como una matriz (n_simulaciones x barras).
+    """
+    ds = pd.to_datetime(df_prophet["ds"]).to_numpy()
+    log_y = np.log(np.clip(df_prophet["y"].to_numpy(dtype=float), 1e-9, None))
+    dias = (ds - ds[0]) / np.timedelta64(1, "D")
+    pendiente, ordenada = np.polyfit(dias, log_y, 1) if len(dias) > 1 else (0.0, log_y[0])
+
+    retornos = np.diff(log_y)
+    residuos = retornos - retornos.mean() if len(retornos) else np.zeros(1)
+    # Barras de mercado por día natural, para traducir el horizonte en días a nº de barras
+    barras_por_dia = len(retornos) / dias[-1] if len(dias) > 1 and dias[-1] > 0 else 1.0
+
+    alfa = (1 - INTERVALO_CONFIANZA) / 2
+    futuro = pd.date_range(pd.Timestamp(ds[-1]) + pd.Timedelta(days=1), periods=periodo, freq="D")
+    h = np.arange(1, periodo + 1)
+    barras = np.round(h * barras_por_dia).astype(int)
+
+    rng = np.random.default_rng(semilla)
+    muestras = rng.choice(residuos, size=(n_simulaciones, max(int(barras.max(initial=0)), 1)))
+    acumulados = np.concatenate([np.zeros((n_simulaciones, 1)), muestras.cumsum(axis=1)], axis=1)
+    inferior, superior = np.quantile(acumulados, [alfa, 1 - alfa], axis=0)
+
+    base = log_y[-1] + pendiente * h
+    yhat_futuro = np.exp(base)
+    lower_futuro = np.exp(base + inferior[barras])
+    upper_futuro = np.exp(base + superior[barras])
+
+    # Sobre el histórico, la recta ajustada con la dispersión de sus residuos
+    ajuste = ordenada + pendiente * dias
+    dispersion = np.quantile(log_y - ajuste, [alfa, 1 - alfa])
+    return pd.DataFrame({
+        "ds": np.concatenate([ds, futuro.to_numpy()]),
+        "yhat": np.concatenate([np.exp(ajuste), yhat_futuro]),
+        "yhat_lower": np.concatenate([np.exp(ajuste + dispersion[0]), lower_futuro]),
+        "yhat_upper": np.concatenate([np.exp(ajuste + dispersion[1]), upper_futuro])
+    })
+
+
+# Función de ajuste de cada motor: (df_prophet, periodo) -> forecast
+AJUSTADORES = {
+    "prophet": _ajustar_prophet,
+    "rapido": _ajustar_rapido
+}
+
+
+def calcular_forecast(df_prophet: pd.DataFrame, tipo: str, ticker: str | None = None,
+                      motor: str = "prophet") -> pd.DataFrame:
     """
-    Ajusta un modelo Prophet sobre df_prophet. 'tipo' = "corto" (30 días) o "largo" (365 días).
+    Ajusta el motor indicado ("prophet" o "rapido") sobre df_prophet y devuelve el forecast
+    (ds, yhat, yhat_lower, yhat_upper) para el histórico más 30 ("corto") o 365 ("largo") días.
+    El resultado se cachea por (ticker, última fecha, horizonte), así que mientras no llegue
+    una barra nueva las vistas repetidas no vuelven a ajustar el modelo. Si hay ticker, los
+    forecasts de Prophet también se consultan y guardan en el almacén de precios, donde los deja
+    precalculados predecir_universo.
+    """
+    if motor not in AJUSTADORES:
+        raise ValueError(f"Motor de predicción desconocido: {motor}")
+    periodo = 30 if tipo == "corto" else 365
+    clave = _clave_forecast(df_prophet, periodo, ticker)
+    clave_cache = clave if motor == "prophet" else clave + (motor,)
+    with _forecast_lock:
+        forecast = _forecast_cache.get(clave_cache)
+    if forecast is not None:
+        return forecast.copy()
+
+    if motor != "prophet":
+        forecast = AJUSTADORES[motor](df_prophet, periodo)
+    else:
+        store = obtener_store() if ticker else None
+        if store is not None:
+            forecast = store.leer_forecast(ticker, _clave_forecast_str(clave))
+        if forecast is None:
+            forecast = _ajustar_prophet(df_prophet, periodo)
+            if store is not None:
+                store.guardar_forecast(ticker, _clave_forecast_str(clave), periodo, forecast)
+
+    with _forecast_lock:
+        _forecast_cache[clave_cache] = forecast
+    return forecast.copy()
+
+
+# Cola por la que cada proceso del pool de predecir_universo avisa de cuándo empieza un ajuste
+_inicios_worker = None
+
+
+def _iniciar_worker(inicios) -> None:
+    global _inicios_worker
+    _inicios_worker = inicios
+
+
+def _ajustar_en_worker(ticker: str, df_prophet: pd.DataFrame, periodo: int) -> tuple[pd.DataFrame, float]:
+    """Tarea del pool de procesos: ajusta Prophet y devuelve (forecast, segundos de ajuste)."""
+    _inicios_worker.put((ticker, time.time()))
+    inicio = time.perf_counter()
+    forecast = _ajustar_prophet(df_prophet, periodo)
+    return forecast, time.perf_counter() - inicio
+
+
+def predecir_universo(tipo: str = "largo", tickers: list[str] | None = None, anios: int = 5,
+                      max_workers: int | None = None, timeout: float = 120.0) -> dict:
+    """
+    Ajusta Prophet para todos los tickers (por defecto, el IBEX35 completo) en paralelo
+    sobre un multiprocessing.Pool de 'max_workers' procesos (por defecto, uno por núcleo).
+    'timeout' son los segundos máximos de ajuste por ticker, contados desde que un proceso
+    lo empieza (no desde que se encola); si alguno los excede, al terminar el resto se
+    termina el pool, con sus procesos atascados.
+    Los resultados alimentan la cache de calcular_forecast y el almacén de precios, de modo
+    que las peticiones posteriores no esperan a ningún ajuste.
+    Devuelve {"forecasts": {ticker: df}, "tiempos": {ticker: segundos}, "errores": {ticker: motivo}}.
+    """
+    tickers = list(tickers or empresas_ibex35.values())
+    periodo = 30 if tipo == "corto" else 365
+    resultado = {"forecasts": {}, "tiempos": {}, "errores": {}}
+
+    obtener_store().actualizar(tickers)
+    datos = {}
+    for ticker in tickers:
+        df_prophet = preparar_datos_prophet(ticker, anios=anios)
+        if df_prophet is None or df_prophet.empty:
+            resultado["errores"][ticker] = "sin datos"
+        else:
+            datos[ticker] = df_prophet
+    if not datos:
+        return resultado
+
+    inicios_cola = multiprocessing.SimpleQueue()
+    terminados = queue.Queue()
+    pool = multiprocessing.Pool(max_workers, initializer=_iniciar_worker, initargs=(inicios_cola,))
+    for ticker, df in datos.items():
+        pool.apply_async(
+            _ajustar_en_worker, (ticker, df, periodo),
+            callback=lambda r, t=ticker: terminados.put((t, r, None)),
+            error_callback=lambda e, t=ticker: terminados.put((t, None, e))
+        )
+    inicios: dict = {}
+    pendientes = set(datos)
+    excedidos = False
+    try:
+        while pendientes:
+            try:
+                ticker, valor, error = terminados.get(timeout=0.5)
+            except queue.Empty:
+                pass
+            else:
+                if ticker not in pendientes:
+                    continue
+                pendientes.discard(ticker)
+                if error is not None:
+                    resultado["errores"][ticker] = repr(error)
+                else:
+                    forecast, segundos = valor
+                    resultado["forecasts"][ticker] = forecast
+                    resultado["tiempos"][ticker] = segundos
+                    clave = _clave_forecast(datos[ticker], periodo, ticker)
+                    with _forecast_lock:
+                        _forecast_cache[clave] = forecast
+                    obtener_store().guardar_forecast(ticker, _clave_forecast_str(clave), periodo, forecast)
+            while not inicios_cola.empty():
+                ticker, inicio = inicios_cola.get()
+                inicios[ticker] = inicio
+            ahora = time.time()
+            for ticker in [t for t in pendientes if t in inicios and ahora - inicios[t] > timeout]:
+                resultado["errores"][ticker] = f"timeout ({timeout:.0f}s)"
+                pendientes.discard(ticker)
+                excedidos = True
+    finally:
+        # Un proceso atascado en Stan no atiende a close(): al salir del bucle sólo siguen
+        # ocupados los ajustes que excedieron el timeout (o todos, si hubo una excepción),
+        # así que se termina el pool
+        if excedidos or pendientes:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+    return resultado
+
+
+def generar_prediccion(df_prophet: pd.DataFrame, tipo: str, nombre_empresa: str,
+                       ticker: str | None = None, motor: str = "prophet",
+                       max_puntos: int | None = MAX_PUNTOS_GRAFICO) -> go.Figure:
+    """
+    Obtiene la predicción sobre df_prophet (ver calcular_forecast, cacheada por ticker).
+    'tipo' = "corto" (30 días) o "largo" (365 días); 'motor' = "prophet" o "rapido".
+    Cada serie se reduce a max_puntos con LTTB (None = resolución completa).
     Devuelve un Figure con:
       - Banda de incertidumbre suavizada (lower_smooth, upper_smooth)
       - Línea de predicción media suavizada (yhat_smooth)
       - Línea histórico real (y)
     El primer punto de la predicción coincide exactamente con el último dato histórico, para que no haya desconexión.
     """
-    model = Prophet()
-    model.fit(df_prophet)
-
-    periodo = 30 if tipo == "corto" else 365
-    future = model.make_future_dataframe(periods=periodo)
-    forecast = model.predict(future)
+    forecast = calcular_forecast(df_prophet, tipo, ticker, motor)
 
     ultimo = df_prophet["ds"].max()
     y_ultimo = df_prophet["y"].iloc[-1]
@@ -139,6 +433,10 @@ def generar_prediccion(df_prophet: pd.DataFrame, tipo: str, nombre_empresa: str)
     forecast_sel = pd.concat([punto_inicio, forecast_sel], ignore_index=True)
     forecast_sel.sort_values(by="ds", inplace=True)
     forecast_sel.reset_index(drop=True, inplace=True)
+    forecast_sel = reducir_banda(
+        forecast_sel, "ds", ["yhat_smooth", "lower_smooth", "upper_smooth"], max_puntos
+    )
+    hist_x, hist_y = reducir_serie(df_prophet["ds"], df_prophet["y"], max_puntos)
 
     fig = go.Figure()
 
@@ -173,8 +471,8 @@ def generar_prediccion(df_prophet: pd.DataFrame, tipo: str, nombre_empresa: str)
 
     # Línea histórico real
     fig.add_trace(go.Scatter(
-        x=df_prophet["ds"],
-        y=df_prophet["y"],
+        x=hist_x,
+        y=hist_y,
         mode="lines",
         line=dict(color="black", width=1),
         name="Histórico real"
@@ -209,37 +507,58 @@ def calcular_RSI(serie: pd.Series, period: int = 14) -> pd.Series:
     return rsi
 
 
-def calcular_indicadores_tecnicos(ticker: str) -> tuple[go.Figure, go.Figure] | None:
+def obtener_indicadores_ibex35(anios: int = 1) -> dict[str, pd.DataFrame]:
+    """
+    Indicadores técnicos (SMA, EMA, RSI de Wilder, MACD, Bollinger) del último año para todo
+    el IBEX35, calculados de una pasada sobre el panel de precios y cacheados por versión de datos.
+    """
+    return obtener_indicadores(list(empresas_ibex35.values()), anios=anios)
+
+
+def screener_ibex35() -> pd.DataFrame:
+    """
+    Última lectura de los indicadores y señales técnicas de cada empresa del IBEX35.
     """
-    Descarga histórico de 1 año y calcula SMA50, SMA200, RSI.
+    return screener(obtener_indicadores_ibex35())
+
+
+def calcular_indicadores_tecnicos(ticker: str,
+                                  max_puntos: int | None = MAX_PUNTOS_GRAFICO) -> tuple[go.Figure, go.Figure] | None:
+    """
+    Toma del motor de indicadores (compartido con el screener y el chat) el último año de
+    precio, SMA50 y SMA200 del ticker. El RSI del gráfico sigue siendo el de calcular_RSI
+    (medias simples), no el de Wilder del motor. Cada serie se reduce a max_puntos con LTTB
+    (None = resolución completa).
     Retorna (fig_precio, fig_rsi) o None si no hay datos.
     """
-    end = datetime.today().strftime("%Y-%m-%d")
-    start = (datetime.today() - pd.DateOffset(years=1)).strftime("%Y-%m-%d")
-    df = descargar_historico(ticker, start, end)
-    if df is None or df.empty:
+    if ticker in empresas_ibex35.values():
+        indicadores = obtener_indicadores_ibex35()
+    else:
+        indicadores = obtener_indicadores([ticker])
+    df = pd.DataFrame({
+        nombre: indicadores[nombre][ticker] for nombre in ("Precio", "SMA50", "SMA200")
+    }).dropna(subset=["Precio"])
+    if df.empty:
         return None
-
-    df["SMA50"] = df["Precio"].rolling(window=50).mean()
-    df["SMA200"] = df["Precio"].rolling(window=200).mean()
     df["RSI"] = calcular_RSI(df["Precio"])
+    series = {col: reducir_serie(df.index, df[col], max_puntos) for col in df.columns}
 
     fig_precio = go.Figure()
     fig_precio.add_trace(go.Scatter(
-        x=df.index,
-        y=df["Precio"],
+        x=series["Precio"][0],
+        y=series["Precio"][1],
         mode="lines",
         name="Precio"
     ))
     fig_precio.add_trace(go.Scatter(
-        x=df.index,
-        y=df["SMA50"],
+        x=series["SMA50"][0],
+        y=series["SMA50"][1],
         mode="lines",
         name="SMA 50"
     ))
     fig_precio.add_trace(go.Scatter(
-        x=df.index,
-        y=df["SMA200"],
+        x=series["SMA200"][0],
+        y=series["SMA200"][1],
         mode="lines",
         name="SMA 200"
     ))
@@ -252,8 +571,8 @@ def calcular_indicadores_tecnicos(ticker: str) -> tuple[go.Figure, go.Figure] |
 
     fig_rsi = go.Figure()
     fig_rsi.add_trace(go.Scatter(
-        x=df.index,
-        y=df["RSI"],
+        x=series["RSI"][0],
+        y=series["RSI"][1],
         mode="lines",
         name="RSI"
     ))
@@ -266,15 +585,88 @@ def calcular_indicadores_tecnicos(ticker: str) -> tuple[go.Figure, go.Figure] |
 
     return fig_precio, fig_rsi
 
+# Figuras que se sirven como JSON a la página de análisis
+FIGURAS = ("prediccion", "tecnico", "rsi")
+
+# Cache LRU de figuras ya serializadas, por (ticker, versión de la figura)
+_figuras_cache = LRUCache(maxsize=256)
+_figuras_lock = threading.Lock()
+
+
+def nombre_empresa(ticker: str) -> str:
+    """Nombre de la empresa del IBEX35 para el ticker (o el propio ticker si no está)."""
+    return next((nombre for nombre, t in empresas_ibex35.items() if t == ticker), ticker)
+
+
+def _figura_sin_plantilla(fig: go.Figure) -> str:
+    """
+    Serializa la figura a JSON sin la plantilla de estilo, que el navegador pide una sola vez
+    (ver plantilla_figuras_json) y así no viaja repetida en cada figura.
+    """
+    datos = fig.to_plotly_json()
+    datos["layout"].pop("template", None)
+    return pio.json.to_json_plotly(datos)
+
+
+def plantilla_figuras_json() -> str:
+    """JSON de la plantilla 'plotly_white' común a todas las figuras."""
+    return pio.json.to_json_plotly(pio.templates["plotly_white"].to_plotly_json())
+
+
+def version_figura(ticker: str, figura: str, motor: str = "prophet",
+                   max_puntos: int | None = MAX_PUNTOS_GRAFICO) -> str:
+    """
+    Versión de una figura: cambia sólo cuando cambian los datos del ticker en el almacén
+    (o se pide otro motor o resolución). Sirve como clave de cache y como ETag.
+    """
+    store = obtener_store()
+    store.actualizar([ticker])
+    sufijo = f"-{motor}" if figura == "prediccion" else ""
+    resolucion = "completa" if max_puntos is None else f"p{max_puntos}"
+    return f"{figura}{sufijo}-{resolucion}-{store.version([ticker])}"
+
+
+def figura_json(ticker: str, figura: str, motor: str = "prophet",
+                max_puntos: int | None = MAX_PUNTOS_GRAFICO) -> tuple[str, str | None]:
+    """
+    Devuelve (versión, JSON de la figura) para 'prediccion' (1 año), 'tecnico' (precio y medias)
+    o 'rsi' del ticker, con cada serie reducida a max_puntos (None = resolución completa).
+    El JSON es None si no hay datos.
+    Las figuras se cachean ya serializadas por versión de datos, de modo que las vistas
+    repetidas no vuelven a construir ni validar objetos Plotly.
+    """
+    if figura not in FIGURAS:
+        raise ValueError(f"Figura desconocida: {figura}")
+    version = version_figura(ticker, figura, motor, max_puntos)
+    with _figuras_lock:
+        if (ticker, version) in _figuras_cache:
+            return version, _figuras_cache[(ticker, version)]
+
+    nuevas = {}
+    if figura == "prediccion":
+        df_prophet = preparar_datos_prophet(ticker, anios=5)
+        fig = None
+        if df_prophet is not None and not df_prophet.empty:
+            fig = generar_prediccion(df_prophet, "largo", nombre_empresa(ticker), ticker, motor, max_puntos)
+        nuevas[version] = _figura_sin_plantilla(fig) if fig is not None else None
+    else:
+        # Las figuras técnica y de RSI salen del mismo cálculo: se cachean juntas
+        tech = calcular_indicadores_tecnicos(ticker, max_puntos)
+        for nombre, fig in zip(("tecnico", "rsi"), tech or (None, None)):
+            nuevas[version_figura(ticker, nombre, max_puntos=max_puntos)] = _figura_sin_plantilla(fig) if fig is not None else None
+
+    with _figuras_lock:
+        for v, payload in nuevas.items():
+            _figuras_cache[(ticker, v)] = payload
+    return version, nuevas[version]
+
+
 def obtener_info_fundamental(ticker: str) -> dict:
     """
     Obtiene información fundamental (P/E, P/B, dividend yield, etc.).
     Normaliza Dividend Yield si viene > 1.
     """
-    try:
-        info = yf.Ticker(ticker).info or {}
-    except Exception:
-        return {}
+    info = _info_segura(ticker)
 
     # Normalizamos Dividend Yield
     dy_raw = info.get("dividendYield", None)
@@ -284,7 +676,7 @@ def obtener_info_fundamental(ticker: str) -> dict:
             if dy_val > 1:
                 dy_val = dy_val / 100
             dividend_yield = round(dy_val * 100, 2)
-        except:
+        except (TypeError, ValueError):
             dividend_yield = "N/A"
     else:
         dividend_yield = "N/A"
@@ -301,101 +693,267 @@ def obtener_info_fundamental(ticker: str) -> dict:
     }
     return datos
 
-def resumen_acciones() -> str:
+# Número máximo de consultas simultáneas de fundamentales (.info) a yfinance
+MAX_WORKERS_INFO = 8
+
+
+def _extraer_cierres(data: pd.DataFrame, tickers: list[str]) -> pd.DataFrame:
     """
-    Compila un resumen en texto de todas las empresas del IBEX35:
-    Precio actual, Dividend Yield, Market Cap, Crecimiento último mes.
+    Extrae de la descarga agrupada por ticker un DataFrame fechas x tickers con los cierres.
+    Usa 'Adj Close' si existe y 'Close' en caso contrario.
     """
-    resumen = ""
-    for nombre, ticker in empresas_ibex35.items():
-        try:
-            accion = yf.Ticker(ticker)
-            df_1d = accion.history(period="1d")
-            precio_actual = df_1d["Close"].iloc[-1] if not df_1d.empty else None
-            precio_str = f"{precio_actual:.2f}" if precio_actual is not None else "N/A"
-            info = accion.info or {}
-            dy = info.get("dividendYield")
-            if dy is not None:
-                try:
-                    # Normalizamos si viene >1
-                    if dy > 1:
-                        dy = dy / 100
-                    dy_str = f"{dy*100:.2f}%"
-                except:
-                    dy_str = "N/A"
-            else:
-                dy_str = "N/A"
-            mc = info.get("marketCap")
-            mc_str = f"{mc/1e6:.0f} M€" if mc is not None else "N/A"
-            df_1m = accion.history(period="1mo")
-            if not df_1m.empty and len(df_1m["Close"]) >= 2:
-                precio_ini = df_1m["Close"].iloc[0]
-                precio_fin = df_1m["Close"].iloc[-1]
-                crecimiento = ((precio_fin - precio_ini)/precio_ini)*100
-                crecimiento_str = f"{crecimiento:.2f}%"
-            else:
-                crecimiento_str = "N/A"
-            resumen += (
-                f"- **{nombre}** ({ticker}): Precio: {precio_str} €, "
-                f"Dividend Yield: {dy_str}, Market Cap: {mc_str}, Crecimiento 1M: {crecimiento_str}\n"
-            )
-        except Exception:
-            resumen += f"- **{nombre}** ({ticker}): Error obteniendo datos\n"
-    return resumen
-def resumen_detallado() -> str:
+    cierres = {}
+    if data is None or data.empty:
+        return pd.DataFrame(columns=tickers, dtype=float)
+    for ticker in tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            if ticker not in data.columns.get_level_values(0):
+                continue
+            datos_ticker = data[ticker]
+        else:
+            # Con un único ticker yfinance puede devolver columnas planas
+            datos_ticker = data
+        precio_col = "Adj Close" if "Adj Close" in datos_ticker.columns else "Close"
+        if precio_col in datos_ticker.columns:
+            cierres[ticker] = datos_ticker[precio_col]
+    return pd.DataFrame(cierres).reindex(columns=tickers).sort_index()
+
+
+def _info_segura(ticker: str) -> dict:
     """
-    Genera un resumen extendido de todas las empresas del IBEX35,
-    incluyendo precio actual, dividendo bruto (€) y porcentaje, y market cap.
+    Devuelve el diccionario .info del ticker o {} si el proveedor de datos falla.
     """
-    resumen = ""
-    for nombre, ticker in empresas_ibex35.items():
-        # 1) Obtenemos precio actual
-        try:
-            df_1d = yf.Ticker(ticker).history(period="1d")
-            precio = df_1d["Close"].iloc[-1]
-        except:
-            precio = None
+    try:
+        return obtener_proveedor().info(ticker)
+    except ErrorProveedor as e:
+        log.warning("Sin información fundamental de %s: %s", ticker, e)
+        return {}
+
+
+class MarketSnapshot:
+    """
+    Foto del mercado de todo el universo del IBEX35 cargada de una sola vez:
+      - cierres: DataFrame fechas x tickers con los cierres del último año (una única descarga agrupada)
+      - info: diccionario ticker -> .info de yfinance (consultas concurrentes acotadas)
+    Las funciones de resumen son vistas baratas sobre esta foto.
+    """
+
+    def __init__(self, cierres: pd.DataFrame, info: dict[str, dict]):
+        self.cierres = cierres
+        self.info = info
+
+    @classmethod
+    def cargar(cls, tickers: list[str] | None = None, period: str = "1y",
+               max_workers: int = MAX_WORKERS_INFO) -> "MarketSnapshot":
+        """
+        Descarga los precios de todos los tickers en una única descarga agrupada por ticker
+        y la información fundamental con un pool de hilos de tamaño max_workers.
+        Si no se pueden descargar los precios propaga ErrorProveedor, para que no se cachee
+        una foto vacía en lugar de la última buena.
+        """
+        tickers = list(tickers or empresas_ibex35.values())
+        data = obtener_proveedor().descargar(tickers, period=period)
+        cierres = _extraer_cierres(data, tickers)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers)))) as pool:
+            info = dict(zip(tickers, pool.map(_info_segura, tickers)))
+
+        return cls(cierres, info)
+
+    @property
+    def fecha(self) -> pd.Timestamp | None:
+        """Fecha de la última barra disponible en la foto."""
+        if self.cierres.empty:
+            return None
+        return self.cierres.index.max()
+
+    def serie(self, ticker: str) -> pd.Series:
+        """Serie de cierres del ticker sin huecos (vacía si no hay datos)."""
+        if ticker not in self.cierres.columns:
+            return pd.Series(dtype=float)
+        return self.cierres[ticker].dropna()
+
+    def precio(self, ticker: str) -> float | None:
+        """Último cierre disponible del ticker."""
+        serie = self.serie(ticker)
+        return float(serie.iloc[-1]) if not serie.empty else None
 
-        precio_str = f"{precio:.2f} €" if precio else "N/A"
+    def crecimiento(self, ticker: str, meses: int) -> float | None:
+        """
+        Variación porcentual entre el primer cierre de los últimos 'meses' meses y el último cierre.
+        """
+        serie = self.serie(ticker)
+        if serie.empty:
+            return None
+        ventana = serie[serie.index >= serie.index[-1] - pd.DateOffset(months=meses)]
+        if len(ventana) < 2 or not ventana.iloc[0]:
+            return None
+        return float((ventana.iloc[-1] - ventana.iloc[0]) / ventana.iloc[0] * 100)
 
-        # 2) Dividendo bruto y %
+    def dividendo(self, ticker: str) -> float:
+        """Dividendo anual bruto (€/acción), 0.0 si no está disponible."""
+        info = self.info.get(ticker, {})
+        raw_div = info.get("trailingAnnualDividendRate") or info.get("dividendRate") or 0.0
         try:
-            info = yf.Ticker(ticker).info or {}
-            raw_div = info.get("trailingAnnualDividendRate") or info.get("dividendRate") or 0.0
-            div_bruto = float(raw_div)
-            div_pct = f"{(div_bruto / precio * 100):.2f}%" if precio else "N/A"
-        except:
-            div_bruto, div_pct = 0.0, "N/A"
-
-        # 3) Market cap
+            return float(raw_div)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def dividend_yield(self, ticker: str) -> float | None:
+        """Dividend yield en tanto por uno, normalizado si yfinance lo da en porcentaje."""
+        dy = self.info.get(ticker, {}).get("dividendYield")
+        if dy is None:
+            return None
+        try:
+            dy = float(dy)
+        except (TypeError, ValueError):
+            return None
+        return dy / 100 if dy > 1 else dy
+
+    def market_cap(self, ticker: str) -> float | None:
+        """Capitalización bursátil en euros."""
+        mc = self.info.get(ticker, {}).get("marketCap")
         try:
-            mc = info.get("marketCap")
-            mc_str = f"{mc/1e9:.2f}B €" if mc else "N/A"
-        except:
-            mc_str = "N/A"
+            return float(mc) if mc else None
+        except (TypeError, ValueError):
+            return None
+
+
+def _codificar_snapshot(snapshot: MarketSnapshot) -> bytes:
+    return json.dumps(
+        {"cierres": codificar_dataframe(snapshot.cierres), "info": snapshot.info}, default=str
+    ).encode()
+
+
+def _decodificar_snapshot(datos: bytes) -> MarketSnapshot:
+    contenido = json.loads(datos)
+    return MarketSnapshot(decodificar_dataframe(contenido["cierres"]), contenido["info"])
 
+
+registrar_codec("snapshot", MarketSnapshot, _codificar_snapshot, _decodificar_snapshot)
+
+# Cache de la foto de mercado, TTL de 1 hora, compartida por todos los workers del host
+_snapshot_cache = CacheCompartida("snapshot", ttl=3600)
+
+@cacheado(_snapshot_cache)
+def _snapshot_cacheado() -> MarketSnapshot:
+    return MarketSnapshot.cargar()
+
+
+def obtener_snapshot() -> MarketSnapshot:
+    """
+    Devuelve la foto de mercado del IBEX35, cacheada 1 hora entre todos los workers.
+    Si el proveedor falla se sigue sirviendo la última foto buena (obsoleta) mientras se
+    reintenta; sólo sin ninguna anterior se devuelve una foto vacía, que no se cachea.
+    """
+    try:
+        return _snapshot_cacheado()
+    except ErrorProveedor as e:
+        log.warning("Sin foto de mercado: %s", e)
+        return MarketSnapshot(pd.DataFrame(), {})
+
+
+def resumen_acciones() -> str:
+    """
+    Compila un resumen en texto de todas las empresas del IBEX35:
+    Precio actual, Dividend Yield, Market Cap, Crecimiento último mes.
+    """
+    snapshot = obtener_snapshot()
+    resumen = ""
+    for nombre, ticker in empresas_ibex35.items():
+        precio = snapshot.precio(ticker)
+        precio_str = f"{precio:.2f}" if precio is not None else "N/A"
+        dy = snapshot.dividend_yield(ticker)
+        dy_str = f"{dy*100:.2f}%" if dy is not None else "N/A"
+        mc = snapshot.market_cap(ticker)
+        mc_str = f"{mc/1e6:.0f} M€" if mc is not None else "N/A"
+        crecimiento = snapshot.crecimiento(ticker, meses=1)
+        crecimiento_str = f"{crecimiento:.2f}%" if crecimiento is not None else "N/A"
         resumen += (
-            f"- **{nombre}** ({ticker}): Precio {precio_str}, "
-            f"Dividendo {div_bruto:.2f} € ({div_pct}), Market Cap {mc_str}\n"
+            f"- **{nombre}** ({ticker}): Precio: {precio_str} €, "
+            f"Dividend Yield: {dy_str}, Market Cap: {mc_str}, Crecimiento 1M: {crecimiento_str}\n"
         )
     return resumen
 
+# Cotizaciones recientes por ticker, TTL de 1 minuto
+PRECIOS_TTL = 60
+_precios_cache = TTLCache(maxsize=256, ttl=PRECIOS_TTL)
+_precios_lock = threading.Lock()
+
+
+def precios_actuales(tickers: list[str]) -> dict[str, float | None]:
+    """
+    Devuelve {ticker: último cierre} (None si no hay datos). Los tickers que no están en la
+    cache se piden juntos en una única descarga agrupada, de modo que una cartera entera
+    cuesta como mucho una llamada de red; los precios se cachean PRECIOS_TTL segundos.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    with _precios_lock:
+        precios = {t: _precios_cache[t] for t in tickers if t in _precios_cache}
+    faltan = [t for t in tickers if t not in precios]
+    if faltan:
+        try:
+            data = obtener_proveedor().descargar(faltan, period="5d")
+        except ErrorProveedor as e:
+            log.warning("Sin cotizaciones de %s: %s", ", ".join(faltan), e)
+            data = None
+        if data is not None and not data.empty:
+            ultimos = _extraer_cierres(data, faltan).ffill().iloc[-1]
+            nuevos = {t: (None if pd.isna(v) else float(v)) for t, v in ultimos.items()}
+            with _precios_lock:
+                _precios_cache.update(nuevos)
+            precios.update(nuevos)
+    return {t: precios.get(t) for t in tickers}
+
+
 def precio_actual(ticker: str) -> float | None:
     """
     Devuelve el precio de cierre más reciente (último día) para el ticker.
+    Para varios tickers use precios_actuales, que los pide en una sola llamada.
     """
-    try:
-        df = yf.Ticker(ticker).history(period="1d")
-    except Exception:
-        return None
-    if df.empty:
-        return None
-    return df["Close"].iloc[-1]
+    return precios_actuales([ticker])[ticker]
+
+
+def valorar_cartera(owned: dict, precios: dict[str, float | None]) -> dict:
+    """
+    Valora la cartera {ticker: {'shares', 'cost'}} a los precios dados, de forma vectorizada:
+      - 'posiciones': {ticker: {'shares', 'cost', 'precio', 'valor', 'ganancia_unit', 'ganancia'}}
+        (None donde falta el precio o el coste)
+      - 'valor_total' y 'ganancia_total': sumas de las posiciones con datos.
+    """
+    tickers = list(owned)
+    shares = np.array([owned[t].get("shares", 0) for t in tickers], dtype=float)
+    coste = np.array([np.nan if owned[t].get("cost") is None else owned[t]["cost"] for t in tickers], dtype=float)
+    precio = np.array([np.nan if precios.get(t) is None else precios[t] for t in tickers], dtype=float)
+
+    valor = shares * precio
+    ganancia_unit = precio - coste
+    ganancia = ganancia_unit * shares
+
+    def valor_o_none(x):
+        return None if np.isnan(x) else float(x)
+
+    posiciones = {
+        t: {
+            "shares": owned[t].get("shares", 0),
+            "cost": owned[t].get("cost"),
+            "precio": valor_o_none(precio[i]),
+            "valor": valor_o_none(valor[i]),
+            "ganancia_unit": valor_o_none(ganancia_unit[i]),
+            "ganancia": valor_o_none(ganancia[i]),
+        }
+        for i, t in enumerate(tickers)
+    }
+    return {
+        "posiciones": posiciones,
+        "valor_total": float(np.nansum(valor)),
+        "ganancia_total": float(np.nansum(ganancia)),
+    }
 
-# Cache para rentabilidad, TTL de 1 hora (3600 segundos)
-rent_cache = TTLCache(maxsize=1, ttl=3600)
+# Cache para rentabilidad, TTL de 1 hora (3600 segundos), compartida entre workers
+rent_cache = CacheCompartida("rentabilidad", ttl=3600)
 
-@cached(rent_cache)
+@cacheado(rent_cache)
 def obtener_rentabilidad_ibex35() -> pd.DataFrame:
     """
     Compila un DataFrame con las métricas de rentabilidad/dividendos para cada empresa del IBEX35:
@@ -404,67 +962,33 @@ def obtener_rentabilidad_ibex35() -> pd.DataFrame:
       - Rentabilidad Dividendaria (%) = (dividendos / precio) * 100
       - Capitalización (en miles de millones €)
       - Cambio en el último año (%)
-    Se cachea 1 hora para no sobrecargar yfinance.
+    Es una vista sobre la foto de mercado; se cachea 1 hora.
     """
+    snapshot = obtener_snapshot()
     resultados = []
 
     for empresa, ticker in empresas_ibex35.items():
-        precio_actual = None
-        dividend = 0.0
-        rentabilidad = None
-        market_cap_str = "N/A"
-        cambio = None
-
-        # 1) Precio actual (último cierre)
-        try:
-            hist1d = yf.Ticker(ticker).history(period="1d")
-            if not hist1d.empty:
-                precio_actual = round(hist1d["Close"].iloc[-1], 2)
-        except:
-            precio_actual = None
-
-        # 2) Info fundamental
-        try:
-            info_dict = yf.Ticker(ticker).info or {}
-        except:
-            info_dict = {}
-
-        # 3) Dividendos anuales
-        raw_div = info_dict.get("trailingAnnualDividendRate") or info_dict.get("dividendRate") or 0.0
-        try:
-            dividend = float(raw_div)
-        except:
-            dividend = 0.0
+        precio = snapshot.precio(ticker)
+        precio_actual = round(precio, 2) if precio is not None else None
+        dividend = snapshot.dividendo(ticker)
 
-        # 4) Rentabilidad dividendaria
-        if precio_actual is not None and dividend:
-            try:
-                rentabilidad = round((dividend / precio_actual) * 100, 2)
-            except:
-                rentabilidad = None
+        # Rentabilidad dividendaria
+        rentabilidad = None
+        if precio_actual and dividend:
+            rentabilidad = round((dividend / precio_actual) * 100, 2)
 
-        # 5) Capitalización
-        mc = info_dict.get("marketCap")
-        if mc:
-            try:
-                market_cap_str = f"{mc / 1e9:.2f}B €"
-            except:
-                market_cap_str = "N/A"
+        # Capitalización
+        mc = snapshot.market_cap(ticker)
+        market_cap_str = f"{mc / 1e9:.2f}B €" if mc else "N/A"
 
-        # 6) Cambio Últ. Año: usar history(period="1y") para mayor fiabilidad
-        try:
-            hist_year = yf.Ticker(ticker).history(period="1y")
-            if not hist_year.empty:
-                precio_year = hist_year["Close"].iloc[0]
-                precio_actual_adj = precio_actual - dividend if (precio_actual is not None and dividend) else precio_actual
-                if precio_year and precio_actual_adj is not None:
-                    cambio = round(((precio_actual_adj - precio_year) / precio_year) * 100, 2)
-                else:
-                    cambio = None
-            else:
-                cambio = None
-        except:
-            cambio = None
+        # Cambio Últ. Año: primer cierre del año frente al precio actual descontando dividendos
+        cambio = None
+        serie = snapshot.serie(ticker)
+        if not serie.empty and precio_actual is not None:
+            precio_year = serie.iloc[0]
+            precio_actual_adj = precio_actual - dividend if dividend else precio_actual
+            if precio_year:
+                cambio = round(((precio_actual_adj - precio_year) / precio_year) * 100, 2)
 
         resultados.append({
             "Empresa": empresa,
@@ -478,40 +1002,21 @@ def obtener_rentabilidad_ibex35() -> pd.DataFrame:
 
     return pd.DataFrame(resultados)
 
-_resumen_cache = TTLCache(maxsize=1, ttl=3600)
+_resumen_cache = CacheCompartida("resumen_detallado", ttl=3600)
 
-@cached(_resumen_cache)
+@cacheado(_resumen_cache)
 def resumen_detallado() -> str:
+    """
+    Genera un resumen extendido de todas las empresas del IBEX35,
+    incluyendo precio actual, dividendo bruto (€) y porcentaje, y market cap.
+    """
+    snapshot = obtener_snapshot()
     resumen = ""
     for nombre, ticker in empresas_ibex35.items():
-        accion = yf.Ticker(ticker)
-        # 1) Intentar sacar info con try/except
-        try:
-            info = accion.info or {}
-        except Exception:
-            info = {}
-
-        # 2) Precio actual
-        try:
-            df_1d = accion.history(period="1d")
-            precio = df_1d["Close"].iloc[-1] if not df_1d.empty else 0
-        except Exception:
-            precio = 0.0
-
-        # 3) Dividendos brutos y porcentaje
-        try:
-            raw_div = info.get("trailingAnnualDividendRate") or info.get("dividendRate") or 0.0
-            div_bruto = float(raw_div)
-        except Exception:
-            div_bruto = 0.0
+        precio = snapshot.precio(ticker) or 0.0
+        div_bruto = snapshot.dividendo(ticker)
         pct = round(div_bruto / precio * 100, 2) if precio else 0.0
-
-        # 4) Market cap por defecto
-        try:
-            mc = info.get("marketCap", 0)
-            mc_b = mc / 1e9
-        except Exception:
-            mc_b = 0.0
+        mc_b = (snapshot.market_cap(ticker) or 0) / 1e9
 
         resumen += (
             f"- **{nombre}** ({ticker}): "
@@ -0,0 +1,400 @@
+import argparse
+import json
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import email_utils
+from agents_utils import run_chatbot_task
+from data_utils import empresas_ibex35, obtener_snapshot, precios_actuales
+from rate_utils import TokenBucket, reintentar
+from store_utils import DATA_DIR
+
+log = logging.getLogger(__name__)
+
+# Hilos que preparan y envían correos a la vez
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", "8"))
+
+# Ritmo máximo de envíos SMTP y de llamadas al LLM (por minuto, entre todos los hilos)
+DIGEST_SMTP_POR_MINUTO = float(os.getenv("DIGEST_SMTP_POR_MINUTO", "120"))
+DIGEST_LLM_POR_MINUTO = float(os.getenv("DIGEST_LLM_POR_MINUTO", "10"))
+
+# Intentos por correo ante fallos transitorios (conexión caída, respuestas 4xx)
+DIGEST_INTENTOS = int(os.getenv("DIGEST_INTENTOS", "3"))
+
+# Hora local de envío (días laborables), después del cierre del mercado continuo (17:30)
+DIGEST_HORA = os.getenv("DIGEST_HORA", "18:00")
+DIGEST_ZONA = os.getenv("DIGEST_ZONA", "Europe/Madrid")
+
+# Espera (s) tras un digest fallido antes de reintentarlo; se duplica en cada fallo seguido
+DIGEST_ESPERA_FALLO = float(os.getenv("DIGEST_ESPERA_FALLO", "60"))
+DIGEST_ESPERA_MAXIMA = float(os.getenv("DIGEST_ESPERA_MAXIMA", "3600"))
+
+# Suscriptores que se leen de la base de datos en cada página
+LOTE_SUSCRIPTORES = 500
+
+# Errores por ejecución que se guardan con detalle
+MAX_ERRORES_GUARDADOS = 50
+
+
+class SuscriptoresStore:
+    """
+    Suscriptores del reporte diario (email y cartera) y registro de cada ejecución del envío,
+    con sus tiempos por fase, en una base SQLite compartida por la web y el worker.
+    """
+
+    def __init__(self, ruta: str | None = None):
+        self.ruta = ruta or os.path.join(DATA_DIR, "suscriptores.sqlite")
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS suscriptores ("
+                " email TEXT PRIMARY KEY, cartera TEXT NOT NULL,"
+                " activo INTEGER NOT NULL DEFAULT 1, actualizado REAL NOT NULL)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS ejecuciones ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, fecha TEXT NOT NULL,"
+                " inicio REAL NOT NULL, fin REAL NOT NULL, enviados INTEGER NOT NULL,"
+                " fallidos INTEGER NOT NULL, tiempos TEXT NOT NULL, errores TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def suscribir(self, email: str, cartera: dict) -> None:
+        """Da de alta (o actualiza la cartera de) un suscriptor."""
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO suscriptores (email, cartera, activo, actualizado) "
+                "VALUES (?, ?, 1, ?)",
+                (email.strip().lower(), json.dumps(cartera), time.time())
+            )
+
+    def baja(self, email: str) -> bool:
+        """Desactiva un suscriptor; devuelve False si no existía."""
+        with self._conectar() as con:
+            cursor = con.execute(
+                "UPDATE suscriptores SET activo = 0, actualizado = ? WHERE email = ?",
+                (time.time(), email.strip().lower())
+            )
+        return cursor.rowcount > 0
+
+    def activos(self, lote: int = LOTE_SUSCRIPTORES):
+        """
+        Genera (email, cartera) de los suscriptores activos con cartera, paginando por email
+        para no cargar todos en memoria.
+        """
+        ultimo = ""
+        while True:
+            with self._conectar() as con:
+                filas = con.execute(
+                    "SELECT email, cartera FROM suscriptores WHERE activo = 1 AND email > ? "
+                    "ORDER BY email LIMIT ?",
+                    (ultimo, lote)
+                ).fetchall()
+            for email, cartera in filas:
+                cartera = json.loads(cartera)
+                if cartera:
+                    yield email, cartera
+            if len(filas) < lote:
+                return
+            ultimo = filas[-1][0]
+
+    def guardar_ejecucion(self, ejecucion: dict) -> None:
+        with self._conectar() as con:
+            con.execute(
+                "INSERT INTO ejecuciones (fecha, inicio, fin, enviados, fallidos, tiempos, errores) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ejecucion["fecha"], ejecucion["inicio"], ejecucion["fin"], ejecucion["enviados"],
+                 ejecucion["fallidos"], json.dumps(ejecucion["tiempos"]),
+                 json.dumps(ejecucion["errores"]))
+            )
+
+    def ultimas_ejecuciones(self, n: int = 10) -> list[dict]:
+        with self._conectar() as con:
+            filas = con.execute(
+                "SELECT fecha, inicio, fin, enviados, fallidos, tiempos, errores "
+                "FROM ejecuciones ORDER BY id DESC LIMIT ?", (n,)
+            ).fetchall()
+        return [
+            {"fecha": f, "inicio": i, "fin": fin, "enviados": e, "fallidos": x,
+             "tiempos": json.loads(t), "errores": json.loads(err)}
+            for f, i, fin, e, x, t, err in filas
+        ]
+
+    def ejecutado(self, fecha: str) -> bool:
+        """Indica si ya hubo un envío para la fecha (YYYY-MM-DD)."""
+        with self._conectar() as con:
+            fila = con.execute("SELECT 1 FROM ejecuciones WHERE fecha = ? LIMIT 1", (fecha,)).fetchone()
+        return fila is not None
+
+
+_suscriptores: SuscriptoresStore | None = None
+_suscriptores_lock = threading.Lock()
+
+
+def obtener_suscriptores() -> SuscriptoresStore:
+    global _suscriptores
+    with _suscriptores_lock:
+        if _suscriptores is None:
+            _suscriptores = SuscriptoresStore()
+        return _suscriptores
+
+
+class FalloTransitorio(Exception):
+    """Fallo de envío que puede salir bien más tarde (conexión caída, respuesta SMTP 4xx)."""
+
+
+def es_transitorio(error: Exception) -> bool:
+    """Clasifica un error SMTP: los 4xx y los de red se reintentan; los 5xx son definitivos."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= codigo < 500 for codigo, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return _conexion_perdida(error)
+
+
+def _es_limite_llm(error: Exception) -> bool:
+    """
+    Indica si el error es un RateLimitError de LiteLLM. Se compara por nombre de clase para
+    no importar LiteLLM (segundos, y con hilos propios) cuando el LLM está simulado o responde.
+    """
+    return any(clase.__name__ == "RateLimitError" for clase in type(error).__mro__)
+
+
+def _conexion_perdida(error: Exception) -> bool:
+    # Las excepciones de smtplib heredan de OSError: sólo cuentan los errores de red
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    )
+
+
+class _ConexionesSMTP:
+    """Una conexión SMTP por hilo del pool, reabierta si el servidor la corta."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._abiertas = []
+        self._lock = threading.Lock()
+
+    def enviar(self, msg) -> None:
+        smtp = getattr(self._local, "smtp", None)
+        try:
+            if smtp is None:
+                smtp = self._local.smtp = email_utils.abrir_smtp()
+                with self._lock:
+                    self._abiertas.append(smtp)
+            smtp.send_message(msg)
+        except OSError as e:
+            if _conexion_perdida(e):
+                self._local.smtp = None
+                if smtp is not None:
+                    self._descartar(smtp)
+            if es_transitorio(e):
+                raise FalloTransitorio(f"{type(e).__name__}: {e}") from e
+            raise
+
+    def _descartar(self, smtp) -> None:
+        """Quita de las abiertas una conexión caída (la del hilo se reabrirá) y la cierra."""
+        with self._lock:
+            if smtp in self._abiertas:
+                self._abiertas.remove(smtp)
+        try:
+            smtp.close()
+        except OSError:
+            pass
+
+    def cerrar(self) -> None:
+        with self._lock:
+            abiertas, self._abiertas = self._abiertas, []
+        for smtp in abiertas:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+
+
+def ejecutar_digest(store: SuscriptoresStore | None = None, workers: int = DIGEST_WORKERS,
+                    smtp_por_minuto: float = DIGEST_SMTP_POR_MINUTO,
+                    llm_por_minuto: float = DIGEST_LLM_POR_MINUTO,
+                    intentos: int = DIGEST_INTENTOS, backoff: float = 1.0) -> dict:
+    """
+    Envía el reporte diario a todos los suscriptores activos. Lo común (foto de mercado,
+    cotizaciones y comentario del LLM) se calcula una vez; la preparación y el envío de cada correo se
+    reparten en un pool de 'workers' hilos con una conexión SMTP por hilo. Los envíos SMTP y
+    las llamadas al LLM respetan su ritmo máximo (token bucket compartido) y los fallos
+    transitorios se reintentan con backoff exponencial. Guarda y devuelve la ejecución:
+    fecha, inicio, fin, enviados, fallidos, tiempos por fase (s) y los primeros errores.
+    """
+    store = store or obtener_suscriptores()
+    limite_smtp = TokenBucket.por_minuto(smtp_por_minuto)
+    limite_llm = TokenBucket.por_minuto(llm_por_minuto)
+    inicio = time.time()
+    tiempos = {}
+
+    t0 = time.perf_counter()
+    snapshot = obtener_snapshot()
+    # Las carteras son de valores del IBEX35: una sola petición de cotizaciones para todas
+    precios = precios_actuales(list(empresas_ibex35.values()))
+    tiempos["mercado"] = time.perf_counter() - t0
+
+    def llamar_llm(contexto, pregunta):
+        limite_llm.adquirir()
+
+        def intento():
+            try:
+                return run_chatbot_task(contexto, pregunta)
+            except Exception as e:
+                if _es_limite_llm(e):
+                    raise FalloTransitorio(str(e)) from e
+                raise
+
+        try:
+            return reintentar(intento, intentos=intentos, transitorias=(FalloTransitorio,), base=backoff)
+        except FalloTransitorio as e:
+            raise e.__cause__
+
+    t0 = time.perf_counter()
+    comentario = email_utils.comentario_mercado(email_utils.contexto_mercado(snapshot), llamar=llamar_llm)
+    tiempos["comentario"] = time.perf_counter() - t0
+
+    conexiones = _ConexionesSMTP()
+    duraciones = []
+
+    def enviar(email: str, cartera: dict) -> str | None:
+        t = time.perf_counter()
+        try:
+            cuerpo = email_utils.cuerpo_reporte(comentario, cartera, precios, email_utils.rendimiento_anual(cartera))
+            msg = email_utils.mensaje_reporte(email, cuerpo)
+
+            def intento():
+                limite_smtp.adquirir()
+                conexiones.enviar(msg)
+
+            reintentar(intento, intentos=intentos, transitorias=(FalloTransitorio,), base=backoff)
+            return None
+        except Exception as e:
+            return str(e) if isinstance(e, FalloTransitorio) else f"{type(e).__name__}: {e}"
+        finally:
+            duraciones.append(time.perf_counter() - t)
+
+    enviados, errores = 0, {}
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="digest") as ejecutor:
+            # Se encola por páginas para no tener miles de correos preparados en memoria
+            pagina = []
+            for suscriptor in store.activos():
+                pagina.append(suscriptor)
+                if len(pagina) == LOTE_SUSCRIPTORES:
+                    enviados += _repartir(ejecutor, enviar, pagina, errores)
+                    pagina = []
+            enviados += _repartir(ejecutor, enviar, pagina, errores)
+    finally:
+        conexiones.cerrar()
+    tiempos["envio"] = time.perf_counter() - t0
+    if duraciones:
+        tiempos["correo_medio"] = sum(duraciones) / len(duraciones)
+        tiempos["correo_max"] = max(duraciones)
+
+    ejecucion = {
+        "fecha": datetime.now(ZoneInfo(DIGEST_ZONA)).date().isoformat(),
+        "inicio": inicio,
+        "fin": time.time(),
+        "enviados": enviados,
+        "fallidos": len(errores),
+        "tiempos": tiempos,
+        "errores": dict(list(errores.items())[:MAX_ERRORES_GUARDADOS]),
+    }
+    store.guardar_ejecucion(ejecucion)
+    return ejecucion
+
+
+def _repartir(ejecutor, enviar, pagina: list, errores: dict) -> int:
+    """Envía una página de suscriptores en el pool; anota los errores y devuelve los enviados."""
+    enviados = 0
+    for (email, _), error in zip(pagina, ejecutor.map(lambda s: enviar(*s), pagina)):
+        if error is None:
+            enviados += 1
+        else:
+            errores[email] = error
+    return enviados
+
+
+def proxima_ejecucion(ahora: datetime, hora: str = DIGEST_HORA) -> datetime:
+    """Siguiente día laborable a la 'hora' (HH:MM) indicada posterior a 'ahora'."""
+    h, m = (int(x) for x in hora.split(":"))
+    cita = ahora.replace(hour=h, minute=m, second=0, microsecond=0)
+    if cita <= ahora:
+        cita += timedelta(days=1)
+    while cita.weekday() >= 5:
+        cita += timedelta(days=1)
+    return cita
+
+
+def siguiente_ejecucion(ahora: datetime, store: SuscriptoresStore, hora: str = DIGEST_HORA) -> datetime:
+    """
+    Momento del próximo digest: 'ahora' si hoy es laborable, ya pasó la 'hora' y el de hoy
+    no se envió (el worker arrancó tarde o el envío falló); si no, proxima_ejecucion.
+    """
+    h, m = (int(x) for x in hora.split(":"))
+    cita_hoy = ahora.replace(hour=h, minute=m, second=0, microsecond=0)
+    if ahora.weekday() < 5 and ahora >= cita_hoy and not store.ejecutado(ahora.date().isoformat()):
+        return ahora
+    return proxima_ejecucion(ahora, hora)
+
+
+def programar(store: SuscriptoresStore | None = None, hora: str = DIGEST_HORA,
+              espera_fallo: float = DIGEST_ESPERA_FALLO, espera_maxima: float = DIGEST_ESPERA_MAXIMA) -> None:
+    """
+    Bucle del worker: espera a la próxima hora de envío y lanza el digest, salvo que ya se
+    haya enviado ese día (p.ej. tras reiniciar el proceso). Al arrancar pasada la hora, envía
+    el de hoy si falta. Un digest que falla se registra y se reintenta tras una espera que
+    se duplica con cada fallo seguido (hasta 'espera_maxima'), sin detener el worker.
+    """
+    store = store or obtener_suscriptores()
+    zona = ZoneInfo(DIGEST_ZONA)
+    fallos = 0
+    while True:
+        cita = siguiente_ejecucion(datetime.now(zona), store, hora)
+        log.info("Próximo digest: %s", cita.isoformat())
+        while (restante := (cita - datetime.now(zona)).total_seconds()) > 0:
+            time.sleep(min(restante, 300))
+        if store.ejecutado(cita.date().isoformat()):
+            continue
+        try:
+            ejecucion = ejecutar_digest(store)
+        except Exception:
+            fallos += 1
+            espera = min(espera_fallo * 2 ** (fallos - 1), espera_maxima)
+            log.exception("Digest fallido (%d seguidos); se reintenta en %.0fs", fallos, espera)
+            time.sleep(espera)
+            continue
+        fallos = 0
+        log.info("Digest enviado: %(enviados)s correos, %(fallidos)s fallidos", ejecucion)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envío programado del reporte diario del IBEX35.")
+    parser.add_argument("--una-vez", action="store_true", help="Envía ahora y termina.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.una_vez:
+        print(json.dumps(ejecutar_digest(), indent=2, ensure_ascii=False))
+    else:
+        programar()
@@ -1,74 +1,180 @@
 import smtplib
 from email.message import EmailMessage
-from data_utils import resumen_acciones, precio_actual
+from data_utils import empresas_ibex35, obtener_snapshot, precios_actuales, valorar_cartera
 from agents_utils import run_chatbot_task
-from litellm.exceptions import RateLimitError
+from context_utils import tabla_mercado
+from portfolio_utils import rendimiento_cartera
+from lazy_utils import ModuloPerezoso
 import os
-# Configuración SMTP para Mailtrap (testing)
-SMTP_HOST = "smtp.mailtrap.io"
-SMTP_PORT = 2525
+
+# Sólo hace falta para reconocer sus excepciones: se importa al primer error
+litellm = ModuloPerezoso("litellm")
+
+# Configuración SMTP (por defecto Mailtrap para testing)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.mailtrap.io")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "2525"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")      # reemplaza con tu clave Mailtrap
 EMAIL_FROM = "noreply@ibex35ia.local"
+ASUNTO_REPORTE = "📈 Tu reporte diario de IBEX35 IA"
 
-def enviar_reporte_diario(to_email, owned_stocks):
+
+def contexto_mercado(snapshot) -> str:
+    """Tabla de mercado (precio, crecimientos 1M / 1A...) de todo el IBEX35 para el comentario."""
+    return tabla_mercado(snapshot, list(empresas_ibex35.values()))
+
+
+def comentario_mercado(contexto: str, llamar=None) -> str:
     """
-    Envía un correo con:
-      1) Un breve comentario generado por IA sobre el estado del mercado,
-         basándose únicamente en los datos de crecimiento 1M / 1A.
-      2) Detalle de la cartera del usuario.
+    Breve comentario generado por IA sobre el estado del mercado a partir de la tabla de
+    mercado (crecimientos 1M / 1A). 'llamar' sustituye a run_chatbot_task (p.ej. para
+    limitar su ritmo y reintentarla). Nunca lanza: si el LLM falla devuelve un aviso.
     """
-    # 1) Preparamos el fragmento de crecimientos
-    acciones_texto = resumen_acciones()
-    crecimiento_lines = [
-        line for line in acciones_texto.split("\n")
-        if "Crecimiento 1M" in line or "Cambio Últ. Año" in line
-    ]
-    contexto = "\n".join(crecimiento_lines)
-
-    # 2) Generamos el comentario con ese contexto
     prompt = (
         "En base a estos datos de crecimiento del IBEX35, "
         "dime en una frase si el mercado va bien o mal hoy, y por qué:\n\n"
         f"{contexto}"
     )
-    comentario = "No se pudo generar comentario de mercado."
     try:
-        comentario = run_chatbot_task(contexto, prompt).strip()
-    except RateLimitError:
-        comentario = "El servicio de IA está limitado; no hay comentario de mercado."
+        return (llamar or run_chatbot_task)(contexto, prompt).strip()
+    except litellm.RateLimitError:
+        return "El servicio de IA está limitado; no hay comentario de mercado."
+    except Exception:
+        return "No se ha podido generar comentario de mercado."
+
+
+def rendimiento_anual(owned_stocks: dict) -> dict | None:
+    """Métricas del último año de la cartera, o None si no se pueden calcular."""
+    try:
+        rendimiento = rendimiento_cartera(owned_stocks)
     except Exception:
-        comentario = "No se ha podido generar comentario de mercado."
+        return None
+    return rendimiento["metricas"] if rendimiento else None
+
 
-    # 3) Montamos el cuerpo del email
+def cuerpo_reporte(comentario: str, owned_stocks: dict, precios: dict,
+                   metricas: dict | None = None) -> str:
+    """
+    Texto del correo: comentario de mercado, detalle de la cartera a los precios dados y,
+    si se indican, las métricas del último año (ver portfolio_utils).
+    """
     lines = [
         comentario,
         "",
         "**Tu cartera de acciones hoy**"
     ]
-    for ticker, datos in owned_stocks.items():
-        shares = datos.get("shares", 0)
-        cost   = datos.get("cost", None)
-        current = precio_actual(ticker) or 0.0
-        line = f"- {ticker}: {shares} unid., precio actual {current:.2f} €"
-        if cost is not None:
-            gain = current - cost
-            total_gain = gain * shares
-            line += f", coste medio {cost:.2f} €, ganancia total {total_gain:.2f} €"
+    valoracion = valorar_cartera(owned_stocks, precios)
+    for ticker, pos in valoracion["posiciones"].items():
+        precio = f"{pos['precio']:.2f} €" if pos["precio"] is not None else "no disponible"
+        line = f"- {ticker}: {pos['shares']} unid., precio actual {precio}"
+        if pos["cost"] is not None:
+            line += f", coste medio {pos['cost']:.2f} €"
+            if pos["ganancia"] is not None:
+                line += f", ganancia total {pos['ganancia']:.2f} €"
         lines.append(line)
+    if any(pos["ganancia"] is not None for pos in valoracion["posiciones"].values()):
+        lines += ["", f"Ganancia total de la cartera: {valoracion['ganancia_total']:.2f} €"]
+    if metricas:
+        lines += ["", (
+            f"Último año: rentabilidad {metricas['rentabilidad'] * 100:.2f} %, "
+            f"volatilidad {metricas['volatilidad'] * 100:.2f} %, "
+            f"máximo drawdown {metricas['max_drawdown'] * 100:.2f} %"
+        )]
+    return "\n".join(lines)
 
-    body = "\n".join(lines)
 
-    # 4) Envío del correo
+def mensaje_reporte(to_email: str, body: str) -> EmailMessage:
     msg = EmailMessage()
-    msg["Subject"] = "📈 Tu reporte diario de IBEX35 IA"
+    msg["Subject"] = ASUNTO_REPORTE
     msg["From"]    = EMAIL_FROM
     msg["To"]      = to_email
     msg.set_content(body)
+    return msg
 
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as smtp:
-        smtp.ehlo()
-        smtp.starttls()
+
+def abrir_smtp() -> smtplib.SMTP:
+    """Abre y autentica una conexión SMTP con la configuración del entorno."""
+    smtp = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    try:
         smtp.ehlo()
-        smtp.login(SMTP_USER, SMTP_PASS)
-        smtp.send_message(msg)
+        if SMTP_STARTTLS:
+            smtp.starttls()
+            smtp.ehlo()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASS)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+def enviar_reportes(envios: list[tuple[str, dict]]) -> dict[str, str | None]:
+    """
+    Envía el reporte diario a cada (email, cartera) de 'envios' calculando una sola vez lo
+    común a todos: la foto de mercado, el comentario del LLM, las cotizaciones de todas las
+    carteras (una única descarga agrupada) y una única conexión SMTP autenticada,
+    que se reabre una vez si el servidor la corta a mitad del lote.
+    Devuelve {email: None si se envió, o el motivo del fallo}.
+    """
+    resultados: dict[str, str | None] = {}
+    if not envios:
+        return resultados
+
+    snapshot = obtener_snapshot()
+    comentario = comentario_mercado(contexto_mercado(snapshot))
+    # Cotizaciones de todas las carteras del lote en una sola petición
+    precios = precios_actuales([t for _, owned in envios for t in owned])
+
+    smtp = None
+    try:
+        for to_email, owned in envios:
+            cuerpo = cuerpo_reporte(comentario, owned, precios, rendimiento_anual(owned))
+            msg = mensaje_reporte(to_email, cuerpo)
+            for intento in range(2):
+                try:
+                    if smtp is None:
+                        smtp = abrir_smtp()
+                    smtp.send_message(msg)
+                    resultados[to_email] = None
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    # Conexión caducada: se cierra su socket, se abre otra y se reintenta este destinatario
+                    if smtp is not None:
+                        try:
+                            smtp.close()
+                        except OSError:
+                            pass
+                    smtp = None
+                    resultados[to_email] = f"Conexión SMTP cerrada: {e}"
+                except smtplib.SMTPRecipientsRefused as e:
+                    resultados[to_email] = f"Destinatario rechazado: {e.recipients.get(to_email, e)}"
+                    break
+                except (smtplib.SMTPException, OSError) as e:
+                    resultados[to_email] = f"{type(e).__name__}: {e}"
+                    # Sin servidor no tiene sentido seguir intentando con el resto
+                    if smtp is None:
+                        for pendiente, _ in envios:
+                            resultados.setdefault(pendiente, resultados[to_email])
+                        return resultados
+                    break
+    finally:
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except smtplib.SMTPException:
+                smtp.close()
+    return resultados
+
+
+def enviar_reporte_diario(to_email, owned_stocks):
+    """
+    Envía un correo con:
+      1) Un breve comentario generado por IA sobre el estado del mercado,
+         basándose únicamente en los datos de crecimiento 1M / 1A.
+      2) Detalle de la cartera del usuario.
+    Para varios destinatarios use enviar_reportes, que comparte el cálculo y la conexión.
+    """
+    error = enviar_reportes([(to_email, owned_stocks)])[to_email]
+    if error:
+        raise RuntimeError(error)
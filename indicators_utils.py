@@ -0,0 +1,305 @@
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from store_utils import obtener_store
+
+# Barras de calentamiento que se leen antes de la ventana visible, para que la SMA200
+# (y las EMAs) estén definidas desde el primer día mostrado
+BARRAS_CALENTAMIENTO = 220
+
+# Cache de indicadores por (tickers, años, versión de los datos del almacén)
+_indicadores_cache = LRUCache(maxsize=16)
+_indicadores_lock = threading.Lock()
+
+
+def sma(panel: pd.DataFrame, n: int) -> pd.DataFrame:
+    """Media móvil simple de n barras para todas las columnas del panel."""
+    return panel.rolling(window=n, min_periods=n).mean()
+
+
+def ema(panel: pd.DataFrame, n: int) -> pd.DataFrame:
+    """Media móvil exponencial (span n, sin ajuste) para todas las columnas del panel."""
+    return panel.ewm(span=n, adjust=False, min_periods=n).mean()
+
+
+def rsi_wilder(panel: pd.DataFrame, n: int = 14) -> pd.DataFrame:
+    """
+    RSI con el suavizado de Wilder (media exponencial con alfa = 1/n) para todas las columnas.
+    Igual que calcular_RSI, devuelve 50 cuando no hay subidas ni bajadas.
+    """
+    delta = panel.diff()
+    gain = delta.clip(lower=0)
+    loss = -delta.clip(upper=0)
+    avg_gain = gain.ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    avg_loss = loss.ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+    rsi = rsi.mask(avg_gain.notna() & (avg_gain == 0) & (avg_loss == 0), 50.0)
+    return rsi
+
+
+def calcular_panel_indicadores(panel: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Calcula de una pasada, sobre un panel fechas x tickers de precios, los indicadores de
+    todos los tickers: SMA50, SMA200, EMA12, EMA26, RSI (Wilder, 14), MACD (12, 26, 9)
+    y bandas de Bollinger (20, 2).
+    Los huecos intermedios de un ticker (días sin barra) se rellenan con el último precio
+    para que no invaliden las ventanas móviles.
+    Devuelve un diccionario nombre -> panel fechas x tickers.
+    """
+    panel = panel.ffill()
+    ema12 = ema(panel, 12)
+    ema26 = ema(panel, 26)
+    macd = ema12 - ema26
+    macd_senal = macd.ewm(span=9, adjust=False, min_periods=9).mean()
+    bb_media = sma(panel, 20)
+    bb_desv = panel.rolling(window=20, min_periods=20).std(ddof=0)
+    return {
+        "Precio": panel,
+        "SMA50": sma(panel, 50),
+        "SMA200": sma(panel, 200),
+        "EMA12": ema12,
+        "EMA26": ema26,
+        "RSI": rsi_wilder(panel, 14),
+        "MACD": macd,
+        "MACD_senal": macd_senal,
+        "MACD_hist": macd - macd_senal,
+        "BB_media": bb_media,
+        "BB_superior": bb_media + 2 * bb_desv,
+        "BB_inferior": bb_media - 2 * bb_desv
+    }
+
+
+def obtener_indicadores(tickers: list[str], anios: int = 1) -> dict[str, pd.DataFrame]:
+    """
+    Indicadores técnicos de los últimos 'anios' años para todos los tickers, calculados sobre
+    el panel del almacén de precios (con BARRAS_CALENTAMIENTO barras previas de calentamiento).
+    El resultado se cachea por versión de los datos y lo reutilizan las figuras, el screener
+    y el contexto del chat; no debe modificarse.
+    """
+    tickers = list(tickers)
+    store = obtener_store()
+    store.actualizar(tickers)
+    clave = (tuple(tickers), anios, store.version(tickers))
+    with _indicadores_lock:
+        indicadores = _indicadores_cache.get(clave)
+    if indicadores is not None:
+        return indicadores
+
+    inicio_ventana = pd.Timestamp(datetime.today() - pd.DateOffset(years=anios)).normalize()
+    # Unas 252 barras por año natural; pedimos días naturales de sobra para el calentamiento
+    inicio_lectura = inicio_ventana - pd.Timedelta(days=int(BARRAS_CALENTAMIENTO * 365 / 252) + 10)
+    panel = store.panel(tickers, start=inicio_lectura)
+
+    indicadores = {
+        nombre: valores[valores.index >= inicio_ventana]
+        for nombre, valores in calcular_panel_indicadores(panel).items()
+    }
+    with _indicadores_lock:
+        _indicadores_cache[clave] = indicadores
+    return indicadores
+
+
+def screener(indicadores: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Tabla con la última lectura de cada indicador por ticker y una señal resumida
+    (sobrecompra/sobreventa por RSI, tendencia por SMA50 vs SMA200, MACD).
+    """
+    ultimos = pd.DataFrame({
+        nombre: valores.ffill().iloc[-1] if not valores.empty else pd.Series(dtype=float)
+        for nombre, valores in indicadores.items()
+    })
+    rango_bb = ultimos["BB_superior"] - ultimos["BB_inferior"]
+    ultimos["%B"] = (ultimos["Precio"] - ultimos["BB_inferior"]) / rango_bb.replace(0, np.nan)
+    ultimos["Tendencia"] = np.where(
+        ultimos["SMA50"] > ultimos["SMA200"], "alcista",
+        np.where(ultimos["SMA50"] < ultimos["SMA200"], "bajista", "N/A")
+    )
+    ultimos["RSI señal"] = np.where(
+        ultimos["RSI"] >= 70, "sobrecompra", np.where(ultimos["RSI"] <= 30, "sobreventa", "neutral")
+    )
+    ultimos["MACD señal"] = np.where(ultimos["MACD_hist"] > 0, "compra",
+                                     np.where(ultimos["MACD_hist"] < 0, "venta", "N/A"))
+    ultimos.index.name = "Ticker"
+    return ultimos
+
+
+# --------------------------------------------------
+# Indicadores incrementales: estado compacto y O(1) por barra
+# --------------------------------------------------
+
+class IndicadorIncremental(ABC):
+    """
+    Base de los indicadores incrementales. Cada subclase guarda su estado en __slots__
+    (buffers circulares y sumas acumuladas) y lo actualiza en tiempo constante con
+    actualizar(precio). estado() / desde_estado() lo serializan a un dict JSON.
+    """
+    __slots__ = ()
+
+    @abstractmethod
+    def actualizar(self, precio: float):
+        """Incorpora un precio de cierre y devuelve el valor actual del indicador."""
+
+    def estado(self) -> dict:
+        datos = {nombre: _a_json(getattr(self, nombre)) for nombre in self.__slots__}
+        datos["tipo"] = type(self).__name__
+        return datos
+
+    @classmethod
+    def desde_estado(cls, estado: dict) -> "IndicadorIncremental":
+        indicador = cls.__new__(cls)
+        for nombre in cls.__slots__:
+            setattr(indicador, nombre, _desde_json(estado[nombre]))
+        return indicador
+
+
+def _a_json(valor):
+    if isinstance(valor, IndicadorIncremental):
+        return valor.estado()
+    return list(valor) if isinstance(valor, list) else valor
+
+
+def _desde_json(valor):
+    if isinstance(valor, dict) and "tipo" in valor:
+        return cargar_indicador(valor)
+    return valor
+
+
+class SMAIncremental(IndicadorIncremental):
+    """Media móvil simple de n barras (igual que rolling(n, min_periods=n).mean())."""
+    __slots__ = ("n", "buffer", "pos", "cuenta", "suma", "iguales")
+
+    def __init__(self, n: int):
+        self.n = n
+        self.buffer = [0.0] * n
+        self.pos = 0
+        self.cuenta = 0
+        self.suma = 0.0
+        self.iguales = 0
+
+    def actualizar(self, precio: float) -> float | None:
+        precio = float(precio)
+        anterior = self.buffer[self.pos - 1]
+        saliente = self.buffer[self.pos]
+        self.buffer[self.pos] = precio
+        self.pos = (self.pos + 1) % self.n
+        self.cuenta += 1
+        self.iguales = self.iguales + 1 if self.cuenta > 1 and precio == anterior else 1
+        if self.pos == 0:
+            # Una vez por vuelta del buffer se recalcula la suma para no acumular error de redondeo
+            self.suma = sum(self.buffer)
+        else:
+            self.suma += precio - saliente
+        if self.cuenta < self.n:
+            return None
+        # Ventana constante: el valor exacto, como hace pandas (p.ej. medias de subidas nulas)
+        return precio if self.iguales >= self.n else self.suma / self.n
+
+
+class EMAIncremental(IndicadorIncremental):
+    """Media móvil exponencial de span n (igual que ewm(span=n, adjust=False, min_periods=n))."""
+    __slots__ = ("n", "alfa", "valor", "cuenta")
+
+    def __init__(self, n: int, alfa: float | None = None):
+        self.n = n
+        self.alfa = alfa if alfa is not None else 2 / (n + 1)
+        self.valor = None
+        self.cuenta = 0
+
+    def actualizar(self, precio: float) -> float | None:
+        precio = float(precio)
+        self.valor = precio if self.valor is None else self.alfa * precio + (1 - self.alfa) * self.valor
+        self.cuenta += 1
+        return self.valor if self.cuenta >= self.n else None
+
+
+class RSIIncremental(IndicadorIncremental):
+    """
+    RSI de n barras. Por defecto replica calcular_RSI (medias simples de subidas y bajadas,
+    50 mientras no hay datos suficientes o no hay movimiento); con wilder=True replica
+    rsi_wilder (suavizado exponencial con alfa = 1/n, None hasta tener n variaciones).
+    """
+    __slots__ = ("n", "wilder", "anterior", "subidas", "bajadas")
+
+    def __init__(self, n: int = 14, wilder: bool = False):
+        self.n = n
+        self.wilder = wilder
+        self.anterior = None
+        if wilder:
+            self.subidas = EMAIncremental(n, alfa=1 / n)
+            self.bajadas = EMAIncremental(n, alfa=1 / n)
+        else:
+            self.subidas = SMAIncremental(n)
+            self.bajadas = SMAIncremental(n)
+
+    def actualizar(self, precio: float) -> float | None:
+        precio = float(precio)
+        if self.anterior is None:
+            self.anterior = precio
+            return None if self.wilder else 50.0
+        delta = precio - self.anterior
+        self.anterior = precio
+        media_subidas = self.subidas.actualizar(max(delta, 0.0))
+        media_bajadas = self.bajadas.actualizar(max(-delta, 0.0))
+        if media_subidas is None or media_bajadas is None:
+            return None if self.wilder else 50.0
+        if media_bajadas == 0:
+            return 50.0 if media_subidas == 0 else 100.0
+        return 100 - 100 / (1 + media_subidas / media_bajadas)
+
+
+class MACDIncremental(IndicadorIncremental):
+    """MACD (EMA rápida - EMA lenta), su señal y el histograma, igual que calcular_panel_indicadores."""
+    __slots__ = ("rapida", "lenta", "senal")
+
+    def __init__(self, rapida: int = 12, lenta: int = 26, senal: int = 9):
+        self.rapida = EMAIncremental(rapida)
+        self.lenta = EMAIncremental(lenta)
+        self.senal = EMAIncremental(senal)
+
+    def actualizar(self, precio: float) -> tuple[float, float | None, float | None] | None:
+        ema_rapida = self.rapida.actualizar(precio)
+        ema_lenta = self.lenta.actualizar(precio)
+        if ema_rapida is None or ema_lenta is None:
+            return None
+        macd = ema_rapida - ema_lenta
+        senal = self.senal.actualizar(macd)
+        return macd, senal, (macd - senal if senal is not None else None)
+
+
+_INDICADORES_INCREMENTALES = {
+    cls.__name__: cls for cls in (SMAIncremental, EMAIncremental, RSIIncremental, MACDIncremental)
+}
+
+
+def cargar_indicador(estado: dict) -> IndicadorIncremental:
+    """Reconstruye un indicador incremental a partir de su estado serializado."""
+    return _INDICADORES_INCREMENTALES[estado["tipo"]].desde_estado(estado)
+
+
+def actualizar_indicador(ticker: str, nombre: str, crear) -> tuple[IndicadorIncremental, object]:
+    """
+    Carga del almacén de precios el estado guardado como 'nombre' para el ticker (o lo crea con
+    crear()), lo avanza sólo con las barras posteriores a la última procesada y lo vuelve a guardar.
+    Devuelve (indicador, último valor). Está pensado para barras cerradas: una barra ya procesada
+    que se corrija después no se vuelve a aplicar.
+    """
+    store = obtener_store()
+    guardado = store.leer_estado(ticker, nombre)
+    if guardado is None:
+        indicador, desde = crear(), None
+    else:
+        fecha, estado = guardado
+        indicador, desde = cargar_indicador(estado), fecha + pd.Timedelta(days=1)
+
+    valor = None
+    barras = store.leer(ticker, start=desde)["Precio"].dropna()
+    for precio in barras.to_numpy():
+        valor = indicador.actualizar(precio)
+    if not barras.empty:
+        store.guardar_estado(ticker, nombre, barras.index[-1], indicador.estado())
+    return indicador, valor
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from store_utils import DATA_DIR
+
+# Hilos que ejecutan crews a la vez en cada proceso web
+ASESOR_WORKERS = int(os.getenv("ASESOR_WORKERS", "2"))
+
+# Trabajos pendientes o en ejecución admitidos a la vez (entre todos los procesos)
+MAX_TRABAJOS_ACTIVOS = int(os.getenv("ASESOR_MAX_TRABAJOS", "8"))
+
+# Segundos durante los que un informe terminado se reutiliza para peticiones idénticas
+RESULTADO_TTL = 3600
+
+# Segundos tras los que un trabajo sin terminar se da por perdido (p.ej. reinicio del proceso)
+TRABAJO_TIMEOUT = 1800
+
+PENDIENTE, EJECUTANDO, TERMINADO, ERROR = "pendiente", "ejecutando", "terminado", "error"
+ACTIVOS = (PENDIENTE, EJECUTANDO)
+
+
+class ColaLlena(Exception):
+    """Se alcanzó el máximo de trabajos activos; el cliente debe reintentar más tarde."""
+
+
+def clave_trabajo(*partes) -> str:
+    """Huella de los parámetros de un trabajo: dos envíos con la misma clave comparten resultado."""
+    return hashlib.sha1(json.dumps(partes, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ColaTrabajos:
+    """
+    Cola local de trabajos largos (p.ej. crews de CrewAI). 'enviar' devuelve un id al momento
+    y un pool de hilos acotado ejecuta el trabajo. El estado vive en SQLite, de modo que
+    cualquier proceso web puede consultarlo, y la clave permite deduplicar envíos idénticos.
+    """
+
+    def __init__(self, ruta: str | None = None, max_workers: int = ASESOR_WORKERS,
+                 max_activos: int = MAX_TRABAJOS_ACTIVOS, ttl: int = RESULTADO_TTL,
+                 timeout: int = TRABAJO_TIMEOUT):
+        self.ruta = ruta or os.path.join(DATA_DIR, "trabajos.sqlite")
+        self.max_activos = max_activos
+        self.ttl = ttl
+        self.timeout = timeout
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trabajo")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS trabajos ("
+                " id TEXT PRIMARY KEY, clave TEXT NOT NULL, estado TEXT NOT NULL,"
+                " creado REAL NOT NULL, actualizado REAL NOT NULL, resultado TEXT, error TEXT)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS trabajos_clave ON trabajos (clave, actualizado)")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _actualizar(self, id_trabajo: str, estado: str, resultado: str | None = None,
+                    error: str | None = None) -> None:
+        with self._conectar() as con:
+            con.execute(
+                "UPDATE trabajos SET estado = ?, actualizado = ?, resultado = ?, error = ? WHERE id = ?",
+                (estado, time.time(), resultado, error, id_trabajo)
+            )
+
+    def enviar(self, clave: str, funcion, *args) -> str:
+        """
+        Encola funcion(*args) y devuelve el id del trabajo. Si hay otro con la misma clave
+        activo, o terminado hace menos de 'ttl' segundos, devuelve su id sin encolar nada.
+        Lanza ColaLlena si ya hay 'max_activos' trabajos pendientes o en ejecución.
+        """
+        ahora = time.time()
+        with self._lock, self._conectar() as con:
+            # BEGIN IMMEDIATE serializa la comprobación y el alta también entre procesos
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                "UPDATE trabajos SET estado = ?, error = ?, actualizado = ? "
+                "WHERE estado IN (?, ?) AND actualizado < ?",
+                (ERROR, "Trabajo interrumpido", ahora, *ACTIVOS, ahora - self.timeout)
+            )
+            fila = con.execute(
+                "SELECT id FROM trabajos WHERE clave = ? AND "
+                "(estado IN (?, ?) OR (estado = ? AND actualizado >= ?)) "
+                "ORDER BY creado DESC LIMIT 1",
+                (clave, *ACTIVOS, TERMINADO, ahora - self.ttl)
+            ).fetchone()
+            if fila:
+                return fila[0]
+            (activos,) = con.execute(
+                "SELECT COUNT(*) FROM trabajos WHERE estado IN (?, ?)", ACTIVOS
+            ).fetchone()
+            if activos >= self.max_activos:
+                raise ColaLlena(f"{activos} trabajos en curso")
+            id_trabajo = uuid.uuid4().hex
+            con.execute(
+                "INSERT INTO trabajos (id, clave, estado, creado, actualizado) VALUES (?, ?, ?, ?, ?)",
+                (id_trabajo, clave, PENDIENTE, ahora, ahora)
+            )
+        self._ejecutor.submit(self._ejecutar, id_trabajo, funcion, args)
+        return id_trabajo
+
+    def _ejecutar(self, id_trabajo: str, funcion, args: tuple) -> None:
+        self._actualizar(id_trabajo, EJECUTANDO)
+        try:
+            resultado = funcion(*args)
+        except Exception as e:
+            self._actualizar(id_trabajo, ERROR, error=str(e) or type(e).__name__)
+        else:
+            self._actualizar(id_trabajo, TERMINADO, resultado=resultado)
+
+    def estado(self, id_trabajo: str) -> dict | None:
+        """
+        Devuelve {'id', 'estado', 'resultado', 'error', 'segundos'} del trabajo, o None si no existe.
+        """
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT id, estado, resultado, error, creado, actualizado FROM trabajos WHERE id = ?",
+                (id_trabajo,)
+            ).fetchone()
+        if fila is None:
+            return None
+        id_trabajo, estado, resultado, error, creado, actualizado = fila
+        fin = actualizado if estado in (TERMINADO, ERROR) else time.time()
+        return {
+            "id": id_trabajo,
+            "estado": estado,
+            "resultado": resultado,
+            "error": error,
+            "segundos": round(fin - creado, 1),
+        }
+
+
+_cola: ColaTrabajos | None = None
+_cola_lock = threading.Lock()
+
+
+def obtener_cola() -> ColaTrabajos:
+    """Devuelve la cola de trabajos compartida del proceso."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaTrabajos()
+        return _cola
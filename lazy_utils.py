@@ -0,0 +1,70 @@
+import importlib
+import sys
+import threading
+
+# Las importaciones perezosas se hacen de una en una: dos hilos importando a la vez un paquete
+# con dependencias circulares entre sus módulos (LiteLLM, CrewAI) pueden cruzarse en los locks
+# por módulo de importlib y fallar con _DeadlockError
+_importacion_lock = threading.RLock()
+
+
+def importar(nombre: str):
+    """
+    Devuelve el módulo 'nombre', importándolo bajo _importacion_lock si aún no está cargado
+    del todo (un módulo a medio inicializar ya figura en sys.modules).
+    """
+    modulo = sys.modules.get(nombre)
+    if modulo is not None and not getattr(getattr(modulo, "__spec__", None), "_initializing", False):
+        return modulo
+    with _importacion_lock:
+        return importlib.import_module(nombre)
+
+
+class ModuloPerezoso:
+    """
+    Representa un módulo que se importa la primera vez que se usa uno de sus atributos, para
+    que las dependencias pesadas (Prophet, CrewAI, LiteLLM, yfinance, Plotly) no se carguen al
+    arrancar cada proceso sino en la primera petición que las necesita. La lectura y escritura
+    de atributos se delegan en el módulo real (monkeypatch incluido).
+    """
+
+    def __init__(self, nombre: str):
+        object.__setattr__(self, "_nombre", nombre)
+
+    def _cargar(self):
+        return importar(self._nombre)
+
+    def __getattr__(self, atributo: str):
+        return getattr(self._cargar(), atributo)
+
+    def __setattr__(self, atributo: str, valor) -> None:
+        setattr(self._cargar(), atributo, valor)
+
+    def __delattr__(self, atributo: str) -> None:
+        delattr(self._cargar(), atributo)
+
+    def __repr__(self) -> str:
+        return f"<módulo perezoso {self._nombre!r}>"
+
+
+class ObjetoPerezoso:
+    """
+    Un atributo (normalmente una clase) de un módulo que se importa al llamarlo o al acceder
+    a sus atributos, p.ej. Prophet() o Process.sequential.
+    """
+
+    def __init__(self, modulo: str, nombre: str):
+        self._modulo = modulo
+        self._nombre = nombre
+
+    def _cargar(self):
+        return getattr(importar(self._modulo), self._nombre)
+
+    def __call__(self, *args, **kwargs):
+        return self._cargar()(*args, **kwargs)
+
+    def __getattr__(self, atributo: str):
+        return getattr(self._cargar(), atributo)
+
+    def __repr__(self) -> str:
+        return f"<{self._modulo}.{self._nombre} perezoso>"
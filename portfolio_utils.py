@@ -0,0 +1,120 @@
+import hashlib
+import json
+import threading
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from data_utils import empresas_ibex35
+from risk_utils import SESIONES_ANIO
+from store_utils import obtener_store
+
+# Cache de resultados por (huella de la cartera, años, versión de los datos)
+_rendimiento_cache = LRUCache(maxsize=512)
+# Cache del panel de cierres del universo por (años, versión de los datos)
+_panel_cache = LRUCache(maxsize=4)
+_cartera_lock = threading.Lock()
+
+
+def huella_cartera(owned: dict) -> str:
+    """Huella de las posiciones (ticker y número de acciones) de una cartera."""
+    posiciones = sorted((t, float(d.get("shares", 0))) for t, d in owned.items())
+    return hashlib.sha1(json.dumps(posiciones).encode()).hexdigest()[:16]
+
+
+def calcular_rendimiento(panel: pd.DataFrame, acciones: pd.Series) -> dict:
+    """
+    Rendimiento histórico de una cartera de 'acciones' (ticker -> número de acciones) sobre el
+    panel de cierres (fechas x tickers), con todas las operaciones como productos matriciales:
+      - 'curva': DataFrame por fecha con el valor de la cartera (€), el índice de rentabilidad
+        ponderada en el tiempo (base 1) y el drawdown sobre ese índice.
+      - 'metricas': rentabilidad total y anualizada (TWR), volatilidad anualizada y máximo
+        drawdown (en tanto por uno), y ganancia total (€).
+      - 'contribucion': DataFrame por ticker con la ganancia (€), la contribución a la
+        rentabilidad (suma de peso x rendimiento diario) y el peso al final.
+    Cada día sólo cuentan los tickers con cierre ese día y el anterior, de modo que los huecos
+    y los valores que empiezan a cotizar a mitad del periodo no generan saltos en el índice.
+    """
+    h = acciones.reindex(panel.columns).fillna(0.0).to_numpy(dtype=float)
+    P = panel.to_numpy(dtype=float)
+    con_precio = ~np.isnan(P)
+    P0 = np.where(con_precio, P, 0.0)
+
+    valor = P0 @ h
+    ambos = con_precio[1:] & con_precio[:-1]
+    dP = np.where(ambos, P0[1:] - P0[:-1], 0.0)
+    base = np.where(ambos, P0[:-1], 0.0) @ h
+    ganancia = dP * h                      # € por día y ticker
+    with np.errstate(invalid="ignore", divide="ignore"):
+        aporte = np.where(base[:, None] > 0, ganancia / base[:, None], 0.0)
+    r = aporte.sum(axis=1)
+
+    indice = np.concatenate([[1.0], np.cumprod(1 + r)])
+    drawdown = indice / np.maximum.accumulate(indice) - 1
+    curva = pd.DataFrame({"Valor": valor, "Indice": indice, "Drawdown": drawdown}, index=panel.index)
+
+    n = len(r)
+    total = indice[-1] - 1
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        metricas = {
+            "rentabilidad": float(total) if n else np.nan,
+            "rentabilidad_anual": float((1 + total) ** (SESIONES_ANIO / n) - 1) if n else np.nan,
+            "volatilidad": float(r.std(ddof=1) * np.sqrt(SESIONES_ANIO)) if n > 1 else np.nan,
+            "max_drawdown": float(drawdown.min()) if len(drawdown) else np.nan,
+            "ganancia": float(ganancia.sum()),
+        }
+
+    contribucion = pd.DataFrame({
+        "Ganancia": ganancia.sum(axis=0),
+        "Contribucion": aporte.sum(axis=0),
+        "Peso": np.divide(P0[-1] * h, valor[-1], out=np.zeros_like(h), where=valor[-1] > 0)
+        if len(valor) else np.zeros_like(h),
+    }, index=panel.columns)
+    contribucion = contribucion.loc[h != 0]
+    return {"curva": curva, "metricas": metricas, "contribucion": contribucion}
+
+
+def _panel_universo(tickers: list[str], anios: int, version: str) -> pd.DataFrame:
+    clave = (tuple(tickers), anios, version)
+    with _cartera_lock:
+        panel = _panel_cache.get(clave)
+    if panel is None:
+        inicio = pd.Timestamp(datetime.today() - pd.DateOffset(years=anios)).normalize()
+        panel = obtener_store().panel(tickers, start=inicio).ffill()
+        with _cartera_lock:
+            _panel_cache[clave] = panel
+    return panel
+
+
+def rendimiento_cartera(owned: dict, anios: int = 1) -> dict | None:
+    """
+    Rendimiento histórico (ver calcular_rendimiento) de la cartera de la sesión en los últimos
+    'anios' años, o None si está vacía. El panel de cierres se lee una vez por sesión bursátil
+    para todo el universo (IBEX35 más los tickers de la cartera) y cada cartera se calcula con
+    un producto matricial; los resultados se cachean por (cartera, años, versión de los datos)
+    y no deben modificarse.
+    """
+    acciones = pd.Series({t: d.get("shares", 0) for t, d in owned.items() if d.get("shares")}, dtype=float)
+    if acciones.empty:
+        return None
+    universo = list(dict.fromkeys(list(empresas_ibex35.values()) + sorted(acciones.index)))
+    store = obtener_store()
+    store.actualizar(universo)
+    version = store.version(universo)
+    clave = (huella_cartera(owned), anios, version)
+    with _cartera_lock:
+        resultado = _rendimiento_cache.get(clave)
+    if resultado is not None:
+        return resultado
+
+    panel = _panel_universo(universo, anios, version)
+    if panel.empty:
+        return None
+    resultado = calcular_rendimiento(panel, acciones)
+    with _cartera_lock:
+        _rendimiento_cache[clave] = resultado
+    return resultado
@@ -0,0 +1,312 @@
+"""
+Capa de acceso a datos de mercado. Todo el código de la aplicación pide precios y
+fundamentales al proveedor de obtener_proveedor(), elegido con MERCADO_PROVEEDOR:
+  - yfinance (por defecto): Yahoo Finance con concurrencia acotada, limitación de ritmo,
+    reintentos con backoff y circuit breaker.
+  - fixture: datos grabados en MERCADO_FIXTURES (ver ProveedorFixture.grabar) o, para los
+    tickers sin grabación, series sintéticas deterministas; con MERCADO_LATENCIA simula el
+    tiempo de respuesta de Yahoo para pruebas de carga y benchmarks sin red.
+Las descargas devuelven el mismo formato que yf.download(group_by="ticker").
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from lazy_utils import ModuloPerezoso
+from rate_utils import Interruptor, TokenBucket, reintentar
+
+# yfinance se importa en la primera descarga
+yf = ModuloPerezoso("yfinance")
+
+log = logging.getLogger(__name__)
+
+MERCADO_PROVEEDOR = os.getenv("MERCADO_PROVEEDOR", "yfinance")
+MERCADO_FIXTURES = os.getenv("MERCADO_FIXTURES")
+MERCADO_LATENCIA = float(os.getenv("MERCADO_LATENCIA", "0"))
+
+# Límites de las llamadas a Yahoo Finance
+YF_CONEXIONES = int(os.getenv("YF_CONEXIONES", "8"))
+YF_POR_MINUTO = float(os.getenv("YF_POR_MINUTO", "300"))
+# Ráfaga admitida sin esperar: una foto de mercado completa (una descarga y 35 .info)
+YF_RAFAGA = float(os.getenv("YF_RAFAGA", "40"))
+YF_INTENTOS = int(os.getenv("YF_INTENTOS", "3"))
+YF_UMBRAL_FALLOS = int(os.getenv("YF_UMBRAL_FALLOS", "5"))
+YF_ENFRIAMIENTO = float(os.getenv("YF_ENFRIAMIENTO", "60"))
+
+# Primer día de las series sintéticas (el mismo desde el que el almacén pide el histórico)
+INICIO_SINTETICO = "2000-01-01"
+
+COLUMNAS_OHLC = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+
+class ErrorProveedor(Exception):
+    """El proveedor no pudo servir los datos (tras agotar los reintentos)."""
+
+
+class ProveedorNoDisponible(ErrorProveedor):
+    """El circuit breaker está abierto: no se llama al proveedor hasta que se enfríe."""
+
+
+class Proveedor(ABC):
+    """Base de los proveedores: cuenta las llamadas que llegan al origen de datos."""
+
+    def __init__(self):
+        self.llamadas = {"descargar": 0, "info": 0}
+        self._contador_lock = threading.Lock()
+
+    def _contar(self, tipo: str) -> None:
+        with self._contador_lock:
+            self.llamadas[tipo] += 1
+
+    @abstractmethod
+    def descargar(self, tickers: list[str], start=None, end=None, period: str | None = None) -> pd.DataFrame:
+        """Barras diarias OHLC de los tickers, agrupadas por ticker (columnas MultiIndex)."""
+
+    @abstractmethod
+    def info(self, ticker: str) -> dict:
+        """Información fundamental del ticker (el diccionario .info de yfinance)."""
+
+
+def _sin_datos(data: pd.DataFrame | None, tickers: list[str]) -> bool:
+    """Indica si la descarga no trae ningún valor de los tickers pedidos (vacía o todo NaN)."""
+    if data is None or data.empty:
+        return True
+    if isinstance(data.columns, pd.MultiIndex):
+        presentes = [t for t in tickers if t in data.columns.get_level_values(0)]
+        if not presentes:
+            return True
+        data = data[presentes]
+    return bool(data.isna().all().all())
+
+
+class ProveedorYFinance(Proveedor):
+    """
+    Yahoo Finance con como mucho 'conexiones' llamadas simultáneas, 'por_minuto' llamadas por
+    minuto con ráfagas de hasta 'rafaga' (token bucket), 'intentos' intentos con backoff exponencial y jitter, y un circuit
+    breaker que deja de llamar durante 'enfriamiento' segundos tras 'umbral' fallos seguidos.
+    Cada hilo de descarga de yf.download cuenta como una conexión, y una descarga sin datos de
+    ninguno de los tickers pedidos (yfinance no lanza excepciones) cuenta como fallo.
+    """
+
+    def __init__(self, conexiones: int = YF_CONEXIONES, por_minuto: float = YF_POR_MINUTO,
+                 rafaga: float = YF_RAFAGA, intentos: int = YF_INTENTOS, umbral: int = YF_UMBRAL_FALLOS,
+                 enfriamiento: float = YF_ENFRIAMIENTO, backoff: float = 1.0):
+        super().__init__()
+        self.conexiones = conexiones
+        self.intentos = intentos
+        self.backoff = backoff
+        self.ritmo = TokenBucket.por_minuto(por_minuto, capacidad=rafaga)
+        self.interruptor = Interruptor(umbral, enfriamiento)
+        self._conexiones = threading.BoundedSemaphore(conexiones)
+        # Serializa las reservas de varias conexiones para que dos descargas no se bloqueen
+        # entre sí con la mitad de las conexiones cada una
+        self._reserva_lock = threading.Lock()
+
+    @contextmanager
+    def _reservar(self, n: int):
+        with self._reserva_lock:
+            for _ in range(n):
+                self._conexiones.acquire()
+        try:
+            yield
+        finally:
+            for _ in range(n):
+                self._conexiones.release()
+
+    def _una_llamada(self, tipo: str, funcion, *args, conexiones: int = 1, **kwargs):
+        with self._reservar(conexiones):
+            self.ritmo.adquirir()
+            self._contar(tipo)
+            return funcion(*args, **kwargs)
+
+    def _llamar(self, tipo: str, funcion, *args, **kwargs):
+        if not self.interruptor.permitir():
+            raise ProveedorNoDisponible("Yahoo Finance no disponible temporalmente")
+        try:
+            resultado = reintentar(self._una_llamada, tipo, funcion, *args, intentos=self.intentos,
+                                   base=self.backoff, maximo=30.0, **kwargs)
+        except Exception as e:
+            self.interruptor.fallo()
+            raise ErrorProveedor(f"{tipo} falló tras {self.intentos} intentos: {e}") from e
+        self.interruptor.exito()
+        return resultado
+
+    def descargar(self, tickers: list[str], start=None, end=None, period: str | None = None) -> pd.DataFrame:
+        tickers = list(tickers)
+        parametros = {"period": period} if period else {"start": start, "end": end}
+        # yf.download abre un hilo por ticker (hasta 'hilos'): se reservan otras tantas conexiones
+        hilos = max(1, min(len(tickers), self.conexiones))
+        return self._llamar("descargar", self._descargar_yahoo, tickers, hilos, parametros, conexiones=hilos)
+
+    @staticmethod
+    def _descargar_yahoo(tickers: list[str], hilos: int, parametros: dict) -> pd.DataFrame:
+        data = yf.download(tickers=tickers, group_by="ticker", progress=False,
+                           threads=hilos if hilos > 1 else False, **parametros)
+        if _sin_datos(data, tickers):
+            raise ErrorProveedor(f"Yahoo Finance no devolvió datos de {', '.join(tickers)}")
+        return data
+
+    def info(self, ticker: str) -> dict:
+        return self._llamar("info", lambda: yf.Ticker(ticker).info) or {}
+
+
+def _desplazamiento(period: str) -> pd.DateOffset:
+    """DateOffset de un periodo de yfinance ('5d', '1mo', '1y'...)."""
+    m = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not m:
+        raise ValueError(f"Periodo no soportado: {period}")
+    n, unidad = int(m.group(1)), m.group(2)
+    return {"d": pd.DateOffset(days=n), "wk": pd.DateOffset(weeks=n),
+            "mo": pd.DateOffset(months=n), "y": pd.DateOffset(years=n)}[unidad]
+
+
+class ProveedorFixture(Proveedor):
+    """
+    Datos de mercado sin red: los tickers grabados en 'directorio' (<ticker>.csv e info.json)
+    se sirven tal cual y el resto con series sintéticas deterministas (paseo aleatorio con la
+    semilla del ticker, en días laborables hasta hoy). Cada llamada espera 'latencia' segundos.
+    """
+
+    def __init__(self, directorio: str | None = MERCADO_FIXTURES, latencia: float = MERCADO_LATENCIA,
+                 semilla: int = 0):
+        super().__init__()
+        self.directorio = directorio
+        self.latencia = latencia
+        self.semilla = semilla
+        self._series = {}
+        self._info = None
+        self._lock = threading.Lock()
+
+    def _semilla(self, ticker: str) -> int:
+        return zlib.crc32(ticker.encode()) + self.semilla
+
+    def _sintetica(self, ticker: str) -> pd.DataFrame:
+        fechas = pd.bdate_range(INICIO_SINTETICO, pd.Timestamp.today().normalize())
+        rng = np.random.default_rng(self._semilla(ticker))
+        inicial = rng.uniform(2, 150)
+        cierre = inicial * np.exp(np.cumsum(rng.normal(0.0002, 0.015, len(fechas))))
+        apertura = cierre * np.exp(rng.normal(0, 0.005, len(fechas)))
+        rango = np.abs(rng.normal(0, 0.01, len(fechas)))
+        return pd.DataFrame({
+            "Open": apertura,
+            "High": np.maximum(apertura, cierre) * (1 + rango),
+            "Low": np.minimum(apertura, cierre) * (1 - rango),
+            "Close": cierre,
+            "Adj Close": cierre,
+            "Volume": rng.integers(1e5, 1e7, len(fechas)).astype(float),
+        }, index=pd.DatetimeIndex(fechas, name="Date"))
+
+    def serie(self, ticker: str) -> pd.DataFrame:
+        """Histórico completo del ticker (grabado o sintético)."""
+        with self._lock:
+            if ticker not in self._series:
+                ruta = os.path.join(self.directorio, f"{ticker}.csv") if self.directorio else None
+                if ruta and os.path.exists(ruta):
+                    self._series[ticker] = pd.read_csv(ruta, index_col="Date", parse_dates=["Date"])
+                else:
+                    self._series[ticker] = self._sintetica(ticker)
+            return self._series[ticker]
+
+    def descargar(self, tickers: list[str], start=None, end=None, period: str | None = None) -> pd.DataFrame:
+        self._contar("descargar")
+        time.sleep(self.latencia)
+        partes = {}
+        for ticker in tickers:
+            df = self.serie(ticker)
+            if period:
+                df = df.loc[df.index > df.index.max() - _desplazamiento(period)] if len(df) else df
+            else:
+                if start is not None:
+                    df = df.loc[df.index >= pd.Timestamp(start)]
+                if end is not None:
+                    df = df.loc[df.index < pd.Timestamp(end)]
+            partes[ticker] = df
+        if not partes:
+            return pd.DataFrame()
+        return pd.concat(partes, axis=1)
+
+    def info(self, ticker: str) -> dict:
+        self._contar("info")
+        time.sleep(self.latencia)
+        with self._lock:
+            if self._info is None:
+                ruta = os.path.join(self.directorio, "info.json") if self.directorio else None
+                self._info = {}
+                if ruta and os.path.exists(ruta):
+                    with open(ruta, encoding="utf-8") as f:
+                        self._info = json.load(f)
+        if ticker in self._info:
+            return dict(self._info[ticker])
+        rng = np.random.default_rng(self._semilla(ticker))
+        return {
+            "longName": ticker.split(".")[0],
+            "sector": "N/A",
+            "country": "Spain",
+            "trailingPE": round(float(rng.uniform(5, 30)), 2),
+            "priceToBook": round(float(rng.uniform(0.5, 5)), 2),
+            "dividendYield": round(float(rng.uniform(0, 7)), 2),
+            "beta": round(float(rng.uniform(0.5, 1.5)), 2),
+            "marketCap": float(rng.uniform(1e9, 1e11)),
+        }
+
+    @staticmethod
+    def grabar(directorio: str, tickers: list[str], proveedor: Proveedor | None = None,
+               start: str = INICIO_SINTETICO) -> None:
+        """Graba en 'directorio' el histórico y la información de los tickers para reproducirlos."""
+        proveedor = proveedor or ProveedorYFinance()
+        os.makedirs(directorio, exist_ok=True)
+        data = proveedor.descargar(tickers, start=start)
+        for ticker in tickers:
+            if isinstance(data.columns, pd.MultiIndex):
+                if ticker not in data.columns.get_level_values(0):
+                    continue
+                barras = data[ticker]
+            else:
+                barras = data
+            columnas = [c for c in COLUMNAS_OHLC if c in barras.columns]
+            barras[columnas].dropna(how="all").rename_axis("Date").to_csv(os.path.join(directorio, f"{ticker}.csv"))
+        info = {}
+        for ticker in tickers:
+            try:
+                info[ticker] = proveedor.info(ticker)
+            except ErrorProveedor as e:
+                log.warning("Sin información de %s: %s", ticker, e)
+        with open(os.path.join(directorio, "info.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=1, default=str)
+
+
+PROVEEDORES = {"yfinance": ProveedorYFinance, "fixture": ProveedorFixture}
+
+_proveedor: Proveedor | None = None
+_proveedor_lock = threading.Lock()
+
+
+def obtener_proveedor() -> Proveedor:
+    """Proveedor de datos de mercado compartido del proceso, según MERCADO_PROVEEDOR."""
+    global _proveedor
+    with _proveedor_lock:
+        if _proveedor is None:
+            _proveedor = PROVEEDORES[MERCADO_PROVEEDOR]()
+        return _proveedor
+
+
+if __name__ == "__main__":
+    from data_utils import empresas_ibex35
+
+    parser = argparse.ArgumentParser(description="Graba datos de mercado para MERCADO_PROVEEDOR=fixture.")
+    parser.add_argument("directorio")
+    parser.add_argument("--tickers", nargs="*", default=list(empresas_ibex35.values()))
+    parser.add_argument("--desde", default=INICIO_SINTETICO)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ProveedorFixture.grabar(args.directorio, args.tickers, start=args.desde)
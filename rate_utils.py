@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limitador de ritmo compartido entre hilos: admite ráfagas de hasta 'capacidad' llamadas
+    y, en régimen, 'tasa' llamadas por segundo.
+    """
+
+    def __init__(self, tasa: float, capacidad: float | None = None):
+        if tasa <= 0:
+            raise ValueError("La tasa debe ser positiva")
+        self.tasa = tasa
+        self.capacidad = capacidad if capacidad is not None else max(1.0, tasa)
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def por_minuto(cls, llamadas: float, capacidad: float | None = None) -> "TokenBucket":
+        return cls(llamadas / 60.0, capacidad)
+
+    def _recargar(self) -> None:
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def adquirir(self, tokens: float = 1.0, timeout: float | None = None) -> bool:
+        """
+        Espera hasta disponer de 'tokens' y los consume. Devuelve False si no lo consigue
+        antes de 'timeout' segundos (None = esperar lo necesario).
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._recargar()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                espera = (tokens - self._tokens) / self.tasa
+            if limite is not None:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                espera = min(espera, restante)
+            time.sleep(espera)
+
+
+def espera_backoff(intento: int, base: float = 1.0, maximo: float = 60.0, jitter: bool = True) -> float:
+    """
+    Segundos a esperar antes del reintento número 'intento' (0, 1, ...): backoff exponencial
+    acotado por 'maximo' y, con jitter, elegido al azar en [0, espera] para no sincronizar
+    a los clientes que reintentan a la vez.
+    """
+    espera = min(maximo, base * 2 ** intento)
+    return random.uniform(0, espera) if jitter else espera
+
+
+def reintentar(funcion, *args, intentos: int = 3, transitorias: tuple = (Exception,),
+               base: float = 1.0, maximo: float = 60.0, jitter: bool = True, **kwargs):
+    """
+    Llama a funcion(*args, **kwargs) hasta 'intentos' veces, esperando con backoff entre
+    intentos cuando falla con una excepción 'transitoria'. Las demás, y la del último
+    intento, se propagan.
+    """
+    for intento in range(intentos):
+        try:
+            return funcion(*args, **kwargs)
+        except transitorias:
+            if intento == intentos - 1:
+                raise
+            time.sleep(espera_backoff(intento, base, maximo, jitter))
+
+
+class Interruptor:
+    """
+    Circuit breaker: tras 'umbral' fallos seguidos se abre y rechaza las llamadas durante
+    'enfriamiento' segundos; después deja pasar una única llamada de prueba, que lo cierra
+    si sale bien o lo vuelve a abrir si falla.
+    """
+
+    def __init__(self, umbral: int = 5, enfriamiento: float = 60.0):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.estado = "cerrado"
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        """Indica si puede hacerse una llamada (en semiabierto, sólo la de prueba)."""
+        with self._lock:
+            if self.estado == "cerrado":
+                return True
+            if self.estado == "abierto" and time.monotonic() - self._abierto_desde >= self.enfriamiento:
+                self.estado = "semiabierto"
+                return True
+            return False
+
+    def exito(self) -> None:
+        with self._lock:
+            self.estado = "cerrado"
+            self._fallos = 0
+
+    def fallo(self) -> None:
+        with self._lock:
+            self._fallos += 1
+            if self.estado == "semiabierto" or self._fallos >= self.umbral:
+                self.estado = "abierto"
+                self._abierto_desde = time.monotonic()
@@ -0,0 +1,160 @@
+import threading
+import warnings
+from datetime import datetime
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+
+from store_utils import obtener_store
+
+# Índice de referencia para la beta
+TICKER_INDICE = "^IBEX"
+
+# Sesiones bursátiles por año para anualizar
+SESIONES_ANIO = 252
+
+# Nivel de confianza de VaR y CVaR
+NIVEL_CONFIANZA = 0.95
+
+# Cache de métricas por (tickers, años, versión de los datos): cambia con cada sesión nueva
+_riesgo_cache = LRUCache(maxsize=4)
+_riesgo_lock = threading.Lock()
+
+
+def calcular_riesgo(panel: pd.DataFrame, indice: pd.Series | None = None,
+                    nivel: float = NIVEL_CONFIANZA) -> dict[str, pd.DataFrame]:
+    """
+    Métricas de riesgo de todas las columnas del panel de precios (fechas x tickers) en una
+    pasada vectorizada sobre los rendimientos diarios:
+      - 'metricas': volatilidad anualizada, beta frente al índice (o, si no hay índice, frente
+        a la media equiponderada del panel), VaR y CVaR diarios históricos y paramétricos
+        (normales) al 'nivel' indicado, y máximo drawdown; todo en tanto por uno.
+      - 'correlacion': matriz de correlaciones de los rendimientos.
+    Los huecos (NaN) de cada ticker se excluyen de sus cálculos.
+    """
+    precios = panel.ffill()
+    rend = precios.pct_change(fill_method=None).iloc[1:]
+    R = rend.to_numpy(dtype=float)
+    validos = ~np.isnan(R)
+    n = validos.sum(axis=0)
+    R0 = np.where(validos, R, 0.0)
+
+    media = R0.sum(axis=0) / np.maximum(n, 1)
+    desv = np.where(validos, R - media, 0.0)
+    var = (desv ** 2).sum(axis=0) / np.maximum(n - 1, 1)
+    sigma = np.sqrt(var)
+
+    # Beta: covarianza con el mercado sobre las mismas fechas válidas de cada ticker
+    if indice is not None and not indice.dropna().empty:
+        mercado = indice.reindex(precios.index).ffill().pct_change(fill_method=None).iloc[1:].to_numpy(dtype=float)
+    else:
+        por_fecha = validos.sum(axis=1)
+        mercado = np.divide(R0.sum(axis=1), por_fecha, out=np.full(len(R), np.nan), where=por_fecha > 0)
+    ambos = validos & ~np.isnan(mercado)[:, None]
+    m = np.where(ambos, mercado[:, None], 0.0)
+    x = np.where(ambos, R, 0.0)
+    k = np.maximum(ambos.sum(axis=0), 2)
+    media_m = m.sum(axis=0) / k
+    media_x = x.sum(axis=0) / k
+    cov = (np.where(ambos, (x - media_x) * (m - media_m), 0.0)).sum(axis=0) / (k - 1)
+    var_m = (np.where(ambos, (m - media_m) ** 2, 0.0)).sum(axis=0) / (k - 1)
+    beta = np.divide(cov, var_m, out=np.full_like(cov, np.nan), where=var_m > 0)
+
+    # VaR/CVaR históricos: cuantil de pérdidas y media de la cola
+    with warnings.catch_warnings():
+        # Columnas sin datos: dan NaN, que es lo esperado
+        warnings.simplefilter("ignore", RuntimeWarning)
+        cuantil = np.nanquantile(R, 1 - nivel, axis=0)
+        cvar_hist = -np.nanmean(np.where(validos & (R <= cuantil), R, np.nan), axis=0)
+
+    # VaR/CVaR paramétricos con rendimientos normales
+    normal = NormalDist()
+    z = normal.inv_cdf(1 - nivel)
+    var_param = -(media + z * sigma)
+    cvar_param = -(media - sigma * normal.pdf(z) / (1 - nivel))
+
+    # Máximo drawdown sobre los precios (con huecos rellenados hacia delante)
+    P = precios.to_numpy(dtype=float)
+    maximos = np.fmax.accumulate(np.where(np.isnan(P), -np.inf, P), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdown = np.where(np.isfinite(maximos) & ~np.isnan(P), P / maximos - 1, np.nan)
+    max_dd = np.nanmin(np.where(np.isnan(drawdown), 0.0, drawdown), axis=0)
+
+    sin_datos = n < 2
+    metricas = pd.DataFrame({
+        "Volatilidad": sigma * np.sqrt(SESIONES_ANIO),
+        "Beta": beta,
+        "VaR_hist": -cuantil,
+        "CVaR_hist": cvar_hist,
+        "VaR_param": var_param,
+        "CVaR_param": cvar_param,
+        "MaxDD": max_dd,
+    }, index=panel.columns)
+    metricas.loc[sin_datos] = np.nan
+    return {"metricas": metricas, "correlacion": rend.corr()}
+
+
+def obtener_riesgo(tickers: list[str], anios: int = 1) -> dict[str, pd.DataFrame]:
+    """
+    Métricas de riesgo de los últimos 'anios' años para los tickers, sobre el panel del almacén
+    de precios y con TICKER_INDICE como mercado. Se calculan una vez por sesión bursátil
+    (la clave de cache es la versión de los datos) y no deben modificarse.
+    """
+    tickers = list(tickers)
+    store = obtener_store()
+    store.actualizar(tickers + [TICKER_INDICE])
+    clave = (tuple(tickers), anios, store.version(tickers + [TICKER_INDICE]))
+    with _riesgo_lock:
+        riesgo = _riesgo_cache.get(clave)
+    if riesgo is not None:
+        return riesgo
+
+    inicio = pd.Timestamp(datetime.today() - pd.DateOffset(years=anios)).normalize()
+    panel = store.panel(tickers + [TICKER_INDICE], start=inicio)
+    indice = panel.pop(TICKER_INDICE)
+    riesgo = calcular_riesgo(panel, indice)
+    with _riesgo_lock:
+        _riesgo_cache[clave] = riesgo
+    return riesgo
+
+
+def _fmt(valor: float, escala: float = 100, decimales: int = 1) -> str:
+    return "-" if pd.isna(valor) else f"{valor * escala:.{decimales}f}"
+
+
+def tabla_riesgo(riesgo: dict[str, pd.DataFrame], n_pares: int = 5) -> str:
+    """
+    Tabla compacta para el prompt: una línea por ticker con las métricas (en %, salvo la beta)
+    y un resumen de la matriz de correlaciones (media y pares más y menos correlacionados).
+    """
+    nivel = round(NIVEL_CONFIANZA * 100)
+    filas = [f"ticker|vol%|beta|VaR{nivel}h%|CVaR{nivel}h%|VaR{nivel}p%|CVaR{nivel}p%|maxDD%"]
+    for ticker, m in riesgo["metricas"].iterrows():
+        filas.append("|".join([
+            ticker.split(".")[0],
+            _fmt(m["Volatilidad"]),
+            _fmt(m["Beta"], escala=1, decimales=2),
+            _fmt(m["VaR_hist"], decimales=2),
+            _fmt(m["CVaR_hist"], decimales=2),
+            _fmt(m["VaR_param"], decimales=2),
+            _fmt(m["CVaR_param"], decimales=2),
+            _fmt(m["MaxDD"]),
+        ]))
+
+    corr = riesgo["correlacion"]
+    superior = corr.where(np.triu(np.ones(corr.shape, dtype=bool), k=1)).stack().dropna()
+    if not superior.empty:
+        def nombre(par):
+            return f"{par[0].split('.')[0]}-{par[1].split('.')[0]}"
+
+        ordenados = superior.sort_values()
+        filas.append(f"correlación media: {superior.mean():.2f}")
+        filas.append("más correlacionados: " + ", ".join(
+            f"{nombre(par)} {v:.2f}" for par, v in ordenados.iloc[::-1][:n_pares].items()
+        ))
+        filas.append("menos correlacionados: " + ", ".join(
+            f"{nombre(par)} {v:.2f}" for par, v in ordenados[:n_pares].items()
+        ))
+    return "\n".join(filas)
@@ -0,0 +1,227 @@
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from context_utils import texto_plano
+from store_utils import DATA_DIR
+
+# Backend de sesiones: "sqlite" (por defecto) o "fichero"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+
+# Segundos que se conserva una sesión sin actividad
+SESION_TTL = 30 * 24 * 3600
+
+# Mensajes del historial que se guardan completos; los anteriores se compactan
+HISTORIAL_COMPLETO = 20
+
+# Caracteres que se conservan de cada mensaje compactado
+CARACTERES_COMPACTADO = 200
+
+# Tamaño máximo de los datos de una sesión; por encima se descarta el historial más antiguo
+SESION_MAX_BYTES = 256 * 1024
+
+# Segundos entre purgas de sesiones caducadas
+INTERVALO_PURGA = 3600
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{20,64}$")
+
+
+class SesionServidor(CallbackDict, SessionMixin):
+    """Sesión cuyos datos viven en el servidor; la cookie sólo lleva el id firmado."""
+
+    def __init__(self, datos: dict | None = None, sid: str | None = None, nueva: bool = False):
+        def al_modificar(_):
+            self.modified = True
+
+        super().__init__(datos or {}, al_modificar)
+        self.sid = sid
+        self.new = nueva
+        self.modified = False
+
+
+class SesionesSQLite:
+    """Sesiones en una tabla SQLite (id, datos JSON, caducidad)."""
+
+    def __init__(self, ruta: str | None = None):
+        self.ruta = ruta or os.path.join(DATA_DIR, "sesiones.sqlite")
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones ("
+                " id TEXT PRIMARY KEY, datos TEXT NOT NULL, expira REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def leer(self, sid: str) -> str | None:
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT datos FROM sesiones WHERE id = ? AND expira > ?", (sid, time.time())
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def guardar(self, sid: str, datos: str, expira: float) -> None:
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO sesiones (id, datos, expira) VALUES (?, ?, ?)",
+                (sid, datos, expira)
+            )
+
+    def borrar(self, sid: str) -> None:
+        with self._conectar() as con:
+            con.execute("DELETE FROM sesiones WHERE id = ?", (sid,))
+
+    def purgar(self) -> None:
+        with self._conectar() as con:
+            con.execute("DELETE FROM sesiones WHERE expira <= ?", (time.time(),))
+
+
+class SesionesFichero:
+    """Sesiones como ficheros JSON (uno por id) en un directorio."""
+
+    def __init__(self, directorio: str | None = None):
+        self.directorio = directorio or os.path.join(DATA_DIR, "sesiones")
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, sid: str) -> str:
+        return os.path.join(self.directorio, f"{sid}.json")
+
+    def leer(self, sid: str) -> str | None:
+        try:
+            with open(self._ruta(sid), encoding="utf-8") as f:
+                registro = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return registro["datos"] if registro.get("expira", 0) > time.time() else None
+
+    def guardar(self, sid: str, datos: str, expira: float) -> None:
+        # Escritura atómica: nunca se lee un fichero a medio escribir
+        temporal = f"{self._ruta(sid)}.{secrets.token_hex(4)}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"expira": expira, "datos": datos}, f)
+        os.replace(temporal, self._ruta(sid))
+
+    def borrar(self, sid: str) -> None:
+        try:
+            os.remove(self._ruta(sid))
+        except FileNotFoundError:
+            pass
+
+    def purgar(self) -> None:
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".json") and self.leer(nombre[:-5]) is None:
+                self.borrar(nombre[:-5])
+
+
+BACKENDS = {"sqlite": SesionesSQLite, "fichero": SesionesFichero}
+
+
+def compactar_sesion(datos: dict, max_bytes: int = SESION_MAX_BYTES) -> str:
+    """
+    Serializa la sesión compactando el historial del asistente: los mensajes anteriores a los
+    últimos HISTORIAL_COMPLETO pasan a texto plano recortado y, si aun así se supera max_bytes,
+    se descartan los más antiguos.
+    """
+    historial = datos.get("asistente_history")
+    if historial:
+        antiguos = len(historial) - HISTORIAL_COMPLETO
+        for msg in historial[:max(antiguos, 0)]:
+            if not msg.get("compactado") and "trabajo" not in msg:
+                msg["user"] = texto_plano(msg["user"], CARACTERES_COMPACTADO)
+                msg["assistant"] = texto_plano(msg["assistant"], CARACTERES_COMPACTADO)
+                msg["compactado"] = True
+
+    serializado = session_json_serializer.dumps(dict(datos))
+    while historial and len(serializado.encode()) > max_bytes:
+        del historial[:max(1, len(historial) // 4)]
+        serializado = session_json_serializer.dumps(dict(datos))
+    return serializado
+
+
+class InterfazSesionServidor(SessionInterface):
+    """
+    Interfaz de sesiones de Flask con los datos en el servidor (backend intercambiable).
+    La cookie sólo contiene un id aleatorio firmado con la SECRET_KEY de la aplicación.
+    """
+
+    def __init__(self, backend=None, ttl: int = SESION_TTL):
+        self.backend = backend or BACKENDS[SESSION_BACKEND]()
+        self.ttl = ttl
+        self._ultima_purga = 0.0
+        self._lock = threading.Lock()
+
+    def _firmante(self, app) -> Signer:
+        return Signer(app.secret_key, salt="sesion-servidor")
+
+    def open_session(self, app, request) -> SesionServidor:
+        firmado = request.cookies.get(self.get_cookie_name(app))
+        if firmado:
+            try:
+                sid = self._firmante(app).unsign(firmado).decode()
+            except BadSignature:
+                sid = None
+            if sid and _ID_VALIDO.match(sid):
+                datos = self.backend.leer(sid)
+                if datos is not None:
+                    return SesionServidor(session_json_serializer.loads(datos), sid=sid)
+        return SesionServidor(sid=secrets.token_urlsafe(32), nueva=True)
+
+    def save_session(self, app, session: SesionServidor, response) -> None:
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.backend.borrar(session.sid)
+                response.delete_cookie(nombre, domain=dominio, path=ruta)
+            return
+
+        if session.modified or session.new:
+            self.backend.guardar(session.sid, compactar_sesion(session), time.time() + self.ttl)
+            self._purgar_si_toca()
+
+        if self.should_set_cookie(app, session) or session.new:
+            response.set_cookie(
+                nombre,
+                self._firmante(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=dominio,
+                path=ruta,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+        response.vary.add("Cookie")
+
+    def guardar(self, session: SesionServidor) -> None:
+        """
+        Guarda la sesión fuera del ciclo petición/respuesta (p.ej. al final de una respuesta
+        en streaming, cuando las cabeceras con la cookie ya se enviaron).
+        """
+        self.backend.guardar(session.sid, compactar_sesion(session), time.time() + self.ttl)
+        session.modified = False
+
+    def _purgar_si_toca(self) -> None:
+        with self._lock:
+            if time.time() - self._ultima_purga < INTERVALO_PURGA:
+                return
+            self._ultima_purga = time.time()
+        self.backend.purgar()
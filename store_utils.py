@@ -0,0 +1,373 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from provider_utils import ErrorProveedor, obtener_proveedor
+
+# Directorio de datos locales (precios, caches...). Configurable para tests y despliegue.
+DATA_DIR = os.getenv("IBEX_DATA_DIR", "data")
+
+# Primer día que se descarga cuando un ticker aún no está en el almacén
+INICIO_HISTORICO = "2000-01-01"
+
+# Segundos durante los que se considera que un ticker está al día y no se consulta a yfinance
+ACTUALIZACION_TTL = 3600
+
+# Diferencia relativa a partir de la cual un cierre ajustado descargado no coincide con el guardado
+TOLERANCIA_AJUSTE = 1e-4
+
+COLUMNAS_OHLC = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+
+def _extraer_ohlc(data: pd.DataFrame, ticker: str) -> pd.DataFrame:
+    """
+    Extrae las columnas OHLC de un ticker de una descarga del proveedor de datos,
+    tanto si viene agrupada por ticker (MultiIndex) como con columnas planas.
+    """
+    if data is None or data.empty:
+        return pd.DataFrame()
+    if isinstance(data.columns, pd.MultiIndex):
+        if ticker not in data.columns.get_level_values(0):
+            return pd.DataFrame()
+        data = data[ticker]
+    columnas = [c for c in COLUMNAS_OHLC if c in data.columns]
+    return data[columnas].dropna(how="all")
+
+
+class PriceStore:
+    """
+    Almacén local de barras diarias en SQLite, indexado por (ticker, fecha).
+    Sólo se descargan del proveedor de datos las barras posteriores a la última fecha guardada.
+    """
+
+    def __init__(self, ruta: str | None = None, ttl: int = ACTUALIZACION_TTL):
+        self.ruta = ruta or os.path.join(DATA_DIR, "precios.sqlite")
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Tickers que otro hilo está actualizando -> evento que se activa al terminar
+        self._en_curso: dict[str, threading.Event] = {}
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS precios ("
+                " ticker TEXT NOT NULL, fecha TEXT NOT NULL,"
+                " open REAL, high REAL, low REAL, close REAL, adj_close REAL, volume REAL,"
+                " PRIMARY KEY (ticker, fecha))"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS actualizaciones ("
+                " ticker TEXT PRIMARY KEY, actualizado REAL NOT NULL)"
+            )
+            # Recargas completas del histórico de cada ticker (reajustes por dividendo o split)
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS revisiones ("
+                " ticker TEXT PRIMARY KEY, revision INTEGER NOT NULL)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS estados_indicadores ("
+                " ticker TEXT NOT NULL, nombre TEXT NOT NULL, fecha TEXT NOT NULL, estado TEXT NOT NULL,"
+                " PRIMARY KEY (ticker, nombre))"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS forecasts ("
+                " ticker TEXT NOT NULL, periodo INTEGER NOT NULL, clave TEXT NOT NULL,"
+                " creado REAL NOT NULL, datos TEXT NOT NULL,"
+                " PRIMARY KEY (ticker, periodo))"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def ultima_fecha(self, ticker: str, antes=None) -> pd.Timestamp | None:
+        """Fecha de la última barra guardada para el ticker (anterior a 'antes', si se indica)."""
+        consulta, params = "SELECT MAX(fecha) FROM precios WHERE ticker = ?", [ticker]
+        if antes is not None:
+            consulta += " AND fecha < ?"
+            params.append(pd.Timestamp(antes).strftime("%Y-%m-%d"))
+        with self._conectar() as con:
+            fila = con.execute(consulta, params).fetchone()
+        return pd.Timestamp(fila[0]) if fila and fila[0] else None
+
+    def guardar(self, ticker: str, df: pd.DataFrame) -> None:
+        """Inserta o reemplaza las barras de df (índice de fechas, columnas OHLC)."""
+        if df is None or df.empty:
+            return
+        df = df.reindex(columns=COLUMNAS_OHLC)
+        filas = [
+            (ticker, pd.Timestamp(fecha).strftime("%Y-%m-%d"),
+             *[None if pd.isna(v) else float(v) for v in valores])
+            for fecha, valores in zip(df.index, df.itertuples(index=False, name=None))
+        ]
+        with self._conectar() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO precios "
+                "(ticker, fecha, open, high, low, close, adj_close, volume) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                filas
+            )
+
+    def _pendientes(self, tickers: list[str]) -> list[str]:
+        limite = time.time() - self.ttl
+        with self._conectar() as con:
+            frescos = {
+                t for (t,) in con.execute(
+                    "SELECT ticker FROM actualizaciones WHERE actualizado >= ?", (limite,)
+                )
+            }
+        return [t for t in tickers if t not in frescos]
+
+    def _marcar_actualizados(self, tickers: list[str]) -> None:
+        ahora = time.time()
+        with self._conectar() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO actualizaciones (ticker, actualizado) VALUES (?, ?)",
+                [(t, ahora) for t in tickers]
+            )
+
+    def _misma_base(self, ticker: str, barras: pd.DataFrame, fecha: pd.Timestamp | None) -> bool:
+        """
+        Indica si el cierre ajustado de la barra 'fecha' descargada coincide con el guardado.
+        Tras un dividendo o un split Yahoo reajusta todo el histórico y dejan de coincidir.
+        'fecha' debe ser una sesión ya cerrada: la barra de hoy cambia con cada cotización.
+        """
+        if fecha is None or fecha not in barras.index:
+            return True
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT COALESCE(adj_close, close) FROM precios WHERE ticker = ? AND fecha = ?",
+                (ticker, fecha.strftime("%Y-%m-%d"))
+            ).fetchone()
+        barra = barras.loc[fecha]
+        nuevo = barra.get("Adj Close", np.nan)
+        nuevo = barra.get("Close", np.nan) if pd.isna(nuevo) else nuevo
+        if not fila or fila[0] is None or pd.isna(nuevo):
+            return True
+        return bool(np.isclose(float(nuevo), fila[0], rtol=TOLERANCIA_AJUSTE, atol=0))
+
+    def _reemplazar(self, ticker: str, barras: pd.DataFrame) -> None:
+        """Sustituye todo el histórico del ticker (y los estados de indicadores que dependían de él)."""
+        with self._conectar() as con:
+            con.execute("DELETE FROM precios WHERE ticker = ?", (ticker,))
+            con.execute("DELETE FROM estados_indicadores WHERE ticker = ?", (ticker,))
+            con.execute(
+                "INSERT INTO revisiones (ticker, revision) VALUES (?, 1) "
+                "ON CONFLICT (ticker) DO UPDATE SET revision = revision + 1",
+                (ticker,)
+            )
+        self.guardar(ticker, barras)
+
+    def actualizar(self, tickers: list[str]) -> None:
+        """
+        Trae del proveedor de datos las barras nuevas de los tickers que no se han consultado en 'ttl' segundos.
+        Los tickers ya guardados se piden desde su última sesión cerrada (las barras posteriores,
+        como la de hoy aún abierta, se reescriben) en una única descarga agrupada; los nuevos,
+        desde INICIO_HISTORICO. Si el cierre ajustado de esa sesión cerrada ha cambiado
+        (dividendo o split), el histórico del ticker se descarga entero otra vez para no mezclar
+        bases de ajuste. Sólo se marcan como actualizados los tickers que han recibido barras.
+        Las descargas se hacen sin el lock del almacén; un ticker que ya está actualizando otro
+        hilo no se vuelve a pedir, sino que se espera a que termine.
+        """
+        hecho = threading.Event()
+        with self._lock:
+            ajenos = {self._en_curso[t] for t in tickers if t in self._en_curso}
+            pendientes = [t for t in self._pendientes(list(tickers)) if t not in self._en_curso]
+            for t in pendientes:
+                self._en_curso[t] = hecho
+        try:
+            if pendientes:
+                self._descargar_pendientes(pendientes)
+        finally:
+            with self._lock:
+                for t in pendientes:
+                    del self._en_curso[t]
+            hecho.set()
+        for evento in ajenos:
+            evento.wait()
+
+    def _descargar_pendientes(self, pendientes: list[str]) -> None:
+        hoy = pd.Timestamp.today().normalize()
+        ultimas = {t: self.ultima_fecha(t) for t in pendientes}
+        cerradas = {t: self.ultima_fecha(t, antes=hoy) for t in pendientes}
+        nuevos = [t for t, f in ultimas.items() if f is None]
+        existentes = [t for t, f in ultimas.items() if f is not None]
+        end = (datetime.today() + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+        grupos = []
+        if nuevos:
+            grupos.append((nuevos, INICIO_HISTORICO))
+        if existentes:
+            desde = min(cerradas[t] or ultimas[t] for t in existentes).strftime("%Y-%m-%d")
+            grupos.append((existentes, desde))
+
+        reajustados = []
+        for grupo, start in grupos:
+            try:
+                data = obtener_proveedor().descargar(grupo, start=start, end=end)
+            except ErrorProveedor:
+                # Sin marcar como actualizados: se reintentará en la siguiente lectura
+                continue
+            recibidos = []
+            with self._lock:
+                for ticker in grupo:
+                    barras = _extraer_ohlc(data, ticker)
+                    if barras.empty:
+                        continue
+                    if ultimas[ticker] is not None and not self._misma_base(ticker, barras, cerradas[ticker]):
+                        reajustados.append(ticker)
+                        continue
+                    self.guardar(ticker, barras)
+                    recibidos.append(ticker)
+                self._marcar_actualizados(recibidos)
+
+        if reajustados:
+            try:
+                data = obtener_proveedor().descargar(reajustados, start=INICIO_HISTORICO, end=end)
+            except ErrorProveedor:
+                return
+            recibidos = []
+            with self._lock:
+                for ticker in reajustados:
+                    barras = _extraer_ohlc(data, ticker)
+                    if not barras.empty:
+                        self._reemplazar(ticker, barras)
+                        recibidos.append(ticker)
+                self._marcar_actualizados(recibidos)
+
+    def _consultar(self, tickers: list[str], start=None, end=None) -> pd.DataFrame:
+        marcas = ", ".join("?" for _ in tickers)
+        consulta = (
+            "SELECT ticker, fecha, open, high, low, close, adj_close, volume "
+            f"FROM precios WHERE ticker IN ({marcas})"
+        )
+        params: list = list(tickers)
+        if start is not None:
+            consulta += " AND fecha >= ?"
+            params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+        if end is not None:
+            consulta += " AND fecha < ?"
+            params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+        consulta += " ORDER BY fecha"
+        with self._conectar() as con:
+            filas = con.execute(consulta, params).fetchall()
+
+        df = pd.DataFrame(filas, columns=["Ticker", "Date"] + COLUMNAS_OHLC)
+        df["Date"] = pd.to_datetime(df["Date"])
+        df[COLUMNAS_OHLC] = df[COLUMNAS_OHLC].astype(float)
+        df["Precio"] = df["Adj Close"].fillna(df["Close"])
+        return df
+
+    def leer(self, ticker: str, start=None, end=None) -> pd.DataFrame:
+        """
+        Devuelve las barras guardadas del ticker con fecha en [start, end) como DataFrame
+        indexado por 'Date', con columnas OHLC y 'Precio' (Adj Close si existe, si no Close).
+        """
+        df = self._consultar([ticker], start, end)
+        return df.drop(columns="Ticker").set_index("Date")
+
+    def panel(self, tickers: list[str], start=None, end=None, columna: str = "Precio") -> pd.DataFrame:
+        """
+        Devuelve un DataFrame fechas x tickers con la columna indicada de cada ticker,
+        leído con una única consulta.
+        """
+        df = self._consultar(list(tickers), start, end)
+        panel = df.pivot(index="Date", columns="Ticker", values=columna)
+        panel.columns.name = None
+        return panel.reindex(columns=list(tickers)).sort_index()
+
+
+    def version(self, tickers: list[str]) -> str:
+        """
+        Versión de los datos de los tickers: huella de (fecha, cierre, cierre ajustado) de su
+        última barra y del número de recargas completas de su histórico. Cambia cuando llega
+        una barra nueva, se corrige la última o se reajusta el histórico, y sirve como clave de
+        caches.
+        """
+        tickers = list(tickers)
+        marcas = ", ".join("?" for _ in tickers)
+        with self._conectar() as con:
+            filas = con.execute(
+                "SELECT p.ticker, p.fecha, p.close, p.adj_close, COALESCE(r.revision, 0) FROM precios p "
+                "JOIN (SELECT ticker, MAX(fecha) AS fecha FROM precios "
+                f"      WHERE ticker IN ({marcas}) GROUP BY ticker) u "
+                "ON p.ticker = u.ticker AND p.fecha = u.fecha "
+                "LEFT JOIN revisiones r ON r.ticker = p.ticker",
+                tickers
+            ).fetchall()
+        return hashlib.sha1(repr(sorted(filas)).encode()).hexdigest()[:16]
+
+    def guardar_forecast(self, ticker: str, clave: str, periodo: int, forecast: pd.DataFrame) -> None:
+        """
+        Guarda el forecast del ticker para el horizonte 'periodo', sustituyendo al anterior.
+        """
+        datos = forecast.to_json(orient="split", date_format="iso", index=False)
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO forecasts (ticker, periodo, clave, creado, datos) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (ticker, periodo, clave, time.time(), datos)
+            )
+
+    def leer_forecast(self, ticker: str, clave: str) -> pd.DataFrame | None:
+        """
+        Devuelve el forecast guardado del ticker si se calculó con la misma clave
+        (última fecha, horizonte y huella de la serie); None en caso contrario.
+        """
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT datos FROM forecasts WHERE ticker = ? AND clave = ?", (ticker, clave)
+            ).fetchone()
+        if fila is None:
+            return None
+        forecast = pd.read_json(io.StringIO(fila[0]), orient="split")
+        forecast["ds"] = pd.to_datetime(forecast["ds"])
+        return forecast
+
+
+    def guardar_estado(self, ticker: str, nombre: str, fecha, estado: dict) -> None:
+        """Guarda el estado serializado de un indicador incremental tras procesar la barra 'fecha'."""
+        with self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO estados_indicadores (ticker, nombre, fecha, estado) "
+                "VALUES (?, ?, ?, ?)",
+                (ticker, nombre, pd.Timestamp(fecha).strftime("%Y-%m-%d"), json.dumps(estado))
+            )
+
+    def leer_estado(self, ticker: str, nombre: str) -> tuple[pd.Timestamp, dict] | None:
+        """Devuelve (fecha de la última barra procesada, estado) del indicador, o None."""
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT fecha, estado FROM estados_indicadores WHERE ticker = ? AND nombre = ?",
+                (ticker, nombre)
+            ).fetchone()
+        if fila is None:
+            return None
+        return pd.Timestamp(fila[0]), json.loads(fila[1])
+
+
+_store: PriceStore | None = None
+_store_lock = threading.Lock()
+
+
+def obtener_store() -> PriceStore:
+    """Devuelve el almacén de precios compartido del proceso."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PriceStore()
+        return _store
@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import pytest
+
+# Los datos locales (almacén de precios, caches) de los tests van a un directorio temporal
+os.environ.setdefault("IBEX_DATA_DIR", tempfile.mkdtemp(prefix="ibex35_tests_"))
+# Sin red en los tests: no se reintentan las llamadas a Yahoo Finance
+os.environ.setdefault("YF_INTENTOS", "1")
+
+
+@pytest.fixture(autouse=True)
+def proveedor_nuevo(monkeypatch):
+    # Cada test con su proveedor de datos: los fallos de uno no abren el circuito de los demás
+    monkeypatch.setattr("provider_utils._proveedor", None)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--benchmark", action="store_true", default=False,
+                     help="Ejecuta el benchmark sin red (benchmarks/rendimiento.py) contra su línea base.")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: benchmark de rendimiento; sólo se ejecuta con --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    saltar = pytest.mark.skip(reason="benchmark: ejecute pytest --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(saltar)
@@ -0,0 +1,99 @@
+import pytest
+
+import agents_utils
+from agents_utils import CacheLLM, run_chatbot_task
+
+
+class _CrewFalsa:
+    llamadas = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def kickoff(self, inputs):
+        _CrewFalsa.llamadas += 1
+        if inputs["pregunta"] == "falla":
+            raise RuntimeError("rate limit")
+        return f"Respuesta {_CrewFalsa.llamadas}"
+
+
+def test_cache_llm_memoria_disco_y_version(tmp_path, monkeypatch):
+    version = ["v1"]
+    ruta = str(tmp_path / "llm.sqlite")
+    # Sin construir el LLM, los agentes ni las tareas reales de CrewAI
+    monkeypatch.setattr(agents_utils, "crew", lambda agentes, tareas: _CrewFalsa())
+    monkeypatch.setattr(agents_utils, "_cache_llm", CacheLLM(ruta=ruta, version=lambda: version[0]))
+    _CrewFalsa.llamadas = 0
+
+    r1 = run_chatbot_task("SAN sube  un 2%", "¿Cómo va el mercado?")
+    # Mismas entradas salvo espacios: acierto en memoria, sin llamar al LLM
+    assert run_chatbot_task("SAN sube un 2%\n", "¿Cómo va el mercado?") == r1
+    assert _CrewFalsa.llamadas == 1
+
+    # Tras un reinicio (memoria vacía) la respuesta sale del disco
+    monkeypatch.setattr(agents_utils, "_cache_llm", CacheLLM(ruta=ruta, version=lambda: version[0]))
+    assert run_chatbot_task("SAN sube un 2%", "¿Cómo va el mercado?") == r1
+    assert _CrewFalsa.llamadas == 1
+
+    # Con datos de mercado nuevos la respuesta anterior ya no vale
+    version[0] = "v2"
+    assert run_chatbot_task("SAN sube un 2%", "¿Cómo va el mercado?") != r1
+    assert _CrewFalsa.llamadas == 2
+
+    # Los errores no se cachean
+    with pytest.raises(RuntimeError):
+        run_chatbot_task("ctx", "falla")
+    with pytest.raises(RuntimeError):
+        run_chatbot_task("ctx", "falla")
+    assert _CrewFalsa.llamadas == 4
+
+    stats = agents_utils.obtener_cache_llm().estadisticas()
+    assert stats["disco"] == 1 and stats["fallos"] == 3
+
+
+def test_stream_chatbot_comparte_cache(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from agents_utils import stream_chatbot_task
+
+    def chunk(texto):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=texto))])
+
+    llamadas = []
+
+    def completion(**kwargs):
+        llamadas.append(kwargs)
+        return iter([chunk("Hola"), chunk(None), chunk(", mundo")])
+
+    monkeypatch.setattr(agents_utils, "litellm", SimpleNamespace(completion=completion))
+    monkeypatch.setattr(agents_utils, "crew", lambda agentes, tareas: _CrewFalsa())
+    monkeypatch.setattr(agents_utils, "_cache_llm",
+                        CacheLLM(ruta=str(tmp_path / "llm.sqlite"), version=lambda: "v1"))
+    _CrewFalsa.llamadas = 0
+
+    assert list(stream_chatbot_task("ctx", "¿sube?")) == ["Hola", ", mundo"]
+    assert llamadas[0]["stream"] is True
+    # La respuesta completa queda en la cache que usa también la versión sin streaming
+    assert list(stream_chatbot_task("ctx", "¿sube?")) == ["Hola, mundo"]
+    assert run_chatbot_task("ctx", "¿sube?") == "Hola, mundo"
+    assert len(llamadas) == 1 and _CrewFalsa.llamadas == 0
+
+
+def test_crew_crea_tareas_nuevas_en_cada_llamada(monkeypatch):
+    from types import SimpleNamespace
+
+    # Constructores de CrewAI simulados: guardan sus argumentos
+    def registrar(**kwargs):
+        return SimpleNamespace(**kwargs)
+
+    for nombre in ("LLM", "Agent", "Task", "Crew"):
+        monkeypatch.setattr(agents_utils, nombre, registrar)
+    monkeypatch.setattr(agents_utils, "Process", SimpleNamespace(sequential="secuencial"))
+    monkeypatch.setattr(agents_utils, "_componentes", None)
+
+    a = agents_utils.crew(["stock_chatbot"], ["chat_query"])
+    b = agents_utils.crew(["stock_chatbot"], ["chat_query"])
+    # El LLM y los agentes se comparten; las tareas (con las entradas de cada ejecución) no
+    assert a.agents[0] is b.agents[0]
+    assert a is not b and a.tasks[0] is not b.tasks[0]
+    assert a.tasks[0].agent is a.agents[0]
+    assert a.tasks[0].description == agents_utils.TAREAS["chat_query"]["description"]
@@ -21,7 +21,32 @@ def test_mis_acciones_get_empty(client):
     assert resp.status_code == 200
     assert b"Registrar / Actualizar Acciones" in resp.data
 
-def test_mis_acciones_post_and_report(client):
+def test_mis_acciones_post_and_report(client, monkeypatch):
+    import smtplib
+    import pandas as pd
+    import email_utils
+    from data_utils import MarketSnapshot
+
+    # Sin red: mercado, comentario y servidor SMTP simulados
+    monkeypatch.setattr("app.precios_actuales", lambda tickers: {t: 10.0 for t in tickers})
+    monkeypatch.setattr("app.rendimiento_cartera", lambda owned: None)
+    monkeypatch.setattr(email_utils, "obtener_snapshot", lambda: MarketSnapshot(pd.DataFrame(), {}))
+    monkeypatch.setattr(email_utils, "run_chatbot_task", lambda ctx, prompt: "Mercado estable.")
+    monkeypatch.setattr(email_utils, "precios_actuales", lambda tickers: {t: 10.0 for t in tickers})
+    monkeypatch.setattr(email_utils, "rendimiento_cartera", lambda owned: None)
+    enviados = []
+
+    class SMTPFalso:
+        def send_message(self, msg):
+            if msg["To"] == "malo@example.com":
+                raise smtplib.SMTPRecipientsRefused({msg["To"]: (550, b"No existe")})
+            enviados.append(msg["To"])
+
+        def quit(self):
+            pass
+
+    monkeypatch.setattr(email_utils, "abrir_smtp", SMTPFalso)
+
     # Registrar 10 acciones de BBVA sin coste
     resp = client.post("/mis_acciones", data={
         "shares_BBVA.MC": "10",
@@ -29,10 +54,176 @@ def test_mis_acciones_post_and_report(client):
     }, follow_redirects=True)
     assert b"Acciones guardadas correctamente" in resp.data
 
-    # Ahora enviar reporte
+    # Ahora enviar reporte: uno se entrega y el otro lo rechaza el servidor
     resp2 = client.post("/enviar_reporte", data={
-        "emails": "test@example.com"
+        "emails": "test@example.com, malo@example.com"
     }, follow_redirects=True)
-    assert b"Reporte enviado a:" in resp2.data
+    html = resp2.get_data(as_text=True)
+    assert enviados == ["test@example.com"]
+    assert "Reporte enviado a: test@example.com" in html
+    assert "No se pudo enviar a: malo@example.com (Destinatario rechazado" in html
 
 # Tests para /asistente, /analisis_combinado, etc., pueden simul­arse con texto mínimo
+
+def test_api_figura_json_con_etag(client, monkeypatch):
+    import numpy as np
+    import pandas as pd
+    from store_utils import obtener_store
+
+    # Datos locales para el ticker y sin red para el resto
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: pd.DataFrame())
+    fechas = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=300)
+    obtener_store().guardar("SAN.MC", pd.DataFrame({"Close": np.linspace(3, 6, 300)}, index=fechas))
+
+    resp = client.get("/api/figuras/SAN.MC/rsi")
+    assert resp.status_code == 200
+    assert resp.is_json and "data" in resp.get_json()
+    assert "template" not in resp.get_json()["layout"]
+    etag = resp.headers["ETag"]
+
+    resp2 = client.get("/api/figuras/SAN.MC/rsi", headers={"If-None-Match": etag})
+    assert resp2.status_code == 304
+
+    # La resolución forma parte de la versión: la figura reducida y la completa no comparten ETag
+    reducida = client.get("/api/figuras/SAN.MC/rsi?ancho=100")
+    completa = client.get("/api/figuras/SAN.MC/rsi?completo=1")
+    assert reducida.headers["ETag"] != completa.headers["ETag"]
+    assert reducida.status_code == completa.status_code == 200
+
+    assert client.get("/api/figuras/SAN.MC/otra").status_code == 404
+    assert client.get("/api/figuras/FOO.MC/rsi").status_code == 404
+
+
+def test_etapas_en_paralelo_con_timeouts():
+    import time
+    from app import ejecutar_etapas
+
+    def lenta():
+        time.sleep(0.3)
+        return "ok"
+
+    def fallida():
+        raise RuntimeError("sin conexión")
+
+    inicio = time.monotonic()
+    res = ejecutar_etapas(
+        {"a": lenta, "b": lenta, "c": fallida, "d": lambda: time.sleep(2)},
+        {"a": 5, "b": 5, "c": 5, "d": 0.5}
+    )
+    # Las etapas se solapan: el total es el de la más lenta, no la suma
+    assert time.monotonic() - inicio < 1.2
+    assert res == {"a": "ok", "b": "ok", "c": None, "d": None}
+
+
+def test_analisis_combinado_renderiza_parcial(client, monkeypatch):
+    import json
+    monkeypatch.setattr("app.figura_json", lambda ticker, figura, motor="prophet": (
+        "v1", json.dumps({"data": [], "layout": {"title": {"text": figura}}})
+    ))
+
+    def sin_fundamental(ticker):
+        raise RuntimeError("yfinance caído")
+    monkeypatch.setattr("app.obtener_info_fundamental", sin_fundamental)
+
+    resp = client.post("/analisis_combinado", data={"empresa": "Banco Santander", "motor": "rapido"})
+    assert resp.status_code == 200
+    html = resp.get_data(as_text=True)
+    # Las figuras no van incrustadas: el navegador las pide a /api/figuras
+    assert "/api/figuras/SAN.MC/prediccion?motor=rapido" in html
+    assert '"layout"' not in html
+    assert "no está disponible" in html
+
+
+def test_etapa_en_curso_no_se_relanza():
+    import threading
+    from app import ejecutar_etapas
+
+    liberar = threading.Event()
+    llamadas = []
+
+    def atascada():
+        llamadas.append(1)
+        liberar.wait(5)
+        return "ok"
+
+    # La etapa agota su timeout dos veces, pero sólo ocupa un hilo del ejecutor
+    for _ in range(2):
+        assert ejecutar_etapas({"a": atascada}, {"a": 0.05}, claves={"a": ("a", "SAN.MC")}) == {"a": None}
+    assert llamadas == [1]
+    liberar.set()
+    assert ejecutar_etapas({"a": atascada}, {"a": 5}, claves={"a": ("a", "SAN.MC")}) == {"a": "ok"}
+
+
+def test_asesor_encola_y_consulta_trabajo(client, monkeypatch):
+    import time
+    monkeypatch.setattr("app.resumen_acciones", lambda: "- **SAN**: datos de prueba")
+    monkeypatch.setattr("app.run_investment_crew", lambda perfil, objetivo, data: f"# Informe {perfil}")
+
+    resp = client.post("/asistente", data={
+        "texto": "Hazme un informe", "modo": "asesor", "perfil": "Bajo", "objetivo": "Jubilación"
+    })
+    # La petición vuelve al momento: la crew corre en la cola de trabajos
+    assert resp.status_code == 302
+    with client.session_transaction() as sess:
+        id_trabajo = sess["asistente_history"][-1]["trabajo"]
+
+    for _ in range(100):
+        estado = client.get(f"/asistente/job/{id_trabajo}").get_json()
+        if estado["estado"] == "terminado":
+            break
+        time.sleep(0.02)
+    assert estado["markdown"] == "# Informe Bajo"
+    assert client.get("/download_informe").get_data(as_text=True) == "# Informe Bajo"
+    assert client.get("/asistente/job/desconocido").status_code == 404
+
+
+def test_asistente_stream_sse(client, monkeypatch):
+    monkeypatch.setattr("app.construir_contexto", lambda texto, owned, historial: "ctx")
+    monkeypatch.setattr("app.stream_chatbot_task", lambda ctx, texto: iter(["El mercado ", "**sube**."]))
+
+    resp = client.post("/asistente/stream", data={"texto": "¿Cómo va el IBEX?"})
+    assert resp.mimetype == "text/event-stream"
+    cuerpo = resp.get_data(as_text=True)
+    assert 'data: {"texto": "El mercado "}' in cuerpo
+    assert "event: fin" in cuerpo and "<strong>sube</strong>" in cuerpo
+
+    # Al terminar el stream el intercambio queda en el historial de la sesión
+    with client.session_transaction() as sess:
+        ultimo = sess["asistente_history"][-1]
+    assert ultimo["user"] == "¿Cómo va el IBEX?" and "<strong>sube</strong>" in ultimo["assistant"]
+
+
+def test_suscribir_guarda_cartera_de_la_sesion(client, monkeypatch, tmp_path):
+    import app as app_module
+    from digest_utils import SuscriptoresStore
+
+    store = SuscriptoresStore(str(tmp_path / "suscriptores.sqlite"))
+    monkeypatch.setattr(app_module, "obtener_suscriptores", lambda: store)
+    cartera = {"SAN.MC": {"shares": 5, "cost": 3.5}}
+    with client.session_transaction() as sess:
+        sess["owned_stocks"] = cartera
+
+    resp = client.post("/suscribir", data={"email": "Ana@Example.com", "accion": "alta"})
+    assert resp.status_code == 302
+    assert list(store.activos()) == [("ana@example.com", cartera)]
+
+    client.post("/suscribir", data={"email": "ana@example.com", "accion": "baja"})
+    assert list(store.activos()) == []
+
+
+def test_mis_acciones_una_consulta_de_precios(client, monkeypatch):
+    import app as app_module
+    from data_utils import empresas_ibex35
+
+    tickers = list(empresas_ibex35.values())[:20]
+    consultas = []
+    monkeypatch.setattr(app_module, "precios_actuales",
+                        lambda ts: consultas.append(ts) or {t: 12.0 for t in ts})
+    monkeypatch.setattr(app_module, "rendimiento_cartera", lambda owned: None)
+    with client.session_transaction() as sess:
+        sess["owned_stocks"] = {t: {"shares": 2, "cost": 10.0} for t in tickers}
+
+    resp = client.get("/mis_acciones")
+    assert resp.status_code == 200
+    assert len(consultas) == 1 and sorted(consultas[0]) == sorted(tickers)
+    assert b"80.00 \xe2\x82\xac" in resp.data
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.rendimiento import comparar_llamadas, comparar_tiempos
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _medidas(latencia=0.1, memoria=10.0, descargar=1):
+    return {"frio_s": latencia, "latencia_s": latencia, "memoria_mb": memoria,
+            "llamadas": {"descargar": descargar, "info": 0, "llm": 0, "smtp": 0}}
+
+
+def test_comparar_llamadas_y_tiempos():
+    llamadas = {"ruta": _medidas()["llamadas"]}
+    # Sólo las llamadas de más (o sin registrar) son regresiones; los tiempos no cuentan
+    assert comparar_llamadas({"ruta": _medidas(latencia=5.0, descargar=0)}, llamadas) == []
+    regresiones = comparar_llamadas({"ruta": _medidas(descargar=2), "nueva": _medidas()}, llamadas)
+    assert regresiones == ["ruta: llamadas a descargar 1 -> 2",
+                           "nueva: llamadas sin registrar (ejecute con --guardar-llamadas)"]
+
+    base = {"ruta": _medidas()}
+    assert comparar_tiempos({"ruta": _medidas(latencia=0.12, memoria=11.0)}, base, tolerancia=0.5) == []
+    avisos = comparar_tiempos({"ruta": _medidas(latencia=0.3, memoria=30.0), "nueva": _medidas()},
+                              base, tolerancia=0.5)
+    assert [a.split(" ")[1] for a in avisos] == ["frio_s", "latencia_s", "memoria_mb"]
+
+
+@pytest.mark.benchmark
+def test_benchmark_sin_regresiones():
+    # Proceso aparte: directorio de datos, caches y proveedor nuevos, sin lo que dejan otros tests
+    proceso = subprocess.run([sys.executable, "-m", "benchmarks.rendimiento"], cwd=RAIZ,
+                             capture_output=True, text=True, timeout=600)
+    print(proceso.stdout)
+    assert proceso.returncode == 0, proceso.stdout[-3000:] + proceso.stderr[-3000:]
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache_utils import CacheCompartida, CacheFichero, CacheMemoria, CacheSQLite, cacheado
+from data_utils import MarketSnapshot
+
+
+@pytest.fixture(params=["sqlite", "fichero"])
+def backend_compartido(request, tmp_path):
+    if request.param == "sqlite":
+        return lambda: CacheSQLite(str(tmp_path / "cache.sqlite"))
+    return lambda: CacheFichero(str(tmp_path / "cache"))
+
+
+def test_workers_comparten_resultado_sin_pickle(backend_compartido):
+    fechas = pd.bdate_range("2025-01-01", periods=5)
+    df = pd.DataFrame({"SAN.MC": [1.0, np.nan, 3.0, 4.0, 5.0], "Empresa": list("abcde")}, index=fechas)
+    calculos = []
+
+    # Dos "workers": cada uno con su CacheCompartida y su conexión al mismo backend
+    def funcion_en_worker():
+        @cacheado(CacheCompartida("prueba", ttl=60, backend=backend_compartido()))
+        def calcular(n):
+            calculos.append(n)
+            return df.head(n)
+        return calcular
+
+    worker_a, worker_b = funcion_en_worker(), funcion_en_worker()
+    assert worker_a(5) is worker_a(5)
+    leido = worker_b(5)
+    assert len(calculos) == 1
+    # La resolución de las fechas puede cambiar (ns/us); los valores no
+    pd.testing.assert_frame_equal(leido, df, check_freq=False, check_index_type=False)
+    worker_b(3)
+    assert calculos == [5, 3]
+
+    # Con la cache vaciada se vuelve a calcular en cualquiera
+    worker_b.cache.clear()
+    worker_a.cache._local.clear()
+    worker_a(5)
+    assert calculos == [5, 3, 5]
+
+
+def test_ttl_y_codec_snapshot(tmp_path):
+    fechas = pd.bdate_range("2025-01-01", periods=3)
+    snapshot = MarketSnapshot(pd.DataFrame({"SAN.MC": [1.0, 2.0, 3.0]}, index=fechas),
+                              {"SAN.MC": {"dividendYield": 3.5, "marketCap": 2e9}})
+    cache = CacheCompartida("snapshot", ttl=0.2, backend=CacheMemoria())
+    cache.guardar("snapshot:x", snapshot)
+
+    otra = CacheCompartida("snapshot", ttl=0.2, backend=cache.backend)
+    copia = otra.obtener("snapshot:x")
+    assert isinstance(copia, MarketSnapshot) and copia is not snapshot
+    assert copia.precio("SAN.MC") == 3.0 and copia.dividend_yield("SAN.MC") == 0.035
+    assert copia.fecha == fechas[-1]
+
+    time.sleep(0.25)
+    assert otra.obtener("snapshot:x") is None and cache.obtener("snapshot:x") is None
+
+
+def test_sirve_obsoleto_y_refresca_una_vez():
+    cache = CacheCompartida("swr", ttl=0.1, backend=CacheMemoria(), max_obsoleto=60)
+    liberar = threading.Event()
+    calculos = []
+
+    @cacheado(cache)
+    def precio():
+        calculos.append(1)
+        if len(calculos) > 1:
+            liberar.wait(5)
+        return len(calculos)
+
+    assert precio() == 1
+    time.sleep(0.15)
+    # Obsoleto: se devuelve al instante y sólo se lanza un refresco aunque lleguen varias llamadas
+    inicio = time.perf_counter()
+    assert [precio() for _ in range(5)] == [1] * 5
+    assert time.perf_counter() - inicio < 0.5
+    liberar.set()
+    for _ in range(50):
+        if cache.obtener(cache.clave()) is not None:
+            break
+        time.sleep(0.02)
+    assert precio() == 2 and len(calculos) == 2
+
+
+def test_peticiones_simultaneas_comparten_un_calculo(backend_compartido):
+    backend = backend_compartido()
+    calculos = []
+
+    def calcular():
+        calculos.append(1)
+        time.sleep(0.2)
+        return {"valor": 42}
+
+    # Dos workers (cada uno con su cache) y varios hilos por worker sin valor en cache
+    caches = [CacheCompartida("vuelo", ttl=60, backend=backend) for _ in range(2)]
+    resultados = []
+    hilos = [threading.Thread(target=lambda c=c: resultados.append(c.resolver("vuelo:k", calcular)))
+             for c in caches for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert resultados == [{"valor": 42}] * 8
+    assert len(calculos) == 1
+
+
+def test_pasado_max_obsoleto_se_espera_al_valor_nuevo():
+    cache = CacheCompartida("swr", ttl=0.05, backend=CacheMemoria(), max_obsoleto=0.05)
+    valores = iter([1, 2])
+    cache.resolver("swr:k", lambda: next(valores))
+    time.sleep(0.15)
+    assert cache.resolver("swr:k", lambda: next(valores)) == 2
+
+
+def test_contadores_no_pierden_cuentas_entre_hilos():
+    class _Lento(dict):
+        # Cede el hilo entre la lectura y la escritura de "+=" para forzar el solapamiento
+        def __getitem__(self, clave):
+            valor = super().__getitem__(clave)
+            time.sleep(0.001)
+            return valor
+
+    cache = CacheCompartida("cuentas", ttl=60, backend=CacheMemoria())
+    cache.resolver("cuentas:k", lambda: 1)
+    cache.contadores = _Lento(cache.contadores)
+    hilos = [threading.Thread(target=lambda: [cache.resolver("cuentas:k", lambda: 1) for _ in range(20)])
+             for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert cache.contadores["frescos"] == 8 * 20
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from context_utils import construir_contexto, estimar_tokens, tickers_mencionados
+from data_utils import MarketSnapshot, empresas_ibex35
+
+
+def _snapshot():
+    fechas = pd.bdate_range(end="2025-06-30", periods=260)
+    tickers = list(empresas_ibex35.values())
+    cierres = pd.DataFrame(
+        {t: np.linspace(10, 10 + i, len(fechas)) for i, t in enumerate(tickers)}, index=fechas
+    )
+    info = {t: {"dividendYield": 3.5, "marketCap": 20e9} for t in tickers}
+    return MarketSnapshot(cierres, info)
+
+
+def test_tickers_mencionados():
+    assert tickers_mencionados("¿Compro Telefonica o SAN.MC?") == ["SAN.MC", "TEF.MC"]
+    # Palabras comunes en minúscula no cuentan como ticker
+    assert tickers_mencionados("la red de san sebastián") == []
+
+
+def test_contexto_respeta_presupuesto():
+    snapshot = _snapshot()
+    owned = {"BBVA.MC": {"shares": 10, "cost": 8.0}}
+    precios = {"BBVA.MC": 9.5}
+    historial = [
+        {"user": f"pregunta {i}", "assistant": "<p>Respuesta <b>larga</b> " + "x" * 500 + "</p>",
+         "modo": "conversacion"}
+        for i in range(8)
+    ]
+
+    amplio = construir_contexto("¿Qué tal Repsol?", owned, historial, snapshot, presupuesto=5000, precios=precios)
+    assert "ITX|" in amplio and "BBVA|10|8.00|9.50|15.00" in amplio
+    assert "<p>" not in amplio and "pregunta 7" in amplio and "pregunta 2" not in amplio
+
+    justo = construir_contexto("¿Qué tal Repsol?", owned, historial, snapshot, presupuesto=250, precios=precios)
+    assert estimar_tokens(justo) <= 250
+    # Sólo quedan la cartera, lo que menciona la pregunta y la amplitud del mercado
+    assert "REP|" in justo and "BBVA|" in justo and "ITX|" not in justo
+    assert "IBEX35 1M:" in justo
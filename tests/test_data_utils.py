@@ -1,6 +1,9 @@
 import pandas as pd
 import pytest
-from data_utils import calcular_RSI, preparar_datos_prophet
+import data_utils
+from data_utils import (
+    calcular_RSI, preparar_datos_prophet, obtener_rentabilidad_ibex35, generar_prediccion
+)
 
 def test_calcular_RSI_valores_constantes():
     # Si la serie es constante, el RSI debería tender a 50
@@ -11,7 +14,255 @@ def test_calcular_RSI_valores_constantes():
 
 def test_preparar_datos_prophet_empty(monkeypatch):
     # Simular que yf.download devuelve DataFrame vacío
-    monkeypatch.setattr("data_utils.yf.download", lambda *args, **kwargs: pd.DataFrame())
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: pd.DataFrame())
     assert preparar_datos_prophet("FOO", anios=5) is None
 
+def test_rentabilidad_una_descarga_agrupada(monkeypatch):
+    # Todas las empresas deben salir de una única descarga agrupada por ticker
+    llamadas = []
+    tickers = list(data_utils.empresas_ibex35.values())
+    fechas = pd.date_range("2024-01-01", periods=260, freq="B")
+
+    def fake_download(*args, **kwargs):
+        llamadas.append(kwargs)
+        columnas = pd.MultiIndex.from_product([tickers, ["Close"]])
+        return pd.DataFrame(10.0, index=fechas, columns=columnas)
+
+    class FakeTicker:
+        def __init__(self, ticker):
+            self.info = {"dividendRate": 0.5, "marketCap": 2e9}
+
+    monkeypatch.setattr("provider_utils.yf.download", fake_download)
+    monkeypatch.setattr("provider_utils.yf.Ticker", FakeTicker)
+    data_utils._snapshot_cache.clear()
+    data_utils.rent_cache.clear()
+
+    df = obtener_rentabilidad_ibex35()
+    assert len(llamadas) == 1
+    assert llamadas[0]["group_by"] == "ticker"
+    assert len(df) == len(tickers)
+    fila = df.iloc[0]
+    assert fila["Precio (€/acción)"] == 10.0
+    assert fila["Rentab. Dividendaria (%)"] == 5.0
+    assert fila["Capitalización"] == "2.00B €"
+    assert fila["Cambio Últ. Año (%)"] == -5.0
+
+    data_utils._snapshot_cache.clear()
+    data_utils.rent_cache.clear()
+
+def test_snapshot_obsoleto_si_falla_el_proveedor(monkeypatch):
+    import time
+    tickers = list(data_utils.empresas_ibex35.values())
+    fechas = pd.bdate_range(end="2025-06-30", periods=30)
+    columnas = pd.MultiIndex.from_product([tickers, ["Close"]])
+    monkeypatch.setattr("provider_utils.yf.download",
+                        lambda *args, **kwargs: pd.DataFrame(10.0, index=fechas, columns=columnas))
+    monkeypatch.setattr(data_utils, "_info_segura", lambda ticker: {})
+    monkeypatch.setattr(data_utils._snapshot_cache, "ttl", 0.05)
+    data_utils._snapshot_cache.clear()
+
+    assert data_utils.obtener_snapshot().precio("SAN.MC") == 10.0
+    time.sleep(0.1)
+    # Yahoo deja de responder: se sigue sirviendo la última foto buena, sin cachear la vacía
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: pd.DataFrame())
+    for _ in range(3):
+        assert data_utils.obtener_snapshot().precio("SAN.MC") == 10.0
+        time.sleep(0.05)
+
+    # Sin ninguna foto anterior se devuelve una vacía, que tampoco se guarda
+    data_utils._snapshot_cache.clear()
+    assert data_utils.obtener_snapshot().cierres.empty
+    assert data_utils._snapshot_cache.obtener(data_utils._snapshot_cache.clave()) is None
+    data_utils._snapshot_cache.clear()
+
+
+def _fake_prophet(ajustes):
+    class FakeProphet:
+        def fit(self, df):
+            ajustes.append(len(df))
+            self.df = df
+
+        def make_future_dataframe(self, periods):
+            fechas = pd.date_range(self.df["ds"].min(), periods=len(self.df) + periods)
+            return pd.DataFrame({"ds": fechas})
+
+        def predict(self, future):
+            y = self.df["y"].iloc[-1]
+            return future.assign(yhat=y, yhat_lower=y - 1, yhat_upper=y + 1)
+    return FakeProphet
+
+def test_generar_prediccion_reutiliza_forecast(monkeypatch):
+    # Mismo ticker, misma última fecha y horizonte: Prophet sólo se ajusta una vez
+    ajustes = []
+    monkeypatch.setattr("data_utils.Prophet", _fake_prophet(ajustes))
+    data_utils._forecast_cache.clear()
+    df = pd.DataFrame({"ds": pd.date_range("2024-01-01", periods=30), "y": range(30)})
+
+    generar_prediccion(df, "corto", "Empresa", "AAA.MC")
+    generar_prediccion(df, "corto", "Empresa", "AAA.MC")
+    assert len(ajustes) == 1
+
+    # Una barra nueva invalida la entrada
+    df2 = pd.concat([df, pd.DataFrame({"ds": [pd.Timestamp("2024-01-31")], "y": [30]})], ignore_index=True)
+    generar_prediccion(df2, "corto", "Empresa", "AAA.MC")
+    assert len(ajustes) == 2
+    data_utils._forecast_cache.clear()
+
+def test_predecir_universo_alimenta_cache(monkeypatch):
+    # Los ajustes en el pool de procesos dejan el forecast listo para la petición
+    fechas = pd.date_range(pd.Timestamp.today().normalize() - pd.Timedelta(days=100), periods=60, freq="B")
+
+    def fake_download(*args, **kwargs):
+        columnas = pd.MultiIndex.from_product([kwargs["tickers"], ["Close"]])
+        return pd.DataFrame(5.0, index=fechas, columns=columnas)
+
+    ajustes = []
+    monkeypatch.setattr("provider_utils.yf.download", fake_download)
+    monkeypatch.setattr("data_utils.Prophet", _fake_prophet(ajustes))
+    data_utils._forecast_cache.clear()
+
+    tickers = ["UNIV1.MC", "UNIV2.MC"]
+    resultado = data_utils.predecir_universo(tipo="corto", tickers=tickers, max_workers=2)
+    assert set(resultado["forecasts"]) == set(tickers)
+    assert set(resultado["tiempos"]) == set(tickers)
+    assert resultado["errores"] == {}
+
+    # La petición posterior no ajusta nada en este proceso
+    df = preparar_datos_prophet("UNIV1.MC")
+    generar_prediccion(df, "corto", "Empresa", "UNIV1.MC")
+    assert ajustes == []
+
+    # Otro proceso (cache en memoria vacía) lo lee del almacén
+    data_utils._forecast_cache.clear()
+    generar_prediccion(df, "corto", "Empresa", "UNIV1.MC")
+    assert ajustes == []
+    data_utils._forecast_cache.clear()
+
+
+def test_predecir_universo_termina_ajustes_atascados(monkeypatch):
+    import multiprocessing
+    import time
+
+    fechas = pd.date_range(pd.Timestamp.today().normalize() - pd.Timedelta(days=100), periods=60, freq="B")
+
+    def fake_download(*args, **kwargs):
+        columnas = pd.MultiIndex.from_product([kwargs["tickers"], ["Close"]])
+        return pd.DataFrame(5.0, index=fechas, columns=columnas)
+
+    class ProphetAtascado:
+        def fit(self, df):
+            time.sleep(600)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake_download)
+    monkeypatch.setattr("data_utils.Prophet", ProphetAtascado)
+
+    inicio = time.monotonic()
+    resultado = data_utils.predecir_universo(tipo="corto", tickers=["ATASCO.MC"], max_workers=1, timeout=1)
+    assert resultado["errores"] == {"ATASCO.MC": "timeout (1s)"}
+    # El proceso atascado se termina en lugar de bloquear la salida del intérprete
+    assert time.monotonic() - inicio < 30
+    assert multiprocessing.active_children() == []
+
+def test_predecir_universo_cronometra_desde_el_inicio_del_ajuste(monkeypatch):
+    import time
+    fechas = pd.date_range(pd.Timestamp.today().normalize() - pd.Timedelta(days=100), periods=60, freq="B")
+
+    def fake_download(*args, **kwargs):
+        columnas = pd.MultiIndex.from_product([kwargs["tickers"], ["Close"]])
+        return pd.DataFrame(5.0, index=fechas, columns=columnas)
+
+    FakeProphet = _fake_prophet([])
+
+    class ProphetLento(FakeProphet):
+        def fit(self, df):
+            time.sleep(1.5)
+            super().fit(df)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake_download)
+    monkeypatch.setattr("data_utils.Prophet", ProphetLento)
+    data_utils._forecast_cache.clear()
+
+    # Con un solo proceso, el segundo ajuste espera en cola más que el timeout sin excederlo
+    tickers = ["COLA1.MC", "COLA2.MC"]
+    resultado = data_utils.predecir_universo(tipo="corto", tickers=tickers, max_workers=1, timeout=2)
+    assert resultado["errores"] == {}
+    assert set(resultado["forecasts"]) == set(tickers)
+    data_utils._forecast_cache.clear()
+
+def test_motor_rapido_mismo_contrato(monkeypatch):
+    # El motor rápido devuelve las mismas columnas que Prophet sin llegar a ajustarlo
+    ajustes = []
+    monkeypatch.setattr("data_utils.Prophet", _fake_prophet(ajustes))
+    df = pd.DataFrame({
+        "ds": pd.bdate_range("2023-01-02", periods=300),
+        "y": [100 * 1.001 ** i for i in range(300)]
+    })
+    forecast = data_utils.calcular_forecast(df, "corto", motor="rapido")
+    assert ajustes == []
+    assert list(forecast.columns) == ["ds", "yhat", "yhat_lower", "yhat_upper"]
+    assert len(forecast) == len(df) + 30
+    futuro = forecast[forecast["ds"] > df["ds"].max()]
+    assert (futuro["yhat_lower"] <= futuro["yhat"]).all()
+    assert (futuro["yhat"] <= futuro["yhat_upper"]).all()
+    # Tendencia creciente anclada al último dato
+    assert futuro["yhat"].iloc[0] == pytest.approx(df["y"].iloc[-1], rel=0.01)
+    assert futuro["yhat"].iloc[-1] > futuro["yhat"].iloc[0]
+
 # Puedes añadir más tests para generadores de predicción, indicadores, etc.
+
+def test_lttb_conserva_extremos_y_longitud():
+    import numpy as np
+    x = np.arange(5000, dtype=float)
+    y = np.sin(x / 200)
+    y[1234], y[3456] = 5.0, -5.0  # picos aislados que deben sobrevivir
+    idx = data_utils.indices_lttb(x, y, 300)
+    assert len(idx) == 300
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+    assert 1234 in idx and 3456 in idx
+
+    # Con menos puntos que el límite, la serie se devuelve entera y sin NaN
+    fechas = pd.date_range("2024-01-01", periods=10)
+    xs, ys = data_utils.reducir_serie(fechas, [1, 2, None, 4, 5, 6, 7, 8, 9, 10], 50)
+    assert len(xs) == len(ys) == 9
+
+
+def test_grafico_rsi_usa_calcular_RSI(monkeypatch):
+    # El gráfico mantiene el RSI de medias simples aunque el motor calcule el de Wilder
+    fechas = pd.bdate_range("2024-01-01", periods=260)
+    precio = pd.Series(range(260), index=fechas, dtype=float) % 17 + 100
+    indicadores = {nombre: precio.to_frame("XYZ.MC") for nombre in ("Precio", "SMA50", "SMA200")}
+    monkeypatch.setattr(data_utils, "obtener_indicadores", lambda tickers: indicadores)
+
+    _, fig_rsi = data_utils.calcular_indicadores_tecnicos("XYZ.MC", max_puntos=None)
+    assert list(fig_rsi.data[0].y) == pytest.approx(list(calcular_RSI(precio)))
+
+
+def test_precios_actuales_una_llamada_y_valoracion(monkeypatch):
+    tickers = list(data_utils.empresas_ibex35.values())[:20]
+    llamadas = []
+
+    def fake_download(*args, **kwargs):
+        llamadas.append(kwargs["tickers"])
+        columnas = pd.MultiIndex.from_product([kwargs["tickers"], ["Close"]])
+        df = pd.DataFrame(10.0, index=pd.date_range("2025-06-25", periods=3, freq="B"), columns=columnas)
+        # El último día sin cotización de un ticker: se usa el cierre anterior
+        df.loc[df.index[-1], (tickers[0], "Close")] = float("nan")
+        return df
+
+    monkeypatch.setattr("provider_utils.yf.download", fake_download)
+    data_utils._precios_cache.clear()
+
+    precios = data_utils.precios_actuales(tickers)
+    assert len(llamadas) == 1 and precios[tickers[0]] == 10.0
+    # La segunda consulta sale de la cache y sólo se pide lo que falta
+    data_utils.precios_actuales(tickers + ["NUEVO.MC"])
+    assert llamadas[1] == ["NUEVO.MC"]
+
+    owned = {tickers[0]: {"shares": 10, "cost": 8.0}, tickers[1]: {"shares": 5, "cost": None},
+             "SIN.MC": {"shares": 1, "cost": 1.0}}
+    valoracion = data_utils.valorar_cartera(owned, {**precios, "SIN.MC": None})
+    assert valoracion["ganancia_total"] == 20.0 and valoracion["valor_total"] == 150.0
+    assert valoracion["posiciones"][tickers[1]]["ganancia"] is None
+    assert valoracion["posiciones"]["SIN.MC"]["precio"] is None
+    data_utils._precios_cache.clear()
@@ -0,0 +1,184 @@
+import smtplib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import digest_utils
+import email_utils
+from data_utils import MarketSnapshot
+from digest_utils import SuscriptoresStore, ejecutar_digest, programar, proxima_ejecucion, siguiente_ejecucion
+
+
+class _SMTPFalso:
+    """Conexión SMTP simulada: corta la conexión una vez y rechaza 'malo@example.com' (550)."""
+
+    def __init__(self, buzon):
+        self.buzon = buzon
+
+    def send_message(self, msg):
+        destinatario = msg["To"]
+        if destinatario == "malo@example.com":
+            raise smtplib.SMTPRecipientsRefused({destinatario: (550, b"No existe")})
+        if destinatario == "corte@example.com" and not self.buzon["cortado"]:
+            self.buzon["cortado"] = True
+            raise smtplib.SMTPServerDisconnected("Conexión cerrada")
+        self.buzon["enviados"].append(destinatario)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_digest_reintenta_y_guarda_ejecucion(tmp_path, monkeypatch):
+    fechas = pd.bdate_range(end="2025-06-30", periods=30)
+    snapshot = MarketSnapshot(pd.DataFrame({"SAN.MC": np.linspace(10, 12, 30)}, index=fechas), {})
+    buzon = {"enviados": [], "cortado": False, "conexiones": 0}
+
+    def abrir():
+        buzon["conexiones"] += 1
+        return _SMTPFalso(buzon)
+
+    comentarios = []
+    monkeypatch.setattr(digest_utils, "obtener_snapshot", lambda: snapshot)
+    monkeypatch.setattr(digest_utils, "precios_actuales", lambda tickers: {"SAN.MC": 12.0})
+    monkeypatch.setattr(digest_utils, "run_chatbot_task", lambda ctx, p: comentarios.append(1) or "Sube.")
+    monkeypatch.setattr(email_utils, "abrir_smtp", abrir)
+    monkeypatch.setattr(email_utils, "rendimiento_cartera", lambda owned: None)
+
+    store = SuscriptoresStore(str(tmp_path / "suscriptores.sqlite"))
+    cartera = {"SAN.MC": {"shares": 10, "cost": 11.0}}
+    for i in range(20):
+        store.suscribir(f"user{i}@example.com", cartera)
+    store.suscribir("corte@example.com", cartera)
+    store.suscribir("malo@example.com", cartera)
+    store.suscribir("baja@example.com", cartera)
+    store.baja("baja@example.com")
+    store.suscribir("vacio@example.com", {})
+
+    ejecucion = ejecutar_digest(store, workers=4, smtp_por_minuto=60000, intentos=3, backoff=0.01)
+
+    assert ejecucion["enviados"] == 21 and ejecucion["fallidos"] == 1
+    assert "malo@example.com" in ejecucion["errores"]
+    assert sorted(buzon["enviados"]) == sorted([f"user{i}@example.com" for i in range(20)] + ["corte@example.com"])
+    assert len(comentarios) == 1 and buzon["conexiones"] <= 5
+    assert {"mercado", "comentario", "envio"} <= set(ejecucion["tiempos"])
+    guardada = store.ultimas_ejecuciones(1)[0]
+    assert guardada["enviados"] == 21 and store.ejecutado(guardada["fecha"])
+
+
+def test_proxima_ejecucion_dias_laborables():
+    viernes_tarde = pd.Timestamp("2025-06-27 19:00").to_pydatetime()
+    assert proxima_ejecucion(viernes_tarde, "18:00") == pd.Timestamp("2025-06-30 18:00").to_pydatetime()
+    lunes = pd.Timestamp("2025-06-30 09:00").to_pydatetime()
+    assert proxima_ejecucion(lunes, "18:00") == pd.Timestamp("2025-06-30 18:00").to_pydatetime()
+
+
+def test_siguiente_ejecucion_recupera_el_digest_de_hoy(tmp_path):
+    store = SuscriptoresStore(str(tmp_path / "suscriptores.sqlite"))
+    lunes_tarde = pd.Timestamp("2025-06-30 19:30").to_pydatetime()
+    # El worker arranca pasada la hora y hoy no se envió: toca ya
+    assert siguiente_ejecucion(lunes_tarde, store, "18:00") == lunes_tarde
+    # Antes de la hora, en fin de semana o ya enviado: la próxima cita normal
+    lunes = pd.Timestamp("2025-06-30 09:00").to_pydatetime()
+    assert siguiente_ejecucion(lunes, store, "18:00") == proxima_ejecucion(lunes, "18:00")
+    sabado = pd.Timestamp("2025-06-28 19:00").to_pydatetime()
+    assert siguiente_ejecucion(sabado, store, "18:00") == pd.Timestamp("2025-06-30 18:00").to_pydatetime()
+    store.guardar_ejecucion({"fecha": "2025-06-30", "inicio": 0, "fin": 0, "enviados": 0,
+                             "fallidos": 0, "tiempos": {}, "errores": {}})
+    assert siguiente_ejecucion(lunes_tarde, store, "18:00") == pd.Timestamp("2025-07-01 18:00").to_pydatetime()
+
+
+def test_programar_sobrevive_a_un_digest_fallido(tmp_path, monkeypatch):
+    class Parar(BaseException):
+        pass
+
+    class Reloj(digest_utils.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2025, 6, 30, 19, 30, tzinfo=tz)
+
+    store = SuscriptoresStore(str(tmp_path / "suscriptores.sqlite"))
+    llamadas, esperas = [], []
+
+    def digest(store):
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            raise ConnectionError("Yahoo Finance caído")
+        ejecucion = {"fecha": "2025-06-30", "inicio": 0, "fin": 0, "enviados": 3,
+                     "fallidos": 0, "tiempos": {}, "errores": {}}
+        store.guardar_ejecucion(ejecucion)
+        return ejecucion
+
+    def dormir(segundos):
+        esperas.append(segundos)
+        if len(esperas) > 1:
+            raise Parar()
+
+    monkeypatch.setattr(digest_utils, "datetime", Reloj)
+    monkeypatch.setattr(digest_utils, "ejecutar_digest", digest)
+    monkeypatch.setattr(digest_utils.time, "sleep", dormir)
+    with pytest.raises(Parar):
+        programar(store, "18:00", espera_fallo=5)
+    # Se envía al arrancar, el fallo se reintenta tras la espera y luego se espera a mañana
+    assert len(llamadas) == 2 and store.ejecutado("2025-06-30")
+    assert esperas == [5, 300]
+
+
+def test_conexion_caida_se_descarta(monkeypatch):
+    class SMTP:
+        def __init__(self, caida):
+            self.caida, self.cerrada, self.enviados = caida, False, 0
+
+        def send_message(self, msg):
+            if self.caida:
+                raise smtplib.SMTPServerDisconnected("Conexión cerrada")
+            self.enviados += 1
+
+        def close(self):
+            self.cerrada = True
+
+        quit = close
+
+    caida, nueva = SMTP(caida=True), SMTP(caida=False)
+    abiertas = iter([caida, nueva])
+    monkeypatch.setattr(email_utils, "abrir_smtp", lambda: next(abiertas))
+    conexiones = digest_utils._ConexionesSMTP()
+
+    with pytest.raises(digest_utils.FalloTransitorio):
+        conexiones.enviar("msg")
+    # La conexión caída se cierra y deja de contarse; el hilo abre otra
+    assert caida.cerrada and conexiones._abiertas == []
+    conexiones.enviar("msg")
+    assert conexiones._abiertas == [nueva] and nueva.enviados == 1
+    conexiones.cerrar()
+    assert nueva.cerrada and conexiones._abiertas == []
+
+
+def test_limite_del_llm_se_reintenta_sin_importar_litellm(tmp_path, monkeypatch):
+    import sys
+
+    class RateLimitError(Exception):
+        pass
+
+    fechas = pd.bdate_range(end="2025-06-30", periods=30)
+    snapshot = MarketSnapshot(pd.DataFrame({"SAN.MC": np.linspace(10, 12, 30)}, index=fechas), {})
+    respuestas = iter([RateLimitError("429"), "Sube."])
+
+    def llm(ctx, prompt):
+        respuesta = next(respuestas)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+    monkeypatch.setattr(digest_utils, "obtener_snapshot", lambda: snapshot)
+    monkeypatch.setattr(digest_utils, "precios_actuales", lambda tickers: {"SAN.MC": 12.0})
+    monkeypatch.setattr(digest_utils, "run_chatbot_task", llm)
+    cargado = "litellm" in sys.modules
+
+    store = SuscriptoresStore(str(tmp_path / "suscriptores.sqlite"))
+    ejecutar_digest(store, llm_por_minuto=60000, intentos=2, backoff=0.001)
+    assert next(respuestas, None) is None
+    assert ("litellm" in sys.modules) == cargado
@@ -0,0 +1,116 @@
+import socket
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import email_utils
+from data_utils import MarketSnapshot, empresas_ibex35
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+
+class _Buzon:
+    """Servidor SMTP local: guarda los mensajes y rechaza a 'rechazado@example.com'."""
+
+    def __init__(self):
+        self.mensajes = []
+        self.sesiones = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == "rechazado@example.com":
+            return "550 Buzón inexistente"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sesiones.add(session.peer)
+        self.mensajes.append((envelope.rcpt_tos, envelope.content.decode("utf8", errors="replace")))
+        return "250 Message accepted"
+
+
+@pytest.fixture
+def buzon(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    handler = _Buzon()
+    controller = aiosmtpd.Controller(handler, hostname="127.0.0.1", port=puerto)
+    controller.start()
+    monkeypatch.setattr(email_utils, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(email_utils, "SMTP_PORT", puerto)
+    monkeypatch.setattr(email_utils, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(email_utils, "SMTP_USER", None)
+    yield handler
+    controller.stop()
+
+
+def test_lote_un_calculo_una_conexion(buzon, monkeypatch):
+    fechas = pd.bdate_range(end="2025-06-30", periods=30)
+    tickers = list(empresas_ibex35.values())
+    snapshot = MarketSnapshot(pd.DataFrame({t: np.linspace(10, 12, 30) for t in tickers}, index=fechas), {})
+    cargas, comentarios = [], []
+    monkeypatch.setattr(email_utils, "obtener_snapshot", lambda: cargas.append(1) or snapshot)
+    monkeypatch.setattr(email_utils, "run_chatbot_task", lambda ctx, prompt: comentarios.append(1) or "Sube.")
+    monkeypatch.setattr(email_utils, "rendimiento_cartera", lambda owned: None)
+    pedidos = []
+    monkeypatch.setattr(email_utils, "precios_actuales",
+                        lambda tickers: pedidos.append(tickers) or {t: 12.0 for t in tickers})
+
+    cartera = {"SAN.MC": {"shares": 10, "cost": 11.0}}
+    resultados = email_utils.enviar_reportes([
+        ("a@example.com", cartera),
+        ("rechazado@example.com", cartera),
+        ("b@example.com", {"BBVA.MC": {"shares": 1, "cost": None}}),
+    ])
+
+    assert resultados["a@example.com"] is None and resultados["b@example.com"] is None
+    assert "rechazado" in resultados["rechazado@example.com"].lower()
+    assert len(cargas) == 1 and len(comentarios) == 1
+    assert len(pedidos) == 1 and set(pedidos[0]) == {"SAN.MC", "BBVA.MC"}
+    assert len(buzon.mensajes) == 2 and len(buzon.sesiones) == 1
+    destinatarios, contenido = buzon.mensajes[0]
+    assert destinatarios == ["a@example.com"]
+    assert "Sube." in contenido and "precio actual 12.00" in contenido and "ganancia total 10.00" in contenido
+
+
+def test_sin_servidor_todos_fallan(monkeypatch):
+    monkeypatch.setattr(email_utils, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(email_utils, "SMTP_PORT", 1)
+    monkeypatch.setattr(email_utils, "obtener_snapshot", lambda: MarketSnapshot(pd.DataFrame(), {}))
+    monkeypatch.setattr(email_utils, "run_chatbot_task", lambda ctx, prompt: "Sube.")
+    monkeypatch.setattr(email_utils, "precios_actuales", lambda tickers: {})
+    monkeypatch.setattr(email_utils, "rendimiento_cartera", lambda owned: None)
+    resultados = email_utils.enviar_reportes([("a@example.com", {}), ("b@example.com", {})])
+    assert all(resultados.values()) and set(resultados) == {"a@example.com", "b@example.com"}
+
+
+def test_conexion_cortada_se_cierra_antes_de_reabrir(monkeypatch):
+    class _Conexion:
+        def __init__(self, corta):
+            self.corta, self.cerrada, self.enviados = corta, False, []
+
+        def send_message(self, msg):
+            if self.corta:
+                raise email_utils.smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            self.enviados.append(msg["To"])
+
+        def close(self):
+            self.cerrada = True
+
+        def quit(self):
+            self.cerrada = True
+
+    conexiones = []
+    monkeypatch.setattr(email_utils, "abrir_smtp",
+                        lambda: conexiones.append(_Conexion(corta=not conexiones)) or conexiones[-1])
+    monkeypatch.setattr(email_utils, "obtener_snapshot", lambda: MarketSnapshot(pd.DataFrame(), {}))
+    monkeypatch.setattr(email_utils, "run_chatbot_task", lambda ctx, prompt: "Sube.")
+    monkeypatch.setattr(email_utils, "precios_actuales", lambda tickers: {})
+    monkeypatch.setattr(email_utils, "rendimiento_cartera", lambda owned: None)
+
+    resultados = email_utils.enviar_reportes([("a@example.com", {})])
+
+    assert resultados == {"a@example.com": None}
+    assert len(conexiones) == 2 and conexiones[0].cerrada
+    assert conexiones[1].enviados == ["a@example.com"]
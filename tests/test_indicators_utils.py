@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_utils import calcular_RSI
+from indicators_utils import (
+    calcular_panel_indicadores, obtener_indicadores, screener, ema, rsi_wilder,
+    IndicadorIncremental, RSIIncremental, SMAIncremental, EMAIncremental, MACDIncremental,
+    cargar_indicador, actualizar_indicador
+)
+from store_utils import obtener_store
+
+
+def _panel():
+    rng = np.random.default_rng(1)
+    fechas = pd.bdate_range("2023-01-02", periods=400)
+    datos = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=(400, 3)), axis=0))
+    return pd.DataFrame(datos, index=fechas, columns=["AAA.MC", "BBB.MC", "CCC.MC"])
+
+
+def test_panel_coincide_con_calculo_por_serie():
+    panel = _panel()
+    ind = calcular_panel_indicadores(panel)
+    serie = panel["BBB.MC"]
+    pd.testing.assert_series_equal(ind["SMA50"]["BBB.MC"], serie.rolling(50).mean(), check_names=False)
+    ema12 = serie.ewm(span=12, adjust=False).mean()
+    ema26 = serie.ewm(span=26, adjust=False).mean()
+    assert ind["MACD"]["BBB.MC"].iloc[-1] == pytest.approx(ema12.iloc[-1] - ema26.iloc[-1])
+    rsi = ind["RSI"].iloc[20:]
+    assert ((rsi >= 0) & (rsi <= 100)).all().all()
+    assert (ind["BB_superior"].iloc[19:] >= ind["BB_inferior"].iloc[19:]).all().all()
+
+
+def test_obtener_indicadores_con_calentamiento(monkeypatch):
+    # La SMA200 debe estar definida desde el primer día de la ventana de 1 año
+    fechas = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=600)
+    llamadas = []
+
+    def fake_download(*args, **kwargs):
+        llamadas.append(kwargs["tickers"])
+        columnas = pd.MultiIndex.from_product([kwargs["tickers"], ["Close"]])
+        valores = np.tile(np.linspace(10, 20, len(fechas))[:, None], len(kwargs["tickers"]))
+        return pd.DataFrame(valores, index=fechas, columns=columnas)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake_download)
+    tickers = ["IND1.MC", "IND2.MC"]
+    ind = obtener_indicadores(tickers)
+    assert llamadas == [tickers]
+    assert ind["SMA200"].notna().all().all()
+    assert ind["Precio"].index.min() >= pd.Timestamp.today() - pd.DateOffset(years=1, days=1)
+
+    # Segunda llamada: mismo objeto cacheado
+    assert obtener_indicadores(tickers) is ind
+    tabla = screener(ind)
+    assert list(tabla.index) == tickers
+    assert (tabla["Tendencia"] == "alcista").all()
+
+
+def test_indicadores_incrementales_coinciden_con_batch():
+    serie = _panel()["AAA.MC"]
+    # Tramo plano para cubrir el caso sin subidas ni bajadas
+    serie.iloc[100:130] = serie.iloc[100]
+
+    rsi, rsi_w, sma20, ema12, macd = (
+        RSIIncremental(14), RSIIncremental(14, wilder=True), SMAIncremental(20), EMAIncremental(12),
+        MACDIncremental()
+    )
+    resultados = {"rsi": [], "rsi_w": [], "sma": [], "ema": [], "macd": []}
+    for i, precio in enumerate(serie):
+        if i == 200:
+            # A mitad de la serie, serializamos y seguimos desde el estado recuperado
+            rsi, rsi_w, sma20, ema12, macd = (
+                cargar_indicador(ind.estado()) for ind in (rsi, rsi_w, sma20, ema12, macd)
+            )
+        resultados["rsi"].append(rsi.actualizar(precio))
+        resultados["rsi_w"].append(rsi_w.actualizar(precio))
+        resultados["sma"].append(sma20.actualizar(precio))
+        resultados["ema"].append(ema12.actualizar(precio))
+        m = macd.actualizar(precio)
+        resultados["macd"].append(m[0] if m else None)
+
+    def comparar(obtenido, esperado):
+        obtenido = pd.Series(obtenido, index=esperado.index, dtype=float)
+        pd.testing.assert_series_equal(obtenido, esperado, check_names=False, rtol=1e-9, atol=1e-9)
+
+    comparar(resultados["rsi"], calcular_RSI(serie))
+    comparar(resultados["rsi_w"], rsi_wilder(serie.to_frame())["AAA.MC"])
+    comparar(resultados["sma"], serie.rolling(20, min_periods=20).mean())
+    comparar(resultados["ema"], ema(serie.to_frame(), 12)["AAA.MC"])
+    comparar(resultados["macd"], calcular_panel_indicadores(serie.to_frame())["MACD"]["AAA.MC"])
+
+
+def test_actualizar_indicador_persiste_estado():
+    store = obtener_store()
+    serie = _panel()["CCC.MC"]
+    store.guardar("INC1.MC", pd.DataFrame({"Close": serie.iloc[:300]}))
+    _, valor = actualizar_indicador("INC1.MC", "rsi14", lambda: RSIIncremental(14))
+    assert store.leer_estado("INC1.MC", "rsi14")[0] == serie.index[299]
+
+    # Llegan barras nuevas: sólo se procesan ésas y el resultado coincide con el batch
+    store.guardar("INC1.MC", pd.DataFrame({"Close": serie.iloc[300:]}))
+    indicador, valor = actualizar_indicador("INC1.MC", "rsi14", lambda: RSIIncremental(14))
+    assert valor == pytest.approx(calcular_RSI(serie).iloc[-1])
+
+
+def test_indicador_incremental_es_abstracto():
+    with pytest.raises(TypeError):
+        IndicadorIncremental()
+
+    class SinActualizar(IndicadorIncremental):
+        __slots__ = ()
+
+    with pytest.raises(TypeError):
+        SinActualizar()
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from jobs_utils import ColaLlena, ColaTrabajos, TERMINADO, ERROR, clave_trabajo
+
+
+def _esperar(cola, id_trabajo, limite=5.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        estado = cola.estado(id_trabajo)
+        if estado["estado"] in (TERMINADO, ERROR):
+            return estado
+        time.sleep(0.02)
+    raise AssertionError("el trabajo no terminó")
+
+
+def test_deduplica_y_limita_trabajos(tmp_path):
+    cola = ColaTrabajos(ruta=str(tmp_path / "t.sqlite"), max_workers=2, max_activos=2)
+    liberar = threading.Event()
+    llamadas = []
+
+    def crew(perfil, objetivo):
+        llamadas.append((perfil, objetivo))
+        liberar.wait(5)
+        return f"# Informe {perfil}"
+
+    clave = clave_trabajo("crew", "Bajo", "jubilación", "datos-v1")
+    a = cola.enviar(clave, crew, "Bajo", "jubilación")
+    # Mismo (perfil, objetivo, datos): mismo trabajo, sin volver a ejecutar la crew
+    assert cola.enviar(clave, crew, "Bajo", "jubilación") == a
+
+    b = cola.enviar(clave_trabajo("crew", "Alto", "crecer", "datos-v1"), crew, "Alto", "crecer")
+    with pytest.raises(ColaLlena):
+        cola.enviar(clave_trabajo("crew", "Alto", "otro", "datos-v1"), crew, "Alto", "otro")
+
+    liberar.set()
+    assert _esperar(cola, a)["resultado"] == "# Informe Bajo"
+    assert _esperar(cola, b)["estado"] == TERMINADO
+    assert len(llamadas) == 2
+
+    # Terminado y dentro del TTL se reutiliza; con otra versión de datos se recalcula
+    assert cola.enviar(clave, crew, "Bajo", "jubilación") == a
+    c = cola.enviar(clave_trabajo("crew", "Bajo", "jubilación", "datos-v2"), crew, "Bajo", "jubilación")
+    assert c != a
+    _esperar(cola, c)
+
+
+def test_error_de_la_crew(tmp_path):
+    cola = ColaTrabajos(ruta=str(tmp_path / "t.sqlite"))
+
+    def fallida():
+        raise RuntimeError("LLM caído")
+
+    estado = _esperar(cola, cola.enviar("k", fallida))
+    assert estado["estado"] == ERROR and "LLM caído" in estado["error"]
+    assert cola.estado("no-existe") is None
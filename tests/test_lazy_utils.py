@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+from benchmarks.arranque import PESADAS
+from lazy_utils import ModuloPerezoso, ObjetoPerezoso
+
+
+def test_arranque_sin_dependencias_pesadas():
+    # En un intérprete limpio: importar la app no debe cargar Prophet, CrewAI, LiteLLM...
+    codigo = f"import sys, app; print(' '.join(m for m in {PESADAS!r} if m in sys.modules))"
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+    assert salida.stdout.split() == []
+
+
+def test_modulo_perezoso_delega_en_el_real(monkeypatch):
+    import json
+
+    perezoso = ModuloPerezoso("json")
+    assert perezoso.dumps([1]) == "[1]"
+    # Escribir en el proxy modifica el módulo real, como con un import normal
+    monkeypatch.setattr(perezoso, "dumps", lambda obj: "parcheado")
+    assert json.dumps([1]) == "parcheado"
+
+    decimal = ObjetoPerezoso("decimal", "Decimal")
+    assert decimal("1.5") * 2 == 3
+    assert decimal.__name__ == "Decimal"
+
+
+def test_importacion_simultanea_desde_varios_hilos(tmp_path, monkeypatch):
+    import threading
+
+    # Módulo lento de importar: ningún hilo debe verlo a medio inicializar
+    (tmp_path / "modulo_lento.py").write_text("import time\ntime.sleep(0.2)\nVALOR = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "modulo_lento", raising=False)
+    perezoso = ModuloPerezoso("modulo_lento")
+    valores, errores = [], []
+
+    def leer():
+        try:
+            valores.append(perezoso.VALOR)
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=leer) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert errores == [] and valores == [42] * 8
+    sys.modules.pop("modulo_lento", None)
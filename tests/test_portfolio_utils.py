@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfolio_utils
+from portfolio_utils import calcular_rendimiento, huella_cartera, rendimiento_cartera
+
+
+def test_rendimiento_frente_a_bucle_diario():
+    rng = np.random.default_rng(3)
+    fechas = pd.bdate_range("2023-01-02", periods=300)
+    panel = pd.DataFrame({
+        "A.MC": 10 * np.cumprod(1 + rng.normal(0, 0.01, len(fechas))),
+        "B.MC": 50 * np.cumprod(1 + rng.normal(0, 0.02, len(fechas))),
+        "C.MC": 5.0,
+    }, index=fechas)
+    panel.iloc[:100, 1] = np.nan  # B empieza a cotizar más tarde
+    acciones = pd.Series({"A.MC": 100, "B.MC": 10})
+
+    resultado = calcular_rendimiento(panel, acciones)
+    curva, m = resultado["curva"], resultado["metricas"]
+
+    # Referencia: bucle por días con los tickers que cotizan ambos días
+    rendimientos, ganancia = [], 0.0
+    for i in range(1, len(panel)):
+        hoy, ayer = panel.iloc[i], panel.iloc[i - 1]
+        validos = hoy.notna() & ayer.notna() & acciones.reindex(panel.columns).fillna(0).gt(0)
+        base = (ayer[validos] * acciones[validos[validos].index]).sum()
+        dia = ((hoy - ayer)[validos] * acciones[validos[validos].index]).sum()
+        ganancia += dia
+        rendimientos.append(dia / base if base else 0.0)
+    rendimientos = np.array(rendimientos)
+    indice = np.cumprod(1 + rendimientos)
+
+    assert m["rentabilidad"] == pytest.approx(indice[-1] - 1)
+    assert m["volatilidad"] == pytest.approx(rendimientos.std(ddof=1) * np.sqrt(252))
+    assert m["max_drawdown"] == pytest.approx((indice / np.maximum.accumulate(indice) - 1).min())
+    assert m["ganancia"] == pytest.approx(ganancia)
+    # Sin saltos cuando entra B: el índice sólo refleja rendimientos
+    assert curva["Valor"].iloc[99] == pytest.approx(100 * panel["A.MC"].iloc[99])
+    contribucion = resultado["contribucion"]
+    assert list(contribucion.index) == ["A.MC", "B.MC"]
+    assert contribucion["Contribucion"].sum() == pytest.approx(rendimientos.sum())
+    assert contribucion["Peso"].sum() == pytest.approx(1.0)
+
+
+def test_rendimiento_cacheado_por_cartera_y_version(monkeypatch):
+    from store_utils import obtener_store
+
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: pd.DataFrame())
+    monkeypatch.setattr(portfolio_utils, "empresas_ibex35", {"P1": "PF1.MC", "P2": "PF2.MC"})
+    fechas = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=120)
+    store = obtener_store()
+    for i, ticker in enumerate(("PF1.MC", "PF2.MC")):
+        store.guardar(ticker, pd.DataFrame({"Close": np.linspace(10, 12 + i, 120)}, index=fechas))
+
+    owned = {"PF1.MC": {"shares": 10, "cost": 9.0}}
+    r1 = rendimiento_cartera(owned)
+    # El coste no cambia el rendimiento: misma huella y mismo resultado
+    assert rendimiento_cartera({"PF1.MC": {"shares": 10, "cost": 11.0}}) is r1
+    assert huella_cartera(owned) != huella_cartera({"PF1.MC": {"shares": 11}})
+    assert r1["metricas"]["ganancia"] == pytest.approx(20.0)
+    assert rendimiento_cartera({}) is None
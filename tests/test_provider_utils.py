@@ -0,0 +1,97 @@
+import time
+
+import pandas as pd
+import pytest
+
+import data_utils
+from provider_utils import ErrorProveedor, Proveedor, ProveedorFixture, ProveedorNoDisponible, ProveedorYFinance
+from store_utils import PriceStore
+
+
+def test_yfinance_reintenta_y_abre_el_circuito(monkeypatch):
+    fallos = {"n": 1}
+
+    def info_inestable(self):
+        if fallos["n"] > 0:
+            fallos["n"] -= 1
+            raise ConnectionError("timeout")
+        return {"longName": "Banco Santander"}
+
+    class FakeTicker:
+        def __init__(self, ticker):
+            pass
+        info = property(info_inestable)
+
+    monkeypatch.setattr("provider_utils.yf.Ticker", FakeTicker)
+    proveedor = ProveedorYFinance(intentos=2, umbral=2, enfriamiento=0.1, backoff=0.001)
+
+    # Un fallo transitorio se reintenta y no cuenta para el circuito
+    assert proveedor.info("SAN.MC") == {"longName": "Banco Santander"}
+    assert proveedor.llamadas["info"] == 2
+
+    # Dos llamadas fallidas seguidas abren el circuito: la siguiente no llega a Yahoo
+    fallos["n"] = 4
+    for _ in range(2):
+        with pytest.raises(ErrorProveedor):
+            proveedor.info("SAN.MC")
+    with pytest.raises(ProveedorNoDisponible):
+        proveedor.info("SAN.MC")
+    assert proveedor.llamadas["info"] == 6
+
+    # Pasado el enfriamiento, una llamada de prueba que sale bien lo cierra
+    time.sleep(0.15)
+    assert proveedor.info("SAN.MC")["longName"] == "Banco Santander"
+    assert proveedor.interruptor.estado == "cerrado"
+
+
+def test_descarga_vacia_cuenta_como_fallo(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: llamadas.append(kwargs) or pd.DataFrame())
+    proveedor = ProveedorYFinance(conexiones=4, intentos=2, umbral=2, enfriamiento=60, backoff=0.001)
+    tickers = ["SAN.MC", "BBVA.MC", "ITX.MC", "IBE.MC", "REP.MC", "TEF.MC"]
+
+    # yf.download no lanza: la descarga vacía se reintenta y abre el circuito como cualquier fallo
+    for _ in range(2):
+        with pytest.raises(ErrorProveedor):
+            proveedor.descargar(tickers, period="5d")
+    assert len(llamadas) == 4 and proveedor.interruptor.estado == "abierto"
+    with pytest.raises(ProveedorNoDisponible):
+        proveedor.descargar(tickers, period="5d")
+    # Los hilos de yf.download no superan las conexiones reservadas, que se devuelven
+    assert llamadas[0]["threads"] == 4
+    assert proveedor._conexiones._value == 4
+
+    # Una descarga con columnas pero sin ningún valor de los tickers pedidos también es un fallo
+    columnas = pd.MultiIndex.from_product([["SAN.MC"], ["Close"]])
+    sin_valores = pd.DataFrame(float("nan"), index=pd.bdate_range("2025-06-02", periods=3), columns=columnas)
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: sin_valores)
+    with pytest.raises(ErrorProveedor):
+        ProveedorYFinance(intentos=1).descargar(["SAN.MC"], period="5d")
+
+
+def test_proveedor_es_abstracto():
+    with pytest.raises(TypeError):
+        Proveedor()
+
+
+def test_fixture_grabado_y_sintetico_sin_red(monkeypatch, tmp_path):
+    origen = ProveedorFixture(semilla=1)
+    ProveedorFixture.grabar(str(tmp_path), ["SAN.MC"], proveedor=origen, start="2024-01-01")
+
+    proveedor = ProveedorFixture(str(tmp_path))
+    grabado = proveedor.descargar(["SAN.MC"], start="2024-01-01")["SAN.MC"]
+    pd.testing.assert_frame_equal(grabado, origen.serie("SAN.MC").loc["2024-01-01":],
+                                  check_freq=False, check_index_type=False)
+    assert proveedor.info("SAN.MC") == origen.info("SAN.MC")
+    # Los tickers sin grabación son sintéticos y deterministas
+    assert proveedor.descargar(["BBVA.MC"], period="5d").equals(ProveedorFixture().descargar(["BBVA.MC"], period="5d"))
+
+    # La aplicación entera funciona sobre el proveedor de fixtures
+    monkeypatch.setattr("provider_utils._proveedor", proveedor)
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=0)
+    store.actualizar(["SAN.MC", "BBVA.MC"])
+    assert store.leer("SAN.MC", start="2024-01-01")["Precio"].iloc[0] == grabado["Adj Close"].iloc[0]
+    data_utils._precios_cache.clear()
+    precios = data_utils.precios_actuales(["SAN.MC", "BBVA.MC"])
+    assert precios["SAN.MC"] == pytest.approx(origen.serie("SAN.MC")["Adj Close"].iloc[-1])
+    assert proveedor.llamadas["descargar"] == 4
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+import rate_utils
+from rate_utils import TokenBucket, espera_backoff, reintentar
+
+
+def test_token_bucket_rafaga_y_ritmo():
+    limite = TokenBucket(tasa=20, capacidad=2)
+    inicio = time.monotonic()
+    for _ in range(4):
+        assert limite.adquirir()
+    # 2 de ráfaga y otros 2 a 20/s: ~0.1 s
+    assert 0.08 <= time.monotonic() - inicio < 1
+    assert not TokenBucket(tasa=0.01, capacidad=1).adquirir(2, timeout=0.05)
+
+
+def test_reintentar_transitorias_con_backoff(monkeypatch):
+    esperas = []
+    monkeypatch.setattr(rate_utils.time, "sleep", esperas.append)
+    llamadas = []
+
+    def inestable():
+        llamadas.append(1)
+        if len(llamadas) < 3:
+            raise ConnectionError("caída")
+        return "ok"
+
+    assert reintentar(inestable, intentos=3, transitorias=(ConnectionError,), jitter=False) == "ok"
+    assert esperas == [1.0, 2.0]
+    with pytest.raises(ValueError):
+        reintentar(lambda: (_ for _ in ()).throw(ValueError("definitivo")), transitorias=(ConnectionError,))
+    assert espera_backoff(10, base=1, maximo=30, jitter=False) == 30
+    assert 0 <= espera_backoff(3, base=1) <= 8
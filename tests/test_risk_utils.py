@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_utils import calcular_riesgo, obtener_riesgo, tabla_riesgo
+
+
+def test_metricas_frente_a_calculo_por_serie():
+    rng = np.random.default_rng(1)
+    fechas = pd.bdate_range("2024-01-01", periods=260)
+    r_m = rng.normal(0.0005, 0.01, len(fechas))
+    indice = pd.Series(1000 * np.cumprod(1 + r_m), index=fechas)
+    panel = pd.DataFrame({
+        "A.MC": 10 * np.cumprod(1 + 2 * r_m),                               # beta exacta 2
+        "B.MC": 20 * np.cumprod(1 + rng.normal(0, 0.02, len(fechas))),
+    }, index=fechas)
+    panel.iloc[50:60, 1] = np.nan  # hueco en B
+
+    riesgo = calcular_riesgo(panel, indice)
+    m = riesgo["metricas"]
+    assert m.loc["A.MC", "Beta"] == pytest.approx(2.0)
+
+    for ticker in panel:
+        rend = panel[ticker].ffill().pct_change(fill_method=None).dropna()
+        assert m.loc[ticker, "Volatilidad"] == pytest.approx(rend.std() * np.sqrt(252))
+        assert m.loc[ticker, "VaR_hist"] == pytest.approx(-rend.quantile(0.05))
+        cola = rend[rend <= rend.quantile(0.05)]
+        assert m.loc[ticker, "CVaR_hist"] == pytest.approx(-cola.mean())
+        precios = panel[ticker].dropna()
+        assert m.loc[ticker, "MaxDD"] == pytest.approx((precios / precios.cummax() - 1).min())
+    assert m["CVaR_param"].gt(m["VaR_param"]).all()
+
+    tabla = tabla_riesgo(riesgo)
+    assert tabla.splitlines()[1].startswith("A|") and "correlación media" in tabla
+
+
+def test_obtener_riesgo_cacheado_por_version(monkeypatch):
+    from store_utils import obtener_store
+
+    monkeypatch.setattr("provider_utils.yf.download", lambda *args, **kwargs: pd.DataFrame())
+    fechas = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=200)
+    store = obtener_store()
+    rng = np.random.default_rng(2)
+    for ticker in ("RK1.MC", "RK2.MC", "^IBEX"):
+        store.guardar(ticker, pd.DataFrame({"Close": 10 * np.cumprod(1 + rng.normal(0, 0.01, 200))}, index=fechas))
+
+    r1 = obtener_riesgo(["RK1.MC", "RK2.MC"])
+    assert obtener_riesgo(["RK1.MC", "RK2.MC"]) is r1
+    assert list(r1["metricas"].index) == ["RK1.MC", "RK2.MC"]
+
+    # Una sesión nueva cambia la versión y se recalcula
+    siguiente = fechas[-1] + pd.offsets.BDay()
+    store.guardar("RK1.MC", pd.DataFrame({"Close": [11.0]}, index=[siguiente]))
+    assert obtener_riesgo(["RK1.MC", "RK2.MC"]) is not r1
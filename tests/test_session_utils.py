@@ -0,0 +1,56 @@
+import pytest
+from flask import Flask, session
+
+import session_utils
+from session_utils import InterfazSesionServidor, SesionesFichero, SesionesSQLite, compactar_sesion
+
+
+@pytest.fixture(params=["sqlite", "fichero"])
+def app(request, tmp_path):
+    backend = (SesionesSQLite(str(tmp_path / "s.sqlite")) if request.param == "sqlite"
+               else SesionesFichero(str(tmp_path / "sesiones")))
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.session_interface = InterfazSesionServidor(backend)
+
+    @app.route("/guardar")
+    def guardar():
+        session["asistente_history"] = [{"user": "hola", "assistant": "<p>" + "x" * 10000 + "</p>"}]
+        return "ok"
+
+    @app.route("/leer")
+    def leer():
+        return str(len(session.get("asistente_history", [{}])[0].get("assistant", "")))
+
+    return app
+
+
+def test_cookie_solo_lleva_el_id(app):
+    client = app.test_client()
+    resp = client.get("/guardar")
+    cookie = resp.headers["Set-Cookie"]
+    # 10 KB de historial en el servidor; la cookie sólo lleva el id firmado
+    assert len(cookie) < 200 and "xxxx" not in cookie
+    assert client.get("/leer").text == "10007"
+
+    # Un id manipulado no da acceso a la sesión
+    otro = app.test_client()
+    otro.set_cookie("session", cookie.split(";")[0].split("=", 1)[1][:-3] + "abc")
+    assert otro.get("/leer").text == "0"
+
+
+def test_compactacion_y_limite(monkeypatch):
+    monkeypatch.setattr(session_utils, "HISTORIAL_COMPLETO", 2)
+    historial = [
+        {"user": f"p{i}", "assistant": "<b>respuesta</b> " + "y" * 1000, "modo": "conversacion"}
+        for i in range(10)
+    ]
+    datos = {"asistente_history": historial, "perfil": "Bajo"}
+    compactar_sesion(datos)
+    assert all(m.get("compactado") for m in historial[:-2])
+    assert "<b>" not in historial[0]["assistant"] and len(historial[0]["assistant"]) <= 200
+    assert "<b>" in historial[-1]["assistant"]
+
+    serializado = compactar_sesion(datos, max_bytes=2500)
+    assert len(serializado.encode()) <= 2500
+    assert historial[-1]["user"] == "p9" and datos["perfil"] == "Bajo"
@@ -0,0 +1,160 @@
+import pandas as pd
+
+from store_utils import PriceStore
+
+
+def _fake_download(llamadas, fechas):
+    def fake(*args, **kwargs):
+        llamadas.append(kwargs)
+        tickers = kwargs["tickers"]
+        desde = pd.Timestamp(kwargs["start"])
+        idx = fechas[fechas >= desde]
+        columnas = pd.MultiIndex.from_product([tickers, ["Open", "High", "Low", "Close", "Volume"]])
+        return pd.DataFrame(1.0, index=idx, columns=columnas)
+    return fake
+
+
+def test_actualizar_solo_trae_barras_nuevas(monkeypatch, tmp_path):
+    llamadas = []
+    fechas = pd.date_range("2024-01-01", periods=10, freq="B")
+    monkeypatch.setattr("provider_utils.yf.download", _fake_download(llamadas, fechas))
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=0)
+
+    store.actualizar(["AAA.MC", "BBB.MC"])
+    assert len(llamadas) == 1
+    assert llamadas[0]["start"] == "2000-01-01"
+    assert len(store.leer("AAA.MC")) == 10
+
+    # Segunda actualización: sólo desde la última fecha guardada
+    fechas = fechas.append(pd.DatetimeIndex([pd.Timestamp("2024-01-15")]))
+    monkeypatch.setattr("provider_utils.yf.download", _fake_download(llamadas, fechas))
+    store.actualizar(["AAA.MC", "BBB.MC"])
+    assert len(llamadas) == 2
+    assert llamadas[1]["start"] == "2024-01-12"
+    panel = store.panel(["AAA.MC", "BBB.MC"])
+    assert list(panel.columns) == ["AAA.MC", "BBB.MC"]
+    assert len(panel) == 11
+
+
+def test_actualizar_respeta_ttl(monkeypatch, tmp_path):
+    llamadas = []
+    fechas = pd.date_range("2024-01-01", periods=5, freq="B")
+    monkeypatch.setattr("provider_utils.yf.download", _fake_download(llamadas, fechas))
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=3600)
+
+    store.actualizar(["AAA.MC"])
+    store.actualizar(["AAA.MC"])
+    assert len(llamadas) == 1
+
+
+def test_actualizar_no_marca_tickers_sin_barras(monkeypatch, tmp_path):
+    llamadas = []
+    fechas = pd.date_range("2024-01-01", periods=5, freq="B")
+
+    def solo_aaa(*args, **kwargs):
+        llamadas.append(kwargs["tickers"])
+        columnas = pd.MultiIndex.from_product([["AAA.MC"], ["Close"]])
+        return pd.DataFrame(1.0, index=fechas, columns=columnas)
+
+    monkeypatch.setattr("provider_utils.yf.download", solo_aaa)
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=3600)
+    store.actualizar(["AAA.MC", "BBB.MC"])
+    # BBB no recibió barras: se vuelve a pedir (sólo él) en la siguiente lectura
+    store.actualizar(["AAA.MC", "BBB.MC"])
+    assert llamadas == [["AAA.MC", "BBB.MC"], ["BBB.MC"]]
+
+
+def test_actualizar_rehace_historico_si_cambia_el_ajuste(monkeypatch, tmp_path):
+    llamadas = []
+    fechas = pd.date_range("2024-01-01", periods=10, freq="B")
+    precios = pd.Series(10.0, index=fechas)
+
+    def fake(*args, **kwargs):
+        llamadas.append(kwargs["start"])
+        idx = fechas[fechas >= pd.Timestamp(kwargs["start"])]
+        columnas = pd.MultiIndex.from_product([["AAA.MC"], ["Close"]])
+        return pd.DataFrame(precios.loc[idx].to_numpy()[:, None], index=idx, columns=columnas)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake)
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=0)
+    store.actualizar(["AAA.MC"])
+
+    # Dividendo: Yahoo reajusta todo el histórico y la barra solapada ya no coincide
+    fechas = fechas.append(pd.DatetimeIndex([pd.Timestamp("2024-01-15")]))
+    precios = pd.Series(9.5, index=fechas)
+    store.actualizar(["AAA.MC"])
+    assert llamadas == ["2000-01-01", "2024-01-12", "2000-01-01"]
+    leido = store.leer("AAA.MC")
+    assert len(leido) == 11 and (leido["Precio"] == 9.5).all()
+
+
+def test_barra_de_hoy_en_curso_no_cuenta_como_reajuste(monkeypatch, tmp_path):
+    llamadas = []
+    fechas = pd.date_range(end=pd.Timestamp.today().normalize(), periods=10)
+    precios = pd.Series(10.0, index=fechas)
+
+    def fake(*args, **kwargs):
+        llamadas.append(kwargs["start"])
+        idx = fechas[fechas >= pd.Timestamp(kwargs["start"])]
+        columnas = pd.MultiIndex.from_product([["AAA.MC"], ["Close"]])
+        return pd.DataFrame(precios.loc[idx].to_numpy()[:, None], index=idx, columns=columnas)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake)
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=0)
+    store.actualizar(["AAA.MC"])
+
+    # Sólo se mueve la cotización de la última barra (la sesión de hoy, aún abierta)
+    precios.iloc[-1] = 10.4
+    store.actualizar(["AAA.MC"])
+    assert llamadas == ["2000-01-01", fechas[-2].strftime("%Y-%m-%d")]
+    assert store.leer("AAA.MC")["Precio"].iloc[-1] == 10.4
+
+
+def test_descarga_lenta_no_bloquea_otros_tickers(monkeypatch, tmp_path):
+    import threading
+
+    fechas = pd.date_range("2024-01-01", periods=5, freq="B")
+    liberar = threading.Event()
+    base = _fake_download([], fechas)
+
+    def fake(*args, **kwargs):
+        if kwargs["tickers"] == ["LENTO.MC"]:
+            liberar.wait(5)
+        return base(*args, **kwargs)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake)
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=3600)
+    lento = threading.Thread(target=store.actualizar, args=(["LENTO.MC"],))
+    lento.start()
+    try:
+        # Mientras LENTO.MC se descarga, otro ticker se actualiza y se lee sin esperar
+        otro = threading.Thread(target=store.actualizar, args=(["AAA.MC"],))
+        otro.start()
+        otro.join(2)
+        assert not otro.is_alive() and len(store.leer("AAA.MC")) == 5
+    finally:
+        liberar.set()
+        lento.join()
+    assert len(store.leer("LENTO.MC")) == 5
+
+
+def test_version_cambia_al_reajustar_el_historico(monkeypatch, tmp_path):
+    fechas = pd.date_range(end=pd.Timestamp.today().normalize(), periods=10)
+    ajustado = pd.Series(10.0, index=fechas)
+
+    def fake(*args, **kwargs):
+        idx = fechas[fechas >= pd.Timestamp(kwargs["start"])]
+        columnas = pd.MultiIndex.from_product([["AAA.MC"], ["Close", "Adj Close"]])
+        datos = list(zip([10.0] * len(idx), ajustado.loc[idx]))
+        return pd.DataFrame(datos, index=idx, columns=columnas)
+
+    monkeypatch.setattr("provider_utils.yf.download", fake)
+    store = PriceStore(str(tmp_path / "precios.sqlite"), ttl=0)
+    store.actualizar(["AAA.MC"])
+    antes = store.version(["AAA.MC"])
+
+    # Dividendo con fecha ex hoy: se reajustan las barras anteriores, la última queda igual
+    ajustado.iloc[:-1] = 9.5
+    store.actualizar(["AAA.MC"])
+    assert store.leer("AAA.MC")["Precio"].iloc[0] == 9.5
+    assert store.version(["AAA.MC"]) != antes